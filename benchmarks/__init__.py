@@ -0,0 +1 @@
+""" Author: Philipp Steinrötter (steinroe) """
@@ -0,0 +1,289 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
+
+class SendTimes(dict):
+    """Message buffer of the MQTT client which records when each message id was put into it.
+
+    The message id is generated inside MQTTClient.publish, so the send time is taken when the message enters the
+    buffer of the client.
+    """
+
+    def __init__(self, sent: dict, lock=None):
+        """Constructor
+
+        Arguments:
+            sent {dict} -- Receives the send time of each message id as returned by time.perf_counter
+
+        Keyword Arguments:
+            lock {threading.Lock} -- Held while sent is written, if it is shared between threads (default: {None})
+        """
+        super(SendTimes, self).__init__()
+        self.sent = sent
+        self.lock = lock
+
+    def __setitem__(self, message_id, payload):
+        if self.lock is None:
+            self.sent[message_id] = time.perf_counter()
+        else:
+            with self.lock:
+                self.sent[message_id] = time.perf_counter()
+        super(SendTimes, self).__setitem__(message_id, payload)
+
+
+def percentile(values: list, q: float) -> float:
+    """Returns the q-th percentile of the values with linear interpolation
+
+    Arguments:
+        values {list} -- The values
+        q {float} -- Percentile between 0 and 100
+
+    Returns:
+        float -- The percentile or None if there are no values
+    """
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def milliseconds(seconds: float) -> float:
+    """Converts seconds to milliseconds
+
+    Arguments:
+        seconds {float} -- The duration or None
+
+    Returns:
+        float -- The duration in milliseconds or None
+    """
+    return seconds * 1000.0 if seconds is not None else None
+
+
+def time_per_call(func, number: int, repeat: int = 5) -> dict:
+    """Measures the time of a single call of func, taking the best of repeat runs like timeit does
+
+    Arguments:
+        func {callable} -- Called without arguments
+        number {int} -- Number of calls per run
+
+    Keyword Arguments:
+        repeat {int} -- Number of runs (default: {5})
+
+    Returns:
+        dict -- calls and ns_per_call
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return {'calls': number, 'ns_per_call': best / number * 1e9}
+
+
+def run_workers(work, calls: int, concurrency: int, messages_per_call: int = 1, unit: str = 'message') -> dict:
+    """Runs calls of work spread over concurrency threads and measures throughput, latency and CPU time
+
+    Arguments:
+        work {callable} -- Called with the worker index and the call index
+        calls {int} -- Total number of calls
+        concurrency {int} -- Number of threads
+
+    Keyword Arguments:
+        messages_per_call {int} -- Number of messages sent by one call (default: {1})
+        unit {str} -- What one message is called in the keys of the result, e.g. operation (default: {'message'})
+
+    Returns:
+        dict -- messages, seconds, messages_per_second, p50_ms, p99_ms, cpu_us_per_message and errors, with message replaced by unit
+    """
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def worker(index):
+        for call in range(index, calls, concurrency):
+            start = time.perf_counter()
+            try:
+                work(index, call)
+            except Exception:
+                errors[index] += 1
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu, seconds = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    all_latencies = [latency for worker_latencies in latencies for latency in worker_latencies]
+    messages = calls * messages_per_call
+    return {
+        unit + 's': messages,
+        'seconds': seconds,
+        unit + 's_per_second': messages / seconds if seconds > 0 else None,
+        'p50_ms': milliseconds(percentile(all_latencies, 50)),
+        'p99_ms': milliseconds(percentile(all_latencies, 99)),
+        'cpu_us_per_' + unit: cpu / messages * 1e6 if messages > 0 else None,
+        'errors': sum(errors),
+    }
+
+
+def measure_allocations(work, calls: int, messages_per_call: int = 1) -> dict:
+    """Measures the memory allocated by single-threaded calls of work with tracemalloc
+
+    Tracing slows the calls down considerably, so this runs separately from the throughput measurement.
+
+    Arguments:
+        work {callable} -- Called with the worker index 0 and the call index
+        calls {int} -- Number of calls
+
+    Keyword Arguments:
+        messages_per_call {int} -- Number of messages sent by one call (default: {1})
+
+    Returns:
+        dict -- alloc_peak_bytes_per_message, i.e. the mean peak of memory allocated during a call per message
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for call in range(calls):
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            work(0, call)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return {'alloc_peak_bytes_per_message': sum(peaks) / len(peaks) / messages_per_call if len(peaks) > 0 else None}
+
+
+class ServerProcess(object):
+    """Runs a local stand-in server in a child process, so that its CPU time does not count for the benchmark"""
+
+    def __init__(self, factory, attributes: tuple, **kwargs):
+        """Instantiate ServerProcess object
+
+        Arguments:
+            factory {callable} -- Creates the server in the child process, e.g. MockGateway
+            attributes {tuple} -- Names of the server attributes to hand back, e.g. its instances
+
+        Keyword Arguments:
+            kwargs -- Arguments for the factory
+        """
+        self.factory = factory
+        self.attributes = attributes
+        self.kwargs = kwargs
+        self.values = None
+        self._connection = None
+        self._process = None
+
+    def __enter__(self):
+        context = multiprocessing.get_context('spawn')
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child_connection, self.factory, self.attributes,
+                                                              self.kwargs), daemon=True)
+        self._process.start()
+        self.values = self._connection.recv()
+        return self
+
+    def __getitem__(self, attribute: str):
+        return self.values[attribute]
+
+    def call(self, method: str, *args):
+        """Calls a method of the server in the child process and returns its result
+
+        Arguments:
+            method {str} -- Name of the method
+            args -- Arguments of the method
+
+        Returns:
+            object -- The result
+        """
+        self._connection.send((method, args))
+        result, error = self._connection.recv()
+        if error is not None:
+            raise RuntimeError(error)
+        return result
+
+    def __exit__(self, *args):
+        self._connection.send(None)
+        self._process.join(10)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def _serve(connection, factory, attributes, kwargs):
+    server = factory(**kwargs).start()
+    try:
+        connection.send({attribute: getattr(server, attribute) for attribute in attributes})
+        while True:
+            request = connection.recv()
+            if request is None:
+                return
+            method, args = request
+            try:
+                connection.send((getattr(server, method)(*args), None))
+            except Exception as err:
+                connection.send((None, repr(err)))
+    finally:
+        server.stop()
+
+
+def get_environment() -> dict:
+    """Returns information on the environment the benchmark runs in
+
+    Returns:
+        dict -- Python version, platform, CPU count, SDK commit and time of the run
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'time': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def write_results(path: str, suite: str, results: list):
+    """Writes the results of a benchmark suite as JSON, to stdout if no path is given
+
+    Arguments:
+        path {str} -- Path of the output file or None
+        suite {str} -- Name of the suite
+        results {list} -- One dict per benchmark case
+    """
+    document = {'suite': suite, 'environment': get_environment(), 'results': results}
+    if path is None:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    with open(path, 'w', encoding='utf-8') as output_file:
+        json.dump(document, output_file, indent=2)
+
+
+def int_list(value: str) -> tuple:
+    """Parses a comma separated list of integers given on the command line, e.g. 1,4,16
+
+    Arguments:
+        value {str} -- The list
+
+    Returns:
+        tuple -- The integers
+    """
+    return tuple(int(item) for item in value.split(','))
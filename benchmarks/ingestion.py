@@ -0,0 +1,180 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import argparse
+import json
+import threading
+import time
+
+from iot_services_sdk import RestClient, MQTTClient
+from iot_services_sdk.mock_gateway import MockGateway
+
+from .common import run_workers, measure_allocations, percentile, milliseconds, int_list, ServerProcess, write_results, \
+    SendTimes
+
+SUITE = 'ingestion'
+
+
+def make_measures(width: int, seed: int = 0) -> list:
+    """Returns a measure with width properties
+
+    Arguments:
+        width {int} -- Number of properties
+
+    Keyword Arguments:
+        seed {int} -- Varies the values (default: {0})
+
+    Returns:
+        list -- List with one measure
+    """
+    return [{'property_' + str(idx): float(seed + idx) for idx in range(width)}]
+
+
+def bench_post_measures(rest_instance: str, width: int, concurrency: int, messages: int, allocations: bool) -> dict:
+    clients = [RestClient(rest_instance, 'device-' + str(idx)) for idx in range(concurrency)]
+    measures = make_measures(width)
+
+    def work(index, call):
+        clients[index].post_measures('capability', 'sensor', measures, use_timestamp=True)
+
+    result = {'benchmark': 'post_measures', 'width': width, 'batch_size': 1, 'concurrency': concurrency}
+    result.update(run_workers(work, messages, concurrency))
+    if allocations:
+        result.update(measure_allocations(work, min(messages, 200)))
+    return result
+
+
+def bench_post_batched_measures(rest_instance: str, width: int, batch_size: int, concurrency: int, messages: int,
+                                allocations: bool) -> dict:
+    clients = [RestClient(rest_instance, 'device-' + str(idx)) for idx in range(concurrency)]
+    batch = [{'capabilityAlternateId': 'capability', 'sensorAlternateId': 'sensor',
+              'measures': make_measures(width, seed)} for seed in range(batch_size)]
+
+    def work(index, call):
+        clients[index].post_batched_measures(batch)
+
+    calls = max(1, messages // batch_size)
+    result = {'benchmark': 'post_batched_measures', 'width': width, 'batch_size': batch_size,
+              'concurrency': concurrency}
+    result.update(run_workers(work, calls, concurrency, messages_per_call=batch_size))
+    if allocations:
+        result.update(measure_allocations(work, min(calls, 100), messages_per_call=batch_size))
+    return result
+
+
+def bench_mqtt_publish(mqtt_instance: str, width: int, concurrency: int, messages: int, allocations: bool,
+                       timeout: float = 60.0) -> dict:
+    measures = make_measures(width)
+    sent = {}
+    ack_latencies = []
+    lock = threading.Lock()
+    clients = []
+
+    for idx in range(concurrency):
+        client = MQTTClient(mqtt_instance, 'device-' + str(idx))
+        client.on_error = lambda client, userdata, report: None
+        client.connect()
+        _track_acks(client, sent, ack_latencies, lock)
+        client.loop_start()
+        clients.append(client)
+
+    def work(index, call):
+        clients[index].publish('capability', 'sensor', measures)
+
+    result = {'benchmark': 'mqtt_publish', 'width': width, 'batch_size': 1, 'concurrency': concurrency}
+    try:
+        result.update(run_workers(work, messages, concurrency))
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and len(ack_latencies) < messages:
+            time.sleep(0.01)
+        with lock:
+            result['acked'] = len(ack_latencies)
+            result['ack_p50_ms'] = milliseconds(percentile(ack_latencies, 50))
+            result['ack_p99_ms'] = milliseconds(percentile(ack_latencies, 99))
+        if allocations:
+            result.update(measure_allocations(work, min(messages, 200)))
+    finally:
+        for client in clients:
+            client.disconnect()
+            client.loop_stop()
+    return result
+
+
+def _track_acks(client, sent: dict, ack_latencies: list, lock):
+    client._message_buffer = SendTimes(sent, lock)
+    handler = client._ack_message_handler
+
+    def track(paho_client, userdata, message):
+        received = time.perf_counter()
+        with lock:
+            for ack in json.loads(message.payload.decode('utf-8')):
+                start = sent.pop(ack.get('id'), None)
+                if start is not None:
+                    ack_latencies.append(received - start)
+        handler(paho_client, userdata, message)
+
+    client.message_callback_add('ack/' + client.device_alternate_id, track)
+
+
+def run(messages: int = 2000, widths=(1, 10, 50), batch_sizes=(1, 10, 100), concurrencies=(1, 4, 16),
+        benchmarks=('post_measures', 'post_batched_measures', 'mqtt_publish'), latency: float = 0.0,
+        ack_delay: float = 0.0, allocations: bool = True) -> list:
+    """Runs the ingestion benchmarks against a mock gateway in a child process
+
+    Keyword Arguments:
+        messages {int} -- Number of messages per case (default: {2000})
+        widths {tuple} -- Numbers of properties per measure (default: {(1, 10, 50)})
+        batch_sizes {tuple} -- Numbers of messages per batched post (default: {(1, 10, 100)})
+        concurrencies {tuple} -- Numbers of concurrent clients (default: {(1, 4, 16)})
+        benchmarks {tuple} -- Benchmarks to run (default: {all})
+        latency {float} -- Seconds the mock gateway delays every REST post (default: {0.0})
+        ack_delay {float} -- Seconds after which the mock gateway acknowledges MQTT messages (default: {0.0})
+        allocations {bool} -- If set to true, allocations are measured in a separate pass (default: {True})
+
+    Returns:
+        list -- One result per case
+    """
+    results = []
+    with ServerProcess(MockGateway, ('rest_instance', 'mqtt_instance'), latency=latency,
+                       ack_delay=ack_delay) as gateway:
+        for concurrency in concurrencies:
+            for width in widths:
+                if 'post_measures' in benchmarks:
+                    results.append(bench_post_measures(gateway['rest_instance'], width, concurrency, messages,
+                                                       allocations))
+                if 'post_batched_measures' in benchmarks:
+                    for batch_size in batch_sizes:
+                        results.append(bench_post_batched_measures(gateway['rest_instance'], width, batch_size,
+                                                                   concurrency, messages, allocations))
+                if 'mqtt_publish' in benchmarks:
+                    results.append(bench_mqtt_publish(gateway['mqtt_instance'], width, concurrency, messages,
+                                                      allocations))
+    for result in results:
+        result.update({'latency': latency, 'ack_delay': ack_delay})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingestion throughput benchmarks against a local mock gateway')
+    parser.add_argument('--output', help='Path of the JSON result file, stdout if omitted')
+    parser.add_argument('--messages', type=int, default=2000, help='Messages per case')
+    parser.add_argument('--widths', type=int_list, default=(1, 10, 50), help='Properties per measure, e.g. 1,10,50')
+    parser.add_argument('--batch-sizes', type=int_list, default=(1, 10, 100), help='Messages per batched post')
+    parser.add_argument('--concurrency', type=int_list, default=(1, 4, 16), help='Concurrent clients')
+    parser.add_argument('--benchmarks', type=lambda value: tuple(value.split(',')),
+                        default=('post_measures', 'post_batched_measures', 'mqtt_publish'))
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the gateway delays REST posts')
+    parser.add_argument('--ack-delay', type=float, default=0.0, help='Seconds until MQTT messages are acknowledged')
+    parser.add_argument('--no-allocations', action='store_true', help='Skip the allocation measurement')
+    parser.add_argument('--quick', action='store_true', help='Small sweep for smoke testing')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.messages, args.widths, args.batch_sizes, args.concurrency = 200, (1, 10), (1, 10), (1, 4)
+    results = run(messages=args.messages, widths=args.widths, batch_sizes=args.batch_sizes,
+                  concurrencies=args.concurrency, benchmarks=args.benchmarks, latency=args.latency,
+                  ack_delay=args.ack_delay, allocations=not args.no_allocations)
+    write_results(args.output, SUITE, results)
+
+
+if __name__ == '__main__':
+    main()
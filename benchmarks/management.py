@@ -0,0 +1,286 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from iot_services_sdk import DeviceService, Transport
+from iot_services_sdk.mock_server import MockIoTServer
+from iot_services_sdk.utils import build_query, get_base_url
+
+from .common import run_workers, time_per_call, int_list, ServerProcess, write_results
+
+SUITE = 'management'
+USER = 'benchmark'
+PASSWORD = 'benchmark'
+
+
+def create_service(instance: str, tenant_id: str, **transport_kwargs) -> DeviceService:
+    """Returns a device service with a transport of its own, so that cases share neither connections nor caches
+
+    Arguments:
+        instance {str} -- Instance of the mock server
+        tenant_id {str} -- Id of the tenant
+
+    Keyword Arguments:
+        transport_kwargs -- Arguments for the Transport, e.g. pool_maxsize
+
+    Returns:
+        DeviceService -- The service
+    """
+    service = DeviceService(instance, USER, PASSWORD, tenant_id)
+    service.transport = Transport(USER, PASSWORD, **transport_kwargs)
+    return service
+
+
+def bench_build_query(iterations: int) -> list:
+    cases = [
+        ('empty', {}),
+        ('filters', {'filters': ["alternateId eq 'a8f5f167f44f4964e6c998dee827110c'", "name eq 'device'"]}),
+        ('full', {'filters': ["gatewayId eq '2'", "status eq 'online'"], 'orderby': 'name', 'asc': False,
+                  'skip': '1000', 'top': '100'}),
+    ]
+    return [dict({'benchmark': 'build_query', 'case': case}, **time_per_call(lambda: build_query(**kwargs), iterations))
+            for case, kwargs in cases]
+
+
+def bench_request_construction(instance: str, tenant_id: str, iterations: int) -> dict:
+    service = create_service(instance, tenant_id)
+
+    def construct():
+        # Mirrors what request_core and the session do before a byte is sent
+        url = get_base_url(service.instance) + service._api_path + service._service_base_path + service.service
+        url = url + build_query(filters=["alternateId eq 'a8f5f167f44f4964e6c998dee827110c'"], top='100')
+        service.transport.session.prepare_request(requests.Request('GET', url, auth=(USER, PASSWORD)))
+
+    return dict({'benchmark': 'request_construction', 'case': 'get_devices'}, **time_per_call(construct, iterations))
+
+
+def bench_round_trip(instance: str, tenant_id: str, device_id: str, case: str, calls: int) -> dict:
+    """Measures sequential request_core round trips of get_device
+
+    Cases:
+        pooled -- The connection is kept alive and reused
+        new_connection -- Every request opens a new connection
+        ungoverned -- Like pooled, with rate and concurrency limiting switched off
+        revalidate -- Like pooled, sent as conditional request, so that the server answers 304 Not Modified
+    """
+    service = create_service(instance, tenant_id)
+    if case == 'ungoverned':
+        service.transport.governor = None
+
+    def work(index, call):
+        if case == 'new_connection':
+            service.transport.session.close()
+        if case == 'revalidate':
+            response = service.request_core(method='GET', service='/devices/' + device_id, accept_json=True,
+                                            revalidate=True)
+        else:
+            response = service.get_device(device_id)
+        response.get_result()
+
+    result = {'benchmark': 'round_trip', 'case': case, 'concurrency': 1}
+    result.update(run_workers(work, calls, 1, unit='request'))
+    return result
+
+
+def bench_list_devices(instance: str, tenant_id: str, tenant_size: int, case: str, page_size: int,
+                       concurrency: int, repeat: int) -> dict:
+    """Measures listing all devices of the tenant
+
+    Cases:
+        single -- One request for the whole list
+        paged -- Sequential requests for pages of page_size devices
+        parallel_pages -- Pages of page_size devices requested concurrently, after a count request
+        stream -- One streamed request, iterated element by element
+    """
+    service = create_service(instance, tenant_id)
+
+    def get_page(skip):
+        return service.get_devices(skip=str(skip), top=str(page_size)).get_result()
+
+    def work(index, call):
+        if case == 'single':
+            devices = service.get_devices().get_result()
+        elif case == 'stream':
+            devices = list(service.get_devices(stream=True).iter_result())
+        elif case == 'paged':
+            devices = []
+            while True:
+                page = get_page(len(devices))
+                devices.extend(page)
+                if len(page) < page_size:
+                    break
+        else:
+            count = service.get_device_count().get_result()['count']
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                devices = [device for page in executor.map(get_page, range(0, count, page_size)) for device in page]
+        if len(devices) != tenant_size:
+            raise AssertionError('Listed ' + str(len(devices)) + ' of ' + str(tenant_size) + ' devices')
+
+    result = {'benchmark': 'list_devices', 'case': case, 'tenant_size': tenant_size,
+              'page_size': page_size if case in ('paged', 'parallel_pages') else None,
+              'concurrency': concurrency if case == 'parallel_pages' else 1}
+    result.update(run_workers(work, repeat, 1, messages_per_call=tenant_size, unit='device'))
+    return result
+
+
+def bench_resolve_alternate_ids(instance: str, tenant_id: str, alternate_ids: dict, case: str,
+                                concurrency: int) -> dict:
+    """Measures resolving alternate ids of devices to their ids
+
+    Cases:
+        filter -- One filtered list request per alternate id
+        revalidate -- Like filter, sent as conditional request after a first pass that filled the cache
+        index -- The whole device list is fetched once into a lookup table on first use
+    """
+    service = create_service(instance, tenant_id)
+    keys = list(alternate_ids)
+    table = _AlternateIdIndex(service)
+
+    def resolve(alternate_id):
+        if case == 'index':
+            return table.get(alternate_id)
+        query = build_query(filters=["alternateId eq '" + alternate_id + "'"])
+        response = service.request_core(method='GET', service=service.service, accept_json=True, query=query,
+                                        revalidate=case == 'revalidate')
+        return response.get_result()[0]['id']
+
+    def work(index, call):
+        alternate_id = keys[call % len(keys)]
+        if resolve(alternate_id) != alternate_ids[alternate_id]:
+            raise AssertionError('Resolved ' + alternate_id + ' to the wrong device')
+
+    if case == 'revalidate':
+        run_workers(work, len(keys), concurrency)
+    result = {'benchmark': 'resolve_alternate_ids', 'case': case, 'concurrency': concurrency}
+    result.update(run_workers(work, len(keys), concurrency, unit='lookup'))
+    return result
+
+
+class _AlternateIdIndex(object):
+    """Lookup table from alternate id to id of all devices, loaded with a single listing on first use"""
+
+    def __init__(self, service):
+        self.service = service
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def get(self, alternate_id: str) -> str:
+        with self._lock:
+            if self._ids is None:
+                self._ids = {device['alternateId']: device['id'] for device in self.service.get_devices().iter_result()}
+        return self._ids.get(alternate_id)
+
+
+def bench_provisioning(instance: str, tenant_id: str, gateway_id: str, devices: int, concurrency: int,
+                       pool_maxsize: int, run_id: int) -> dict:
+    service = create_service(instance, tenant_id, pool_maxsize=pool_maxsize)
+
+    def work(index, call):
+        service.create_device(gateway_id, 'benchmark-' + str(run_id) + '-' + str(call)).get_result()
+
+    result = {'benchmark': 'provisioning', 'case': 'create_device', 'concurrency': concurrency,
+              'pool_maxsize': pool_maxsize}
+    result.update(run_workers(work, devices, concurrency, unit='device'))
+    return result
+
+
+def run(iterations: int = 20000, calls: int = 500, tenant_size: int = 2000, page_size: int = 100,
+        lookups: int = 200, provisioned: int = 500, concurrencies=(1, 4, 16), pool_sizes=(1, 32),
+        benchmarks=('build_query', 'request_construction', 'round_trip', 'list_devices', 'resolve_alternate_ids',
+                    'provisioning'), latency: float = 0.002, repeat: int = 3) -> list:
+    """Runs the Device Management benchmarks against a mock server in a child process
+
+    Keyword Arguments:
+        iterations {int} -- Calls per run of the micro benchmarks (default: {20000})
+        calls {int} -- Sequential round trips per case (default: {500})
+        tenant_size {int} -- Number of devices the tenant is filled with before listing (default: {2000})
+        page_size {int} -- Devices per page of the paged listings (default: {100})
+        lookups {int} -- Number of alternate ids resolved per case (default: {200})
+        provisioned {int} -- Number of devices created per provisioning case (default: {500})
+        concurrencies {tuple} -- Numbers of concurrent threads (default: {(1, 4, 16)})
+        pool_sizes {tuple} -- Connection pool sizes for provisioning (default: {(1, 32)})
+        benchmarks {tuple} -- Benchmarks to run (default: {all})
+        latency {float} -- Seconds the mock server delays every request (default: {0.002})
+        repeat {int} -- Repetitions of every listing case (default: {3})
+
+    Returns:
+        list -- One result per case
+    """
+    results = []
+    if 'build_query' in benchmarks:
+        results.extend(bench_build_query(iterations))
+
+    with ServerProcess(MockIoTServer, ('instance', 'tenant_id'), user=USER, password=PASSWORD,
+                       latency=latency) as server:
+        instance, tenant_id = server['instance'], server['tenant_id']
+        gateway_id = server.call('get_collection', 'gateways')[0]['id']
+        alternate_ids = {}
+        for idx in range(tenant_size):
+            device = server.call('create', 'devices', {'gatewayId': gateway_id, 'name': 'device-' + str(idx)})
+            alternate_ids[device['alternateId']] = device['id']
+        device_id = next(iter(alternate_ids.values()))
+        selected = dict(list(alternate_ids.items())[:lookups])
+
+        if 'request_construction' in benchmarks:
+            results.append(bench_request_construction(instance, tenant_id, iterations))
+        if 'round_trip' in benchmarks:
+            for case in ('pooled', 'new_connection', 'ungoverned', 'revalidate'):
+                results.append(bench_round_trip(instance, tenant_id, device_id, case, calls))
+        if 'list_devices' in benchmarks:
+            for case in ('single', 'stream', 'paged'):
+                results.append(bench_list_devices(instance, tenant_id, tenant_size, case, page_size, 1, repeat))
+            for concurrency in concurrencies:
+                results.append(bench_list_devices(instance, tenant_id, tenant_size, 'parallel_pages', page_size,
+                                                  concurrency, repeat))
+        if 'resolve_alternate_ids' in benchmarks:
+            for concurrency in concurrencies:
+                for case in ('filter', 'revalidate', 'index'):
+                    results.append(bench_resolve_alternate_ids(instance, tenant_id, selected, case, concurrency))
+        # Provisioning grows the tenant, so it runs last
+        if 'provisioning' in benchmarks:
+            run_id = 0
+            for pool_maxsize in pool_sizes:
+                for concurrency in concurrencies:
+                    results.append(bench_provisioning(instance, tenant_id, gateway_id, provisioned, concurrency,
+                                                      pool_maxsize, run_id))
+                    run_id += 1
+    for result in results:
+        result['latency'] = latency
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Device Management API benchmarks against a local mock server')
+    parser.add_argument('--output', help='Path of the JSON result file, stdout if omitted')
+    parser.add_argument('--iterations', type=int, default=20000, help='Calls per run of the micro benchmarks')
+    parser.add_argument('--calls', type=int, default=500, help='Sequential round trips per case')
+    parser.add_argument('--tenant-size', type=int, default=2000, help='Devices in the tenant')
+    parser.add_argument('--page-size', type=int, default=100, help='Devices per page of paged listings')
+    parser.add_argument('--lookups', type=int, default=200, help='Alternate ids resolved per case')
+    parser.add_argument('--provisioned', type=int, default=500, help='Devices created per provisioning case')
+    parser.add_argument('--concurrency', type=int_list, default=(1, 4, 16), help='Concurrent threads, e.g. 1,4,16')
+    parser.add_argument('--pool-sizes', type=int_list, default=(1, 32), help='Connection pool sizes')
+    parser.add_argument('--benchmarks', type=lambda value: tuple(value.split(',')),
+                        default=('build_query', 'request_construction', 'round_trip', 'list_devices',
+                                 'resolve_alternate_ids', 'provisioning'))
+    parser.add_argument('--latency', type=float, default=0.002, help='Seconds the server delays every request')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions of every listing case')
+    parser.add_argument('--quick', action='store_true', help='Small sweep for smoke testing')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.iterations, args.calls, args.tenant_size, args.lookups, args.provisioned = 2000, 50, 200, 50, 50
+        args.concurrency, args.repeat = (1, 4), 1
+    results = run(iterations=args.iterations, calls=args.calls, tenant_size=args.tenant_size,
+                  page_size=args.page_size, lookups=args.lookups, provisioned=args.provisioned,
+                  concurrencies=args.concurrency, pool_sizes=args.pool_sizes, benchmarks=args.benchmarks,
+                  latency=args.latency, repeat=args.repeat)
+    write_results(args.output, SUITE, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,20 @@ from .session import SessionService
 
 from .iot_service import IoTService, DeviceManagementAPIException
 from .tenant_iot_service import TenantIoTService
+from .transport import Transport, RetryPolicy, RetryBudget
+from .instrumentation import Instrumentation, RequestEvent, LoggingSink, CounterSink
+from .profiling import StageProfiler
+from .rate_limit import Governor, AdaptiveTokenBucket, AIMDConcurrencyLimiter
+from .ssl_context import SSLContextCache, ResumingSSLContext
+from .certificate_store import CertificateStore
+from .certificate_rotation import CertificateRotation
 from .rest_client import RestClient, RESTGatewayException
 from .mqtt_client import MQTTClient
+from .measure_export import MeasureExporter
+from .measure_sync import MeasureSync, JsonLinesMeasureStore
+from .measure_columns import MeasureColumns
+from .measure_cache import MeasureCache
+from .measure_aggregate import MeasureAggregator, aggregate_measures
 
+from . import tracing
 from .utils import debug_requests_off, debug_requests_on
\ No newline at end of file
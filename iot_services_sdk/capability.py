@@ -97,7 +97,7 @@ class CapabilityService(TenantIoTService):
             Response -- Response object
         """
         service = self.service + '/' + capability_id
-        return super().request_core(method='GET', service=service, accept_json=True)
+        return super().request_core(method='GET', service=service, accept_json=True, revalidate=True)
 
     def update_capability(self, capability_id: str, alternate_id: str = None, name: str = None, properties: list = None) -> Response:
         """This endpoint is used to update the capability associated to the given id with details specified in the request body.
@@ -0,0 +1,170 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .rate_limit import AdaptiveTokenBucket
+from .utils import current_milli_time
+
+
+class CertificateRotation(object):
+    """Rotates the client certificates of a device fleet in parallel.
+
+    For each device a new certificate is downloaded into the certificate store, the registered RestClient and
+    MQTTClient instances of the device are switched to it and the previous certificate is revoked. Downloads are
+    spread over max_workers threads and limited to rate requests per second. Failures are reported per device and
+    do not stop the rotation of the others.
+    """
+
+    def __init__(self, store, rate: float = 10.0, max_workers: int = 8, revoke: bool = True, on_progress=None):
+        """Instantiate CertificateRotation object
+
+        Arguments:
+            store {CertificateStore} -- Store the new certificates are downloaded into. Its service is used for all requests.
+
+        Keyword Arguments:
+            rate {float} -- Maximum number of devices rotated per second (default: {10.0})
+            max_workers {int} -- Number of devices rotated concurrently (default: {8})
+            revoke {bool} -- If set to true, the previous certificate is revoked after the switch (default: {True})
+            on_progress {callable} -- Called with the number of finished devices, the total number and the result of the device after each device (default: {None})
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError('The rate must be positive')
+
+        self.store = store
+        self.max_workers = max_workers
+        self.revoke = revoke
+        self.on_progress = on_progress
+
+        self._bucket = AdaptiveTokenBucket(rate=rate, max_rate=rate) if rate is not None else None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register_client(self, device_id: str, client):
+        """Registers a client which is switched to the new certificate when the device is rotated
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            client {RestClient|MQTTClient} -- The client of the device
+        """
+        with self._lock:
+            self._clients.setdefault(device_id, []).append(client)
+
+    def unregister_client(self, device_id: str, client):
+        """Removes a registered client
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            client {RestClient|MQTTClient} -- The client of the device
+        """
+        with self._lock:
+            clients = self._clients.get(device_id, [])
+            if client in clients:
+                clients.remove(client)
+
+    def find_expiring(self, device_ids: list, within: int = None) -> list:
+        """Returns the devices whose latest certificate expires soon, according to the certificate listing of the API
+
+        Arguments:
+            device_ids {list} -- Unique identifiers of the devices
+
+        Keyword Arguments:
+            within {int} -- Milliseconds from now. If None, renew_before of the store is used. (default: {None})
+
+        Returns:
+            list -- Unique identifiers of the devices, in the given order
+        """
+        within = self.store.renew_before if within is None else within
+        deadline = current_milli_time() + within
+
+        def get_latest_expiry(device_id):
+            self._acquire()
+            return self.store.get_latest_expiry(device_id)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            expiries = list(executor.map(tracing.wrap(get_latest_expiry), device_ids))
+        return [device_id for device_id, expiry in zip(device_ids, expiries)
+                if expiry is not None and expiry <= deadline]
+
+    def rotate(self, device_ids: list) -> dict:
+        """Rotates the certificates of the devices
+
+        Arguments:
+            device_ids {list} -- Unique identifiers of the devices
+
+        Returns:
+            dict -- Result per device id with the keys fingerprint (of the new certificate), revoked (list of revoked fingerprints), revoke_error (None or the exception if the previous certificate could not be revoked), clients (number of switched clients) and error (None or the exception)
+        """
+        total = len(device_ids)
+        done = [0]
+        results = {}
+        progress_lock = threading.Lock()
+
+        def rotate_and_report(device_id):
+            result = self.rotate_device(device_id)
+            with progress_lock:
+                results[device_id] = result
+                done[0] += 1
+                if self.on_progress is not None:
+                    self.on_progress(done[0], total, result)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rotate_and_report = tracing.wrap(rotate_and_report)
+            for future in [executor.submit(rotate_and_report, device_id) for device_id in device_ids]:
+                future.result()
+        return {device_id: results[device_id] for device_id in device_ids}
+
+    def rotate_expiring(self, device_ids: list, within: int = None) -> dict:
+        """Rotates the certificates of the devices which expire soon
+
+        Arguments:
+            device_ids {list} -- Unique identifiers of the devices
+
+        Keyword Arguments:
+            within {int} -- Milliseconds from now. If None, renew_before of the store is used. (default: {None})
+
+        Returns:
+            dict -- Result per rotated device id, see rotate
+        """
+        return self.rotate(self.find_expiring(device_ids, within=within))
+
+    def rotate_device(self, device_id: str) -> dict:
+        """Rotates the certificate of a single device
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            dict -- Result of the device, see rotate
+        """
+        result = {'device_id': device_id, 'fingerprint': None, 'revoked': [], 'revoke_error': None, 'clients': 0,
+                  'error': None}
+        try:
+            previous = self.store.get_stored(device_id)
+
+            self._acquire()
+            entry = self.store.refresh(device_id)
+            result['fingerprint'] = entry['fingerprint']
+
+            with self._lock:
+                clients = list(self._clients.get(device_id, []))
+            for client in clients:
+                client.set_certificate(secret=entry['secret'], pem=entry['pem'])
+                result['clients'] += 1
+
+            if self.revoke and previous is not None and previous['fingerprint'] != entry['fingerprint']:
+                self._acquire()
+                try:
+                    self.store.revoke(device_id, previous['fingerprint'])
+                    result['revoked'].append(previous['fingerprint'])
+                except Exception as err:
+                    # The clients use the new certificate already, so only the revocation is reported as failed
+                    result['revoke_error'] = err
+        except Exception as err:
+            result['error'] = err
+        return result
+
+    def _acquire(self):
+        if self._bucket is not None:
+            self._bucket.acquire()
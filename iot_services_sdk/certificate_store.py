@@ -0,0 +1,366 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import hashlib
+import json
+import os
+import re
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from .gateway import GatewayService
+from . import tracing
+from .single_flight import SingleFlight
+from .utils import current_milli_time, to_milli_time
+
+_CERTIFICATE_PATTERN = re.compile(r'-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----', re.DOTALL)
+
+# Name of the expiration date in the certificate listing of the API
+_EXPIRY_FIELD = 'expiry'
+
+# DER tags of the parts of a certificate read by get_certificate_expiry
+_TAG_SEQUENCE = 0x30
+_TAG_VERSION = 0xa0
+_TAG_UTC_TIME = 0x17
+_TAG_GENERALIZED_TIME = 0x18
+
+
+class CertificateStore(object):
+    """Local store of downloaded client certificates, keyed by device id and certificate fingerprint.
+
+    A certificate is only downloaded again if there is none stored for the device yet or if it expires within
+    renew_before. The expiration dates are read from the certificates themselves. Files are written with
+    owner-only permissions, since they contain the secrets of the private keys.
+    """
+
+    def __init__(self, service, directory: str, renew_before: int = 7 * 24 * 3600 * 1000, max_workers: int = 8):
+        """Instantiate CertificateStore object
+
+        Arguments:
+            service {DeviceService|GatewayService} -- Service used to download the certificates. With a GatewayService, the device registration certificates of gateways are stored.
+            directory {str} -- Directory the certificates are stored in
+
+        Keyword Arguments:
+            renew_before {int} -- Milliseconds before the expiration at which a certificate is downloaded again (default: {7 days})
+            max_workers {int} -- Number of certificates downloaded concurrently by fetch_all (default: {8})
+        """
+        self.service = service
+        self.directory = directory
+        self.renew_before = renew_before
+        self.max_workers = max_workers
+
+        if isinstance(service, GatewayService):
+            self._download_pem = service.get_gateway_device_pem
+            self._download_certs = service.get_gateway_device_certs
+            self._revoke_cert = service.revoke_gateway_device_cert
+        else:
+            self._download_pem = service.get_device_pem
+            self._download_certs = service.get_device_certs
+            self._revoke_cert = service.revoke_device_cert
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._downloads = SingleFlight()
+
+    def get(self, device_id: str) -> dict:
+        """Returns the certificate of the device, downloading it if none is stored or if it is about to expire
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            dict -- The certificate with the keys pem, secret, fingerprint and expiry (UNIX time in milliseconds)
+        """
+        entry = self.get_stored(device_id)
+        if entry is not None and not self._expires_soon(entry):
+            return entry
+        return self._downloads.do(device_id, lambda: self._download(device_id))
+
+    def get_pemfile(self, device_id: str):
+        """Returns the path of the PEM file of the device, downloading the certificate if necessary
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            str -- Path of the PEM file
+            str -- Secret of the private key
+        """
+        entry = self.get(device_id)
+        return self._path(device_id, entry['fingerprint'] + '.pem'), entry['secret']
+
+    def fetch_all(self, device_ids: list) -> dict:
+        """Returns the certificates of many devices, downloading the missing and expiring ones in parallel
+
+        Arguments:
+            device_ids {list} -- Unique identifiers of the devices
+
+        Returns:
+            dict -- Certificate per device id, see get
+        """
+        result = {}
+        missing = []
+        for device_id in device_ids:
+            entry = self.get_stored(device_id)
+            if entry is not None and not self._expires_soon(entry):
+                result[device_id] = entry
+            else:
+                missing.append(device_id)
+
+        if len(missing) > 0:
+            get = tracing.wrap(self.get)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {device_id: executor.submit(get, device_id) for device_id in missing}
+                for device_id, future in futures.items():
+                    result[device_id] = future.result()
+        return result
+
+    def get_expiring(self, within: int = None) -> list:
+        """Returns the ids of the devices whose stored certificates expire soon
+
+        Keyword Arguments:
+            within {int} -- Milliseconds from now. If None, renew_before is used. (default: {None})
+
+        Returns:
+            list -- Unique identifiers of the devices
+        """
+        within = self.renew_before if within is None else within
+        deadline = current_milli_time() + within
+        expiring = []
+        for device_id in sorted(os.listdir(self.directory)):
+            entry = self.get_stored(device_id)
+            if entry is not None and entry['expiry'] is not None and entry['expiry'] <= deadline:
+                expiring.append(device_id)
+        return expiring
+
+    def refresh(self, device_id: str) -> dict:
+        """Downloads the certificate of the device regardless of what is stored
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            dict -- The certificate, see get
+        """
+        return self._downloads.do(device_id, lambda: self._download(device_id))
+
+    def remove(self, device_id: str):
+        """Deletes the stored certificates of the device
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+        """
+        with self._lock:
+            self._entries.pop(device_id, None)
+            self._prune(device_id, keep=None)
+
+    def get_latest_expiry(self, device_id: str) -> int:
+        """Returns the latest expiration date of the certificates of the device according to the API
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Raises:
+            ValueError -- Raised if a certificate in the listing has no expiration date
+
+        Returns:
+            int -- UNIX time in milliseconds or None if the device has no certificates
+        """
+        expiries = [_get_expiry(cert) for cert in self._download_certs(device_id).get_result() or []]
+        return max(expiries) if len(expiries) > 0 else None
+
+    def revoke(self, device_id: str, fingerprint: str):
+        """Revokes a certificate of the device and deletes it from the store
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            fingerprint {str} -- Fingerprint of the certificate
+        """
+        fingerprint = _normalize_fingerprint(fingerprint)
+        self._revoke_cert(device_id, fingerprint)
+        with self._lock:
+            for extension in ('.pem', '.json'):
+                try:
+                    os.remove(self._path(device_id, fingerprint + extension))
+                except FileNotFoundError:
+                    pass
+            entry = self._entries.get(device_id)
+            if entry is not None and _normalize_fingerprint(entry['fingerprint']) == fingerprint:
+                # The next get_stored loads another stored certificate, if any, and get downloads a new one
+                del self._entries[device_id]
+
+    def get_stored(self, device_id: str) -> dict:
+        """Returns the stored certificate of the device without downloading
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            dict -- The certificate, see get, or None if none is stored
+        """
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                entry = self._load(device_id)
+                if entry is not None:
+                    self._entries[device_id] = entry
+            return entry
+
+    def _load(self, device_id: str) -> dict:
+        try:
+            names = os.listdir(self._path(device_id))
+        except FileNotFoundError:
+            return None
+
+        latest = None
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            with open(self._path(device_id, name), 'r', encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+            if latest is None or _sort_key(meta) > _sort_key(latest):
+                latest = meta
+        if latest is None:
+            return None
+
+        with open(self._path(device_id, latest['fingerprint'] + '.pem'), 'r', encoding='utf-8') as pem_file:
+            latest['pem'] = pem_file.read()
+        return latest
+
+    def _download(self, device_id: str) -> dict:
+        result = self._download_pem(device_id).get_result()
+        pem, secret = result.get('pem'), result.get('secret')
+        fingerprint = get_fingerprint(pem)
+        expiry = get_certificate_expiry(pem)
+
+        entry = {'fingerprint': fingerprint, 'secret': secret, 'expiry': expiry, 'downloaded': current_milli_time()}
+        os.makedirs(self._path(device_id), mode=0o700, exist_ok=True)
+        _write_private(self._path(device_id, fingerprint + '.pem'), pem)
+        _write_private(self._path(device_id, fingerprint + '.json'), json.dumps(entry))
+
+        entry['pem'] = pem
+        with self._lock:
+            self._entries[device_id] = entry
+            self._prune(device_id, keep=fingerprint)
+        return entry
+
+    def _prune(self, device_id: str, keep: str = None):
+        try:
+            names = os.listdir(self._path(device_id))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if keep is None or not name.startswith(keep + '.'):
+                os.remove(self._path(device_id, name))
+        if keep is None:
+            os.rmdir(self._path(device_id))
+
+    def _expires_soon(self, entry: dict) -> bool:
+        return entry['expiry'] is not None and entry['expiry'] - self.renew_before <= current_milli_time()
+
+    def _path(self, device_id: str, *names) -> str:
+        if device_id in ('', '.', '..') or '/' in device_id or os.sep in device_id:
+            raise ValueError('Invalid device id: ' + repr(device_id))
+        return os.path.join(self.directory, device_id, *names)
+
+
+def get_fingerprint(pem: str) -> str:
+    """Returns the fingerprint of the certificate in a PEM as used by the API
+
+    Arguments:
+        pem {str} -- PEM containing the certificate
+
+    Raises:
+        ValueError -- Raised if the PEM does not contain a certificate
+
+    Returns:
+        str -- SHA-256 hash of the DER encoded certificate in lowercase hex format
+    """
+    match = _CERTIFICATE_PATTERN.search(pem or '')
+    if match is None:
+        raise ValueError('The PEM does not contain a certificate.')
+    return hashlib.sha256(ssl.PEM_cert_to_DER_cert(match.group(0))).hexdigest()
+
+
+def get_certificate_expiry(pem: str) -> int:
+    """Returns the expiration date (notAfter) of the certificate in a PEM
+
+    Arguments:
+        pem {str} -- PEM containing the certificate
+
+    Raises:
+        ValueError -- Raised if the PEM does not contain a certificate or its validity cannot be read
+
+    Returns:
+        int -- UNIX time in milliseconds
+    """
+    match = _CERTIFICATE_PATTERN.search(pem or '')
+    if match is None:
+        raise ValueError('The PEM does not contain a certificate.')
+    der = ssl.PEM_cert_to_DER_cert(match.group(0))
+    try:
+        # Certificate and TBSCertificate are sequences. The validity follows the optional version, the serial
+        # number, the signature algorithm and the issuer.
+        _, certificate, _ = _read_der(der, 0, _TAG_SEQUENCE)
+        _, position, _ = _read_der(der, certificate, _TAG_SEQUENCE)
+        tag, _, end = _read_der(der, position)
+        if tag == _TAG_VERSION:
+            position = end
+        for _ in range(3):
+            _, _, position = _read_der(der, position)
+        _, validity, _ = _read_der(der, position, _TAG_SEQUENCE)
+        _, _, not_before_end = _read_der(der, validity)
+        tag, start, end = _read_der(der, not_before_end)
+        value = der[start:end].decode('ascii')
+        if tag == _TAG_UTC_TIME:
+            # Two-digit years from 50 on are in the 20th century (RFC 5280)
+            value = ('19' if int(value[:2]) >= 50 else '20') + value
+        elif tag != _TAG_GENERALIZED_TIME:
+            raise ValueError('Unexpected tag ' + hex(tag))
+        not_after = datetime.strptime(value, '%Y%m%d%H%M%SZ').replace(tzinfo=timezone.utc)
+    except (IndexError, ValueError) as err:
+        raise ValueError('The expiration date of the certificate cannot be read: ' + str(err))
+    return to_milli_time(not_after)
+
+
+def _read_der(der: bytes, offset: int, expected_tag: int = None):
+    # Returns the tag, the start and the end of the content of the DER element at offset
+    tag = der[offset]
+    if expected_tag is not None and tag != expected_tag:
+        raise ValueError('Unexpected tag ' + hex(tag))
+    length = der[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(der[start:start + size], 'big')
+        start += size
+    if start + length > len(der):
+        raise ValueError('Truncated certificate')
+    return tag, start, start + length
+
+
+def _normalize_fingerprint(fingerprint) -> str:
+    if fingerprint is None:
+        return None
+    return fingerprint.replace(':', '').lower()
+
+
+def _get_expiry(cert: dict) -> int:
+    if cert.get(_EXPIRY_FIELD) is None:
+        raise ValueError('The certificate listing has no "' + _EXPIRY_FIELD + '" for ' + str(cert.get('fingerprint')))
+    return to_milli_time(cert[_EXPIRY_FIELD])
+
+
+def _sort_key(meta: dict):
+    return meta['expiry'] if meta['expiry'] is not None else float('inf'), meta['downloaded']
+
+
+def _write_private(path: str, content: str):
+    # Write to a temporary file first so that readers never see a partially written certificate
+    temp_path = path + '.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as private_file:
+        private_file.write(content)
+    os.replace(temp_path, path)
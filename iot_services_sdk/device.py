@@ -5,6 +5,8 @@ import json
 from .tenant_iot_service import TenantIoTService
 from .mqtt_client import MQTTClient
 from .rest_client import RestClient
+from .measure_export import MeasureExporter
+from .measure_aggregate import aggregate_measures
 from .utils import build_query
 from .response import Response
 
@@ -34,7 +36,7 @@ class DeviceService(TenantIoTService):
             tenant_id=tenant_id
         )
 
-    def get_devices(self, filters=None, orderby=None, asc=True, skip=None, top=None) -> Response:
+    def get_devices(self, filters=None, orderby=None, asc=True, skip=None, top=None, stream=False) -> Response:
         """The endpoint returns a list of devices.
         
         Keyword Arguments:
@@ -43,13 +45,14 @@ class DeviceService(TenantIoTService):
             asc {bool} -- Only considered if orderby is not none. Defines if the values should be ordered asc or desc. (default: {True})
             skip {int} -- This parameter specifies the number of items in the queried collection which will be skipped and therefore included in the result set (default: {None})
             top {int} -- This parameter restricts the maximum number of items which will be returned by the request (default: {None})
+            stream {bool} -- If set to true, the list is streamed from the connection. Use Response.iter_result() to consume it element by element with bounded memory. (default: {False})
         
         Returns:
             Response -- Response object
         """
         query = build_query(filters=filters, orderby=orderby, asc=asc, skip=skip, top=top)
         return super().request_core(method='GET', service=self.service, headers=None, payload=None, accept_json=True,
-                                    query=query)
+                                    query=query, stream=stream)
 
     def create_device(self, gateway_id: str, name: str, as_router=False, custom_properties=None) -> Response:
         """This endpoint is used to create a device.
@@ -183,9 +186,8 @@ class DeviceService(TenantIoTService):
         Returns:
             Response -- Response object
         """
-        # service = self.service + '/' + device_id + '/authentications/clientCertificate/' + fingerprint
-        # return super().request_core(method='DELETE', service=service)
-        raise NotImplementedError('This method is not supported yet.')
+        service = self.service + '/' + device_id + '/authentications/clientCertificate/' + fingerprint
+        return super().request_core(method='DELETE', service=service)
 
     def send_command_to_device(self, device_id: str, capability_id: str, sensor_id: str, command: dict) -> Response:
         """Used to send the command specified in the request body to the device associated to the given id.
@@ -249,33 +251,42 @@ class DeviceService(TenantIoTService):
         payload = '{ "key" : "' + key + '", "value" : "' + value + '" }'
         return super().request_core(method='PUT', service=service, headers=headers, payload=payload, accept_json=True)
 
-    def get_mqtt_client(self, device_alternate_id: str, pemfile: str, secret: str) -> MQTTClient:
+    def get_mqtt_client(self, device_alternate_id: str, pemfile: str = None, secret: str = None,
+                        pem=None) -> MQTTClient:
         """Returns MQTT client for specified router device
         
         Arguments:
             device_alternate_id {str} -- Alternate identifier of a device
             certfile_path {str} -- Path to the certfile
             keyfile_path {str} -- Path to the keyfile
+
+        Keyword Arguments:
+            pem {str|bytes} -- Content of the PEM as returned by get_device_pem, used instead of the pemfile (default: {None})
         
         Returns:
             MQTTClient -- The MQTTClient object configured for the specified router device
         """
-        return MQTTClient(self.instance, device_alternate_id, pemfile, secret)
+        return MQTTClient(self.instance, device_alternate_id, pemfile, secret, pem=pem)
 
-    def get_rest_client(self, device_alternate_id: str, pemfile: str, secret: str) -> RestClient:
+    def get_rest_client(self, device_alternate_id: str, pemfile: str = None, secret: str = None,
+                        pem=None) -> RestClient:
         """Returns REST client for specified device
         
         Arguments:
             device_alternate_id {str} -- Alternate identifier of a device
             certfile_path {str} -- Path to the certfile
             keyfile_path {str} -- Path to the keyfile
+
+        Keyword Arguments:
+            pem {str|bytes} -- Content of the PEM as returned by get_device_pem, used instead of the pemfile (default: {None})
         
         Returns:
             RestClient -- The RestClient object configured for the specified device
         """
-        return RestClient(self.instance, device_alternate_id, pemfile, secret)
+        return RestClient(self.instance, device_alternate_id, pemfile, secret, pem=pem)
 
-    def get_measures(self, device_id: str, filters=None, orderby=None, asc=True, skip=None, top=None) -> Response:
+    def get_measures(self, device_id: str, filters=None, orderby=None, asc=True, skip=None, top=None,
+                     stream=False) -> Response:
         """Returns a list of measures related to the device associated to the given id.
         
         Arguments:
@@ -287,10 +298,54 @@ class DeviceService(TenantIoTService):
             asc {bool} -- Only considered if orderby is not none. Defines if the values should be ordered asc or desc. (default: {True})
             skip {int} -- This parameter specifies the number of items in the queried collection which will be skipped and therefore included in the result set (default: {None})
             top {int} -- This parameter restricts the maximum number of items which will be returned by the request (default: {None})
+            stream {bool} -- If set to true, the list is streamed from the connection. Use Response.iter_result() to consume it element by element with bounded memory. (default: {False})
         
         Returns:
             Response -- Response object
         """
         service = self.service + '/' + device_id + '/measures'
         query = build_query(filters=filters, orderby=orderby, asc=asc, skip=skip, top=top)
-        return super().request_core(method='GET', service=service, query=query, accept_json=True)
+        return super().request_core(method='GET', service=service, query=query, accept_json=True, stream=stream)
+
+    def export_measures(self, device_id: str, start, end, filters=None, max_workers=8, page_size=1000):
+        """Downloads all measures of the device in a time range by fetching time windows in parallel.
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            start {int|datetime|str} -- Start of the time range (inclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+            end {int|datetime|str} -- End of the time range (exclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+
+        Keyword Arguments:
+            filters {list} -- Additional filters, e.g. ["capabilityId eq '111'"] (default: {None})
+            max_workers {int} -- Number of windows fetched concurrently (default: {8})
+            page_size {int} -- Maximum number of measures requested per window (default: {1000})
+
+        Returns:
+            generator -- Yields the measures in timestamp order
+        """
+        exporter = MeasureExporter(self, max_workers=max_workers, page_size=page_size)
+        return exporter.export(device_id, start, end, filters=filters)
+
+    def aggregate_measures(self, device_id: str, start, end, interval: int, properties: list,
+                           functions=('min', 'max', 'avg', 'count'), filters=None, max_workers=8, page_size=1000):
+        """Downloads the measures of the device in a time range and aggregates them into windows while they arrive.
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            start {int|datetime|str} -- Start of the time range (inclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+            end {int|datetime|str} -- End of the time range (exclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+            interval {int} -- Length of the windows in milliseconds, e.g. 60000 for one minute
+            properties {list} -- Names of the numeric measure properties to aggregate
+
+        Keyword Arguments:
+            functions {tuple} -- Aggregate functions to compute. Supported are 'min', 'max', 'avg', 'sum' and 'count'. (default: {('min', 'max', 'avg', 'count')})
+            filters {list} -- Additional filters, e.g. ["capabilityId eq '111'"] (default: {None})
+            max_workers {int} -- Number of windows fetched concurrently (default: {8})
+            page_size {int} -- Maximum number of measures requested per window (default: {1000})
+
+        Returns:
+            generator -- Yields the aggregates per window in timestamp order
+        """
+        measures = self.export_measures(device_id, start, end, filters=filters, max_workers=max_workers,
+                                        page_size=page_size)
+        return aggregate_measures(measures, interval, properties, functions=functions, page_size=page_size)
@@ -235,7 +235,7 @@ class GatewayService(TenantIoTService):
             Response -- Response object
         """
         service = self.service + '/' + gateway_id + '/configuration'
-        return super().request_core(method='GET', service=service)
+        return super().request_core(method='GET', service=service, revalidate=True)
 
     def update_gateway_configuration(self, gateway_id: str, xml: str) -> Response:
         """The endpoint is used to update the gateway specific configuration by uploading a configuration XML file.
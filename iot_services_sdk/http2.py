@@ -0,0 +1,121 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import requests
+
+# httpx and h2 are optional and only imported if HTTP/2 is switched on
+httpx = None
+
+
+class HTTP2Response(object):
+    """Wraps a httpx response in the parts of the requests.Response interface used by the SDK"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.http_version = response.http_version
+
+    @property
+    def content(self) -> bytes:
+        return self._response.read()
+
+    @property
+    def text(self) -> str:
+        self._response.read()
+        return self._response.text
+
+    @property
+    def cookies(self):
+        return self._response.cookies.jar
+
+    @property
+    def encoding(self) -> str:
+        return self._response.charset_encoding
+
+    def iter_content(self, chunk_size: int = None):
+        try:
+            for chunk in self._response.iter_bytes(chunk_size):
+                yield chunk
+        except httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(err)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code) + ' Error for url: ' + str(self._response.url),
+                                                response=self)
+
+    def close(self):
+        self._response.close()
+
+
+class HTTP2Session(object):
+    """Multiplexes requests over HTTP/2 connections with httpx, behind the requests.Session interface used by the SDK.
+
+    Hundreds of concurrent requests to the same host share a few connections instead of opening one socket and
+    TLS handshake each. Servers without HTTP/2 support are talked to with HTTP/1.1.
+    """
+
+    def __init__(self, verify=True, max_connections: int = 10, timeout: float = None):
+        """Instantiate HTTP2Session object
+
+        Keyword Arguments:
+            verify {bool|ssl.SSLContext} -- Certificate verification or SSL context, e.g. with a client certificate (default: {True})
+            max_connections {int} -- Maximum number of connections per pool (default: {10})
+            timeout {float} -- Timeout in seconds. None waits forever like requests does. (default: {None})
+
+        Raises:
+            ImportError -- Raised if httpx or h2 is not installed
+        """
+        _import_httpx()
+        self.client = httpx.Client(http2=True, verify=verify, timeout=timeout,
+                                   limits=httpx.Limits(max_connections=max_connections))
+
+    @property
+    def cookies(self):
+        return self.client.cookies.jar
+
+    def request(self, method: str, url: str, headers=None, auth=None, data=None, files=None, stream=False):
+        """Sends a request
+
+        Arguments:
+            method {str} -- HTTP method
+            url {str} -- URL of the request
+
+        Keyword Arguments:
+            headers {dict} -- HTTP headers (default: {None})
+            auth {tuple} -- User and password for basic authentication (default: {None})
+            data {str} -- Message payload (default: {None})
+            files {object} -- Files to upload (default: {None})
+            stream {bool} -- If set to true, the body is not read upfront (default: {False})
+
+        Raises:
+            requests.exceptions.ConnectionError -- Raised if the connection failed
+            requests.exceptions.Timeout -- Raised if the request timed out
+
+        Returns:
+            HTTP2Response -- The response
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        request = self.client.build_request(method, url, headers=headers, content=data, files=files)
+        try:
+            response = self.client.send(request, auth=auth if auth is not None else httpx.USE_CLIENT_DEFAULT,
+                                        stream=stream)
+        except httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(err)
+        except httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(err)
+        return HTTP2Response(response)
+
+    def close(self):
+        self.client.close()
+
+
+def _import_httpx():
+    global httpx
+    if httpx is None:
+        try:
+            import h2  # noqa: F401
+            import httpx
+        except ImportError:
+            raise ImportError('HTTP/2 requires httpx and h2. Install them with "pip install httpx[http2]".')
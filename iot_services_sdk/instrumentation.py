@@ -0,0 +1,310 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import bisect
+import logging
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+SOURCE_CORE = 'core'
+SOURCE_GATEWAY = 'gateway'
+
+# Path segments which are names of the API. All other segments are identifiers and replaced in path templates.
+_PATH_NAMES = frozenset([
+    'iot', 'core', 'api', 'v1', 'gateway', 'rest', 'tenant', 'tenants', 'devices', 'sensors', 'sensorTypes',
+    'capabilities', 'gateways', 'protocols', 'vendors', 'users', 'roles', 'me', 'logout', 'about', 'count',
+    'customProperties', 'authentications', 'gatewayRegistrations', 'clientCertificate', 'pem', 'p12', 'basic',
+    'measures', 'commands', 'configuration', 'bundles', 'start', 'stop', 'trustedCACertificates',
+])
+
+
+class RequestEvent(object):
+    """Structured record of a HTTP request sent by the SDK"""
+
+    __slots__ = ('source', 'method', 'url', 'status_code', 'latency', 'request_bytes', 'response_bytes', 'retries',
+                 'error')
+
+    def __init__(self, source: str, method: str, url: str, status_code: int = None, latency: float = None,
+                 request_bytes: int = None, response_bytes: int = None, retries: int = 0, error=None):
+        """Instantiate RequestEvent object
+
+        Arguments:
+            source {str} -- 'core' for the Device Management API, 'gateway' for the REST gateway
+            method {str} -- HTTP method
+            url {str} -- URL of the request
+
+        Keyword Arguments:
+            status_code {int} -- Status code of the last response or None if no response was received (default: {None})
+            latency {float} -- Seconds from sending the request until the last response, including retries (default: {None})
+            request_bytes {int} -- Size of the request body or None if unknown, e.g. for file uploads (default: {None})
+            response_bytes {int} -- Size of the response body or None if unknown, e.g. for streamed responses without Content-Length (default: {None})
+            retries {int} -- Number of retries (default: {0})
+            error {Exception} -- Exception raised by the request, if any (default: {None})
+        """
+        self.source = source
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.latency = latency
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.retries = retries
+        self.error = error
+
+    @property
+    def path_template(self) -> str:
+        """Path of the request with identifiers replaced by {id}, e.g. /iot/core/api/v1/tenant/{id}/devices/{id}"""
+        return get_path_template(urlsplit(self.url).path)
+
+    def to_dict(self) -> dict:
+        """Returns the event as dict, with the path template and the name of the error class"""
+        return {
+            'source': self.source,
+            'method': self.method,
+            'path_template': self.path_template,
+            'status_code': self.status_code,
+            'latency': self.latency,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'retries': self.retries,
+            'error': type(self.error).__name__ if self.error is not None else None,
+        }
+
+
+@lru_cache(maxsize=4096)
+def get_path_template(path: str) -> str:
+    """Returns the path with all segments which are not names of the API replaced by {id}
+
+    Arguments:
+        path {str} -- Path of a request, e.g. /iot/core/api/v1/tenant/1/devices/42
+
+    Returns:
+        str -- The path template, e.g. /iot/core/api/v1/tenant/{id}/devices/{id}
+    """
+    return '/'.join(segment if segment == '' or segment in _PATH_NAMES else '{id}' for segment in path.split('/'))
+
+
+class Instrumentation(object):
+    """Dispatches request events to sinks.
+
+    A sink is any callable taking a RequestEvent, e.g. a LoggingSink, a CounterSink or a plain function. While no
+    sink is attached, requests are not measured at all. Exceptions raised by sinks are logged and never reach the
+    request.
+    """
+
+    def __init__(self):
+        self.sinks = ()
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """Attaches a sink
+
+        Arguments:
+            sink {callable} -- Called with every RequestEvent
+        """
+        with self._lock:
+            # The tuple is replaced instead of modified, so that emit can iterate it without locking
+            self.sinks = self.sinks + (sink,)
+            self.enabled = True
+
+    def remove_sink(self, sink):
+        """Detaches a sink
+
+        Arguments:
+            sink {callable} -- The sink
+        """
+        with self._lock:
+            self.sinks = tuple(current for current in self.sinks if current != sink)
+            self.enabled = len(self.sinks) > 0
+
+    def emit(self, event: RequestEvent):
+        """Passes an event to all sinks
+
+        Arguments:
+            event {RequestEvent} -- The event
+        """
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception:
+                logging.getLogger(__name__).exception('Instrumentation sink failed')
+
+
+class LoggingSink(object):
+    """Logs one line per request"""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.DEBUG):
+        """Instantiate LoggingSink object
+
+        Keyword Arguments:
+            logger {logging.Logger} -- Logger to write to. If None, the iot_services_sdk.requests logger is used. (default: {None})
+            level {int} -- Log level of successful requests. Failed requests are logged as warning. (default: {logging.DEBUG})
+        """
+        self.logger = logger if logger is not None else logging.getLogger('iot_services_sdk.requests')
+        self.level = level
+
+    def __call__(self, event: RequestEvent):
+        failed = event.error is not None or event.status_code is None or event.status_code >= 400
+        level = logging.WARNING if failed else self.level
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, '%s %s %s %.1f ms sent %s B received %s B retries %d%s', event.method,
+                        event.path_template, event.status_code, (event.latency or 0.0) * 1000.0, event.request_bytes,
+                        event.response_bytes, event.retries,
+                        ' error ' + repr(event.error) if event.error is not None else '')
+
+
+class CounterSink(object):
+    """Aggregates request events into Prometheus-style counters and latency histograms.
+
+    The series are labelled by source, method, path template and status. render() returns them in the Prometheus
+    text exposition format, so that they can be served on a metrics endpoint.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, prefix: str = 'iot_services_sdk'):
+        """Instantiate CounterSink object
+
+        Keyword Arguments:
+            buckets {tuple} -- Upper bounds of the latency histogram buckets in seconds (default: {DEFAULT_BUCKETS})
+            prefix {str} -- Prefix of the metric names (default: {'iot_services_sdk'})
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: RequestEvent):
+        status = str(event.status_code) if event.status_code is not None else type(event.error).__name__
+        key = (event.source, event.method, event.path_template, status)
+        bucket = bisect.bisect_left(self.buckets, event.latency or 0.0)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.count += 1
+            series.latency_sum += event.latency or 0.0
+            series.bucket_counts[bucket] += 1
+            series.request_bytes += event.request_bytes or 0
+            series.response_bytes += event.response_bytes or 0
+            series.retries += event.retries
+
+    def get_samples(self) -> list:
+        """Returns the current value of every series
+
+        Returns:
+            list -- One dict per series with the labels source, method, path_template and status and the values count, latency_sum, request_bytes, response_bytes and retries
+        """
+        with self._lock:
+            return [{'source': key[0], 'method': key[1], 'path_template': key[2], 'status': key[3],
+                     'count': series.count, 'latency_sum': series.latency_sum,
+                     'request_bytes': series.request_bytes, 'response_bytes': series.response_bytes,
+                     'retries': series.retries} for key, series in self._series.items()]
+
+    def reset(self):
+        """Drops all series"""
+        with self._lock:
+            self._series = {}
+
+    def render(self) -> str:
+        """Returns all series in the Prometheus text exposition format
+
+        Returns:
+            str -- The metrics
+        """
+        with self._lock:
+            series = [(key, value.copy()) for key, value in self._series.items()]
+        name = self.prefix + '_requests'
+        lines = [
+            '# HELP ' + name + '_total Number of requests',
+            '# TYPE ' + name + '_total counter',
+        ]
+        lines += [name + '_total' + _labels(key) + ' ' + str(value.count) for key, value in series]
+        for metric, attribute, description in (('request_bytes', 'request_bytes', 'Bytes of request bodies'),
+                                               ('response_bytes', 'response_bytes', 'Bytes of response bodies'),
+                                               ('retries', 'retries', 'Number of retries')):
+            metric = self.prefix + '_' + metric + '_total'
+            lines += ['# HELP ' + metric + ' ' + description, '# TYPE ' + metric + ' counter']
+            lines += [metric + _labels(key) + ' ' + str(getattr(value, attribute)) for key, value in series]
+
+        metric = self.prefix + '_request_duration_seconds'
+        lines += ['# HELP ' + metric + ' Latency of requests including retries', '# TYPE ' + metric + ' histogram']
+        for key, value in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), value.bucket_counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(metric + '_bucket' + _labels(key, le=le) + ' ' + str(cumulative))
+            lines.append(metric + '_sum' + _labels(key) + ' ' + repr(value.latency_sum))
+            lines.append(metric + '_count' + _labels(key) + ' ' + str(value.count))
+        return '\n'.join(lines) + '\n'
+
+
+class _Series(object):
+    __slots__ = ('count', 'latency_sum', 'bucket_counts', 'request_bytes', 'response_bytes', 'retries')
+
+    def __init__(self, buckets: int):
+        self.count = 0
+        self.latency_sum = 0.0
+        # One more bucket for latencies above the largest bound
+        self.bucket_counts = [0] * (buckets + 1)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+
+    def copy(self):
+        copy = _Series(len(self.bucket_counts) - 1)
+        copy.count, copy.latency_sum, copy.bucket_counts = self.count, self.latency_sum, list(self.bucket_counts)
+        copy.request_bytes, copy.response_bytes, copy.retries = self.request_bytes, self.response_bytes, self.retries
+        return copy
+
+
+def _labels(key: tuple, **extra) -> str:
+    labels = dict(zip(('source', 'method', 'path', 'status'), key), **extra)
+    return '{' + ','.join(name + '="' + _escape(str(value)) + '"' for name, value in labels.items()) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def get_body_size(data) -> int:
+    """Returns the size of a request body in bytes
+
+    Arguments:
+        data {str|bytes} -- The body
+
+    Returns:
+        int -- The size, 0 without body and None if it cannot be determined
+    """
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return None
+
+
+def get_response_size(response, stream: bool = False) -> int:
+    """Returns the size of a response body in bytes without consuming streamed bodies
+
+    Arguments:
+        response {requests.Response} -- The response
+
+    Keyword Arguments:
+        stream {bool} -- If set to true, the size is taken from the Content-Length header (default: {False})
+
+    Returns:
+        int -- The size or None if it is unknown
+    """
+    if not stream:
+        return len(response.content)
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None and length.isdigit() else None
+
+
+# Instrumentation of all transports and REST clients which do not have one of their own
+instrumentation = Instrumentation()
@@ -2,7 +2,12 @@
 
 import requests
 import json
+from urllib.parse import urlsplit
+from . import tracing
+from .instrumentation import get_path_template
 from .response import Response
+from .transport import get_transport
+from .utils import get_base_url
 
 
 class DeviceManagementAPIException(Exception):
@@ -30,8 +35,11 @@ class IoTService(object):
 
         self._api_path = '/iot/core/api/v1'
 
+        # Services of the same instance and user share one transport, i.e. one connection pool and retry policy
+        self.transport = get_transport(instance, user, password)
+
     def request_core(self, method=None, service=None, headers=None, payload=None, accept_json=False, query=None,
-                     files=None) -> Response:
+                     files=None, stream=False, revalidate=False) -> Response:
         """Fires a HTTP request to core services
         
         Keyword Arguments:
@@ -39,29 +47,83 @@ class IoTService(object):
             service {str} -- Service Path (default: {None})
             headers {dict} -- HTTP headers (default: {None})
             payload {str} -- Message payload (default: {None})
-            accept_json {bool} -- If set to true, the response is parsed a JSON (default: {False})
+            accept_json {bool} -- If set to true, the response is parsed as JSON on first access (default: {False})
             query {str} -- Query for filtering (default: {None})
             files {str} -- Path to files (default: {None})
+            stream {bool} -- If set to true, the body is not read upfront but streamed from the connection, e.g. to
+                             iterate over huge lists with Response.iter_result() (default: {False})
+            revalidate {bool} -- If set to true, GET responses are cached with their ETag or Last-Modified
+                                 validators and later requests are sent conditionally. On 304 Not Modified a response
+                                 with the cached body is returned. (default: {False})
         
         Returns:
             Response -- Response object
         """
 
-        url = 'https://' + self.instance + self._api_path + service
+        url = get_base_url(self.instance) + self._api_path + service
         if query is not None:
             url = url + query
 
-        user = self.user
-        password = self.password
+        if tracing.get_tracer() is None:
+            return self._dispatch_core(method, url, headers, payload, accept_json, files, stream, revalidate)
+        with tracing.start_span(method + ' ' + get_path_template(urlsplit(url).path), kind=tracing.SPAN_KIND_CLIENT,
+                                attributes={'http.request.method': method, 'url.full': url}) as span:
+            response = self._dispatch_core(method, url, headers, payload, accept_json, files, stream, revalidate)
+            span.set_attribute('http.response.status_code', response.get_status_code())
+            return response
+
+    def _dispatch_core(self, method, url, headers, payload, accept_json, files, stream, revalidate) -> Response:
+        if not self.transport.coalesce_gets:
+            return self._send_core(method, url, headers, payload, accept_json, files, stream, revalidate)
+        if method == 'GET' and not stream and files is None:
+            # Concurrent identical reads share a single request. Each caller gets its own copy of the response, so
+            # that callers changing their result do not affect the others. Copies share the raw body.
+            key = (url, accept_json, tuple(sorted(headers.items())) if headers is not None else None)
+            return self.transport.single_flight.do(
+                key, lambda: self._send_core(method, url, headers, payload, accept_json, files, stream, revalidate)
+            ).copy()
+        try:
+            return self._send_core(method, url, headers, payload, accept_json, files, stream, revalidate)
+        finally:
+            # Reads which started before the write may return the old state, so later reads must not join them
+            if method != 'GET':
+                self.transport.single_flight.forget()
+
+    def _send_core(self, method, url, headers, payload, accept_json, files, stream, revalidate=False) -> Response:
+        revalidate = revalidate and method == 'GET' and not stream
+        validator_key = (url, accept_json)
+        request_headers = tracing.inject(headers)
+        if revalidate:
+            conditional_headers = self.transport.validators.get_conditional_headers(validator_key)
+            if len(conditional_headers) > 0:
+                request_headers = dict(request_headers or {}, **conditional_headers)
 
         try:
-            response = requests.request(method, url, headers=headers, auth=(user, password), data=payload, files=files)
+            response = self.transport.request(method, url, headers=request_headers, data=payload, files=files,
+                                              stream=stream)
+            if revalidate and response.status_code == 304:
+                cached = self.transport.validators.get(validator_key)
+                if cached is not None:
+                    # A new Response per hit, so that callers changing their result do not change the cached one
+                    status_code, cached_headers, raw, encoding = cached
+                    return Response(status_code, headers=cached_headers.copy(), raw=raw, is_json=accept_json,
+                                    encoding=encoding)
+                # The cached response has been evicted in the meantime
+                response = self.transport.request(method, url, headers=tracing.inject(headers), data=payload,
+                                                  files=files)
             response.raise_for_status()
-            if accept_json:
-                response_json = json.loads(response.text)
-                return Response(response.status_code, response_json, response.headers)
-            else:
-                return Response(response.status_code, response.text, response.headers)
+            if stream:
+                return Response(response.status_code, headers=response.headers, is_json=accept_json,
+                                encoding=response.encoding, stream=response.iter_content(chunk_size=65536),
+                                close=response.close)
+            # The body is kept as raw bytes and only decoded when the result is accessed
+            result = Response(response.status_code, headers=response.headers, raw=response.content,
+                              is_json=accept_json, encoding=response.encoding)
+            if revalidate:
+                self.transport.validators.put(validator_key, response.headers,
+                                              (response.status_code, response.headers, response.content,
+                                               response.encoding))
+            return result
         except requests.exceptions.HTTPError as err:
             try:
                 raise DeviceManagementAPIException(json.loads(err.response.text)['message'])
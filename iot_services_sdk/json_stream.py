@@ -0,0 +1,130 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARACTERS = '0123456789+-.eE'
+
+# Parser states: before the document, after '[', after ',', after an element and after the document
+_START = 0
+_FIRST = 1
+_VALUE = 2
+_SEPARATOR = 3
+_END = 4
+
+
+def iter_json_array(chunks, encoding='utf-8'):
+    """Parses a JSON array incrementally and yields its elements as soon as they are complete.
+
+    Only the element currently being parsed is held in memory, so arbitrarily large arrays can be consumed with
+    bounded memory. If the document is not an array, the whole value is yielded once.
+
+    Arguments:
+        chunks {iterable} -- Iterable of bytes (or str) chunks making up the JSON document
+
+    Keyword Arguments:
+        encoding {str} -- Encoding of byte chunks (default: {'utf-8'})
+
+    Raises:
+        json.decoder.JSONDecodeError -- Raised if the document is not valid JSON. Positions are relative to the whole stream.
+
+    Yields:
+        object -- The parsed array elements
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ''
+    pos = 0
+    state = _START
+    chunk_iterator = iter(chunks)
+    eof = False
+    # Characters, lines and columns of the stream before the buffer, so that errors point into the whole stream
+    offset = 0
+    line = 1
+    column = 0
+
+    def error(message, at):
+        newlines = buffer.count('\n', 0, at)
+        colno = at - buffer.rfind('\n', 0, at)
+        return _stream_error(message, offset + at, line + newlines, colno + column if newlines == 0 else colno)
+
+    while True:
+        # Skip whitespace and structural characters between values
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif state == _START:
+                if char != '[':
+                    break
+                state = _FIRST
+                pos += 1
+            elif state == _SEPARATOR:
+                if char == ',':
+                    state = _VALUE
+                elif char == ']':
+                    state = _END
+                else:
+                    raise error("Expecting ',' delimiter", pos)
+                pos += 1
+            elif state == _END:
+                raise error('Extra data', pos)
+            elif char == ']' and state == _FIRST:
+                state = _END
+                pos += 1
+            elif char in ',]':
+                raise error('Expecting value', pos)
+            else:
+                break
+
+        if pos < len(buffer):
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.decoder.JSONDecodeError as err:
+                if eof:
+                    raise error(err.msg, err.pos)
+                value, end = None, None
+            # A value ending at the end of the buffer or before a number character might be a truncated number or
+            # literal
+            if end is not None and (eof or (end < len(buffer) and buffer[end] not in _NUMBER_CHARACTERS)):
+                yield value
+                # A document which is not an array consists of this one value
+                state = _END if state == _START else _SEPARATOR
+                pos = end
+                continue
+
+        if eof:
+            if state in (_FIRST, _VALUE, _SEPARATOR):
+                raise error('Unterminated array', pos)
+            return
+
+        try:
+            chunk = next(chunk_iterator)
+        except StopIteration:
+            eof = True
+            buffer += text_decoder.decode(b'', final=True)
+            continue
+
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            chunk = text_decoder.decode(bytes(chunk))
+        consumed = buffer[:pos]
+        newlines = consumed.count('\n')
+        if newlines > 0:
+            line += newlines
+            column = len(consumed) - consumed.rfind('\n') - 1
+        else:
+            column += len(consumed)
+        offset += pos
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def _stream_error(message: str, pos: int, lineno: int, colno: int) -> json.decoder.JSONDecodeError:
+    # The stream is not kept, so the error has no document
+    error = json.decoder.JSONDecodeError(message, '', 0)
+    error.args = ('%s: line %d column %d (char %d)' % (message, lineno, colno, pos),)
+    error.pos = pos
+    error.lineno = lineno
+    error.colno = colno
+    return error
@@ -0,0 +1,223 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+from collections import OrderedDict
+from itertools import islice
+
+from .utils import get_measure_values, to_milli_time
+
+# NumPy is optional and only imported on first use. If it is installed, pages are aggregated vectorized.
+numpy = None
+
+FUNCTIONS = ('min', 'max', 'avg', 'sum', 'count')
+
+
+class MeasureAggregator(object):
+    """Computes windowed aggregates (min, max, avg, sum, count) of measure properties while pages arrive.
+
+    Measures are expected in timestamp order, e.g. from DeviceService.export_measures. Only the aggregates of the
+    windows which are still open are kept in memory, so memory stays constant regardless of the number of measures.
+    """
+
+    def __init__(self, interval: int, properties: list, functions=('min', 'max', 'avg', 'count'), use_numpy=True,
+                 property_order: list = None):
+        """Instantiate MeasureAggregator object
+
+        Arguments:
+            interval {int} -- Length of the windows in milliseconds, e.g. 60000 for one minute
+            properties {list} -- Names of the numeric measure properties to aggregate
+
+        Keyword Arguments:
+            functions {tuple} -- Aggregate functions to compute. Supported are 'min', 'max', 'avg', 'sum' and 'count'. (default: {('min', 'max', 'avg', 'count')})
+            use_numpy {bool} -- If set to false, pages are aggregated in plain Python even if NumPy is installed (default: {True})
+            property_order {list} -- Names of all capability properties in order, needed for measures with their values as list. If None, properties is used. (default: {None})
+
+        Raises:
+            ValueError -- Raised if the interval is not positive or a function is not supported
+        """
+        if interval < 1:
+            raise ValueError('The interval must be positive.')
+        for function in functions:
+            if function not in FUNCTIONS:
+                raise ValueError('Unsupported aggregate function "' + function + '". Use one of ' + ', '.join(FUNCTIONS))
+
+        self.interval = interval
+        self.properties = list(properties)
+        self.functions = tuple(functions)
+        self.use_numpy = use_numpy and _import_numpy()
+        self.property_order = list(property_order) if property_order is not None else self.properties
+
+        # Window start mapped to {property: [min, max, sum, count]}
+        self._windows = OrderedDict()
+
+    def add(self, measures: list) -> list:
+        """Adds a page of measures and returns the windows which are complete afterwards
+
+        Arguments:
+            measures {list} -- Page of measures as returned by DeviceService.get_measures
+
+        Returns:
+            list -- The aggregates of all windows before the window of the last measure
+        """
+        if len(measures) == 0:
+            return []
+        if self.use_numpy:
+            partials = self._aggregate_numpy(measures)
+        else:
+            partials = self._aggregate_python(measures)
+
+        for window, values in partials:
+            current = self._windows.get(window)
+            if current is None:
+                self._windows[window] = values
+                continue
+            for prop, (minimum, maximum, total, count) in values.items():
+                state = current[prop]
+                if count > 0:
+                    state[0] = minimum if state[3] == 0 else min(state[0], minimum)
+                    state[1] = maximum if state[3] == 0 else max(state[1], maximum)
+                    state[2] += total
+                    state[3] += count
+
+        last_window = self._window(measures[-1])
+        completed = []
+        while len(self._windows) > 0:
+            window = next(iter(self._windows))
+            if window >= last_window:
+                break
+            completed.append(self._result(window, self._windows.pop(window)))
+        return completed
+
+    def flush(self) -> list:
+        """Returns the aggregates of all remaining windows
+
+        Returns:
+            list -- The aggregates of the open windows
+        """
+        completed = [self._result(window, values) for window, values in self._windows.items()]
+        self._windows.clear()
+        return completed
+
+    def _window(self, measure) -> int:
+        timestamp = to_milli_time(measure['timestamp'])
+        return timestamp - timestamp % self.interval
+
+    def _aggregate_python(self, measures: list) -> list:
+        partials = OrderedDict()
+        for measure in measures:
+            window = self._window(measure)
+            values = partials.get(window)
+            if values is None:
+                values = {prop: [None, None, 0.0, 0] for prop in self.properties}
+                partials[window] = values
+            measure_values = get_measure_values(measure, self.property_order)
+            for prop in self.properties:
+                # Converted like in the NumPy path, so that both give the same results, e.g. for numeric strings
+                value = _float(measure_values.get(prop))
+                if value != value:
+                    continue
+                state = values[prop]
+                if state[3] == 0:
+                    state[0] = state[1] = value
+                else:
+                    if value < state[0]:
+                        state[0] = value
+                    if value > state[1]:
+                        state[1] = value
+                state[2] += value
+                state[3] += 1
+        return list(partials.items())
+
+    def _aggregate_numpy(self, measures: list) -> list:
+        timestamps = numpy.fromiter((to_milli_time(measure['timestamp']) for measure in measures), dtype=numpy.int64,
+                                    count=len(measures))
+        windows = timestamps - timestamps % self.interval
+        # Measures are ordered, so each window is a contiguous run starting at these offsets
+        starts = numpy.flatnonzero(numpy.r_[True, windows[1:] != windows[:-1]])
+
+        measure_values = [get_measure_values(measure, self.property_order) for measure in measures]
+        columns = {}
+        for prop in self.properties:
+            values = numpy.fromiter((_float(values.get(prop)) for values in measure_values), dtype=numpy.float64,
+                                    count=len(measures))
+            present = ~numpy.isnan(values)
+            columns[prop] = (
+                numpy.fmin.reduceat(values, starts),
+                numpy.fmax.reduceat(values, starts),
+                numpy.add.reduceat(numpy.where(present, values, 0.0), starts),
+                numpy.add.reduceat(present.astype(numpy.int64), starts),
+            )
+
+        partials = []
+        for index, start in enumerate(starts):
+            values = {}
+            for prop, (minimum, maximum, total, count) in columns.items():
+                values[prop] = [float(minimum[index]), float(maximum[index]), float(total[index]), int(count[index])]
+            partials.append((int(windows[start]), values))
+        return partials
+
+    def _result(self, window: int, values: dict) -> dict:
+        result = {'timestamp': window}
+        for prop, (minimum, maximum, total, count) in values.items():
+            aggregates = {}
+            for function in self.functions:
+                if function == 'count':
+                    aggregates['count'] = count
+                elif function == 'sum':
+                    aggregates['sum'] = total
+                elif count == 0:
+                    aggregates[function] = None
+                elif function == 'min':
+                    aggregates['min'] = minimum
+                elif function == 'max':
+                    aggregates['max'] = maximum
+                elif function == 'avg':
+                    aggregates['avg'] = total / count
+            result[prop] = aggregates
+        return result
+
+
+def aggregate_measures(measures, interval: int, properties: list, functions=('min', 'max', 'avg', 'count'),
+                       page_size: int = 1000, property_order: list = None):
+    """Aggregates an iterable of timestamp ordered measures into windows without materializing it
+
+    Arguments:
+        measures {iterable} -- The measures, e.g. from DeviceService.export_measures or Response.iter_result()
+        interval {int} -- Length of the windows in milliseconds
+        properties {list} -- Names of the numeric measure properties to aggregate
+
+    Keyword Arguments:
+        functions {tuple} -- Aggregate functions to compute (default: {('min', 'max', 'avg', 'count')})
+        page_size {int} -- Number of measures aggregated at once (default: {1000})
+        property_order {list} -- Names of all capability properties in order, needed for measures with their values as list (default: {None})
+
+    Yields:
+        dict -- The aggregates per window, e.g. {'timestamp': 1556704800000, 'temp': {'min': 1.0, 'max': 3.0, 'avg': 2.0, 'count': 3}}
+    """
+    aggregator = MeasureAggregator(interval, properties, functions, property_order=property_order)
+    iterator = iter(measures)
+    while True:
+        page = list(islice(iterator, page_size))
+        if len(page) == 0:
+            break
+        yield from aggregator.add(page)
+    yield from aggregator.flush()
+
+
+def _import_numpy() -> bool:
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+    return True
+
+
+def _float(value) -> float:
+    # Missing values and values which are not numbers, e.g. an error text in a numeric property, are skipped
+    if value is None:
+        return float('nan')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
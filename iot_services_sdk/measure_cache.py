@@ -0,0 +1,158 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import sqlite3
+import threading
+
+from .measure_export import MeasureExporter
+from .utils import to_milli_time, current_milli_time, get_measure_key
+
+_ALL_CAPABILITIES = '*'
+
+
+class MeasureCache(object):
+    """Local SQLite cache for the measures of devices.
+
+    The cache keeps an index of the time ranges it has already downloaded per device and capability. Queries that
+    are fully covered are answered locally, otherwise only the missing gaps are fetched from the API.
+    """
+
+    def __init__(self, device_service, path: str = ':memory:', settle_time: int = 60000, max_workers: int = 8,
+                 page_size: int = 1000):
+        """Instantiate MeasureCache object
+
+        Arguments:
+            device_service {DeviceService} -- The device service used to download missing measures
+
+        Keyword Arguments:
+            path {str} -- Path of the SQLite database. The cache is kept in memory by default. (default: {':memory:'})
+            settle_time {int} -- Milliseconds before now which are never marked as covered, as measures may still arrive for them (default: {60000})
+            max_workers {int} -- Number of windows fetched concurrently per gap (default: {8})
+            page_size {int} -- Maximum number of measures requested per window (default: {1000})
+        """
+        self.settle_time = settle_time
+        self._exporter = MeasureExporter(device_service, max_workers=max_workers, page_size=page_size)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS measures (device_id TEXT, capability_id TEXT, '
+                                     'timestamp INTEGER, key TEXT, body TEXT, PRIMARY KEY (device_id, key))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS measures_by_time '
+                                     'ON measures (device_id, timestamp)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS coverage (device_id TEXT, capability_id TEXT, '
+                                     'start INTEGER, end INTEGER)')
+
+    def get_measures(self, device_id: str, start, end, capability_id: str = None) -> list:
+        """Returns the measures of the device in the time range [start, end) in timestamp order
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            start {int|datetime|str} -- Start of the time range (inclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+            end {int|datetime|str} -- End of the time range (exclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+
+        Keyword Arguments:
+            capability_id {str} -- If set, only measures of this capability are returned (default: {None})
+
+        Returns:
+            list -- The measures
+        """
+        start = to_milli_time(start)
+        end = to_milli_time(end)
+        key = capability_id if capability_id is not None else _ALL_CAPABILITIES
+        filters = ["capabilityId eq '" + capability_id + "'"] if capability_id is not None else None
+
+        for gap_start, gap_end in self.get_gaps(device_id, start, end, capability_id):
+            measures = self._exporter.export(device_id, gap_start, gap_end, filters=filters)
+            self._insert(device_id, measures)
+            covered_end = min(gap_end, current_milli_time() - self.settle_time)
+            if covered_end > gap_start:
+                self._add_coverage(device_id, key, gap_start, covered_end)
+
+        return self._select(device_id, start, end, capability_id)
+
+    def get_gaps(self, device_id: str, start: int, end: int, capability_id: str = None) -> list:
+        """Returns the parts of the time range which are not covered by the cache
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            start {int} -- Start of the time range (inclusive), UNIX time in milliseconds
+            end {int} -- End of the time range (exclusive), UNIX time in milliseconds
+
+        Keyword Arguments:
+            capability_id {str} -- Capability the query is restricted to (default: {None})
+
+        Returns:
+            list -- List of (start, end) tuples
+        """
+        keys = [_ALL_CAPABILITIES]
+        if capability_id is not None:
+            # Ranges downloaded for all capabilities cover each single capability, too
+            keys.append(capability_id)
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT start, end FROM coverage WHERE device_id = ? AND capability_id IN (%s) AND end > ? '
+                'AND start < ? ORDER BY start' % ','.join('?' * len(keys)), [device_id] + keys + [start, end]).fetchall()
+
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in rows:
+            if covered_start > cursor:
+                gaps.append((cursor, min(covered_start, end)))
+            cursor = max(cursor, covered_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def invalidate(self, device_id: str):
+        """Removes all cached measures and coverage of the device
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM measures WHERE device_id = ?', (device_id,))
+            self._connection.execute('DELETE FROM coverage WHERE device_id = ?', (device_id,))
+
+    def close(self):
+        """Closes the SQLite database"""
+        self._connection.close()
+
+    def _insert(self, device_id: str, measures, batch_size: int = 1000):
+        # Insert in batches so that the lock is not held while measures are downloaded
+        rows = []
+        for measure in measures:
+            rows.append((device_id, measure.get('capabilityId'), to_milli_time(measure['timestamp']),
+                         get_measure_key(measure), json.dumps(measure)))
+            if len(rows) >= batch_size:
+                self._insert_rows(rows)
+                rows = []
+        if len(rows) > 0:
+            self._insert_rows(rows)
+
+    def _insert_rows(self, rows: list):
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO measures VALUES (?, ?, ?, ?, ?)', rows)
+
+    def _add_coverage(self, device_id: str, key: str, start: int, end: int):
+        with self._lock, self._connection:
+            # Merge with all overlapping or adjacent ranges, so the index stays one row per contiguous range
+            rows = self._connection.execute(
+                'SELECT rowid, start, end FROM coverage WHERE device_id = ? AND capability_id = ? AND end >= ? '
+                'AND start <= ?', (device_id, key, start, end)).fetchall()
+            for rowid, covered_start, covered_end in rows:
+                start = min(start, covered_start)
+                end = max(end, covered_end)
+                self._connection.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+            self._connection.execute('INSERT INTO coverage VALUES (?, ?, ?, ?)', (device_id, key, start, end))
+
+    def _select(self, device_id: str, start: int, end: int, capability_id: str = None) -> list:
+        query = 'SELECT body FROM measures WHERE device_id = ? AND timestamp >= ? AND timestamp < ?'
+        parameters = [device_id, start, end]
+        if capability_id is not None:
+            query += ' AND capability_id = ?'
+            parameters.append(capability_id)
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY timestamp', parameters).fetchall()
+        return [json.loads(row[0]) for row in rows]
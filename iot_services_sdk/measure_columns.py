@@ -0,0 +1,268 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+from array import array
+
+from .utils import get_measure_values, to_milli_time
+
+# NumPy and pyarrow are optional and only imported on first use, as importing them is slow
+numpy = None
+pyarrow = None
+
+# Capability property data types mapped to array typecodes. All other types are kept as Python objects.
+_TYPECODES = {
+    'double': 'd',
+    'float': 'd',
+    'integer': 'q',
+    'long': 'q',
+    'boolean': 'b',
+}
+
+_BOOLEANS = {'true': 1, '1': 1, 'false': 0, '0': 0}
+
+
+class _Column(object):
+    """Typed buffer for a single column with a validity mask for missing values"""
+
+    def __init__(self, data_type: str):
+        self.data_type = data_type
+        self.typecode = _TYPECODES.get(data_type)
+        self.values = array(self.typecode) if self.typecode is not None else []
+        self.valid = bytearray()
+
+    def append(self, value):
+        if value is not None and self.typecode is not None:
+            # The API may return numbers as strings, e.g. "21.5". Values which cannot be converted become missing.
+            try:
+                value = _convert(self.typecode, value)
+            except (TypeError, ValueError, KeyError, OverflowError):
+                value = None
+        if value is None:
+            self.values.append(0 if self.typecode is not None else None)
+            self.valid.append(0)
+        else:
+            self.values.append(value)
+            self.valid.append(1)
+
+    def __len__(self):
+        return len(self.valid)
+
+
+class _DictionaryColumn(object):
+    """Dictionary encoded buffer for columns with few distinct values, e.g. capability or sensor ids"""
+
+    def __init__(self):
+        self.codes = array('i')
+        self.dictionary = []
+        self._index = {}
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self._index[value] = code
+            self.dictionary.append(value)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class MeasureColumns(object):
+    """Collects measures into typed column buffers instead of a list of dicts.
+
+    Timestamps are stored as UNIX time in milliseconds, capability and sensor ids are dictionary encoded and every
+    capability property gets a column typed after its data type. The columns can be handed to NumPy without
+    copying, or to Arrow and Parquet if pyarrow is installed.
+    """
+
+    def __init__(self, properties: list):
+        """Instantiate MeasureColumns object
+
+        Arguments:
+            properties {list} -- The capability properties as list of dicts with the keys 'name' and 'dataType', e.g. [{"name": "temp", "dataType": "double"}]
+        """
+        self.properties = [prop['name'] for prop in properties]
+        self._timestamps = array('q')
+        self._capability_ids = _DictionaryColumn()
+        self._sensor_ids = _DictionaryColumn()
+        self._columns = {prop['name']: _Column(prop.get('dataType')) for prop in properties}
+
+    @classmethod
+    def from_capabilities(cls, capability_service, capability_ids: list):
+        """Creates MeasureColumns with the properties of the given capabilities
+
+        Arguments:
+            capability_service {CapabilityService} -- The capability service used to look up the properties
+            capability_ids {list} -- Unique identifiers of the capabilities
+
+        Returns:
+            MeasureColumns -- Empty column buffers
+        """
+        properties = []
+        names = set()
+        for capability_id in capability_ids:
+            capability = capability_service.get_capability(capability_id).get_result()
+            for prop in capability.get('properties', []):
+                if prop['name'] not in names:
+                    names.add(prop['name'])
+                    properties.append(prop)
+        return cls(properties)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, measure: dict):
+        """Appends a single measure as returned by DeviceService.get_measures
+
+        Arguments:
+            measure {dict} -- The measure. Its values are read from the 'measure' key, either as dict by property name or as list in property order.
+        """
+        self._timestamps.append(to_milli_time(measure['timestamp']))
+        self._capability_ids.append(measure.get('capabilityId'))
+        self._sensor_ids.append(measure.get('sensorId'))
+
+        values = get_measure_values(measure, self.properties)
+        for name, column in self._columns.items():
+            column.append(values.get(name))
+
+    def extend(self, measures):
+        """Appends measures from any iterable, e.g. a streamed response or DeviceService.export_measures
+
+        Arguments:
+            measures {iterable} -- The measures
+        """
+        for measure in measures:
+            self.append(measure)
+
+    def columns(self) -> dict:
+        """Returns the raw column buffers. Missing values of typed columns are 0.
+
+        Returns:
+            dict -- Column name mapped to array.array or list
+        """
+        result = {
+            'timestamp': self._timestamps,
+            'capabilityId': [self._capability_ids.dictionary[code] for code in self._capability_ids.codes],
+            'sensorId': [self._sensor_ids.dictionary[code] for code in self._sensor_ids.codes],
+        }
+        for name, column in self._columns.items():
+            result[name] = column.values
+        return result
+
+    def to_numpy(self) -> dict:
+        """Returns the columns as NumPy arrays. Numeric columns share the memory of the buffers.
+
+        Typed columns with missing values are returned as masked arrays. As the arrays share memory with the
+        buffers, no further measures can be appended while they are in use.
+
+        Raises:
+            ImportError -- Raised if NumPy is not installed
+
+        Returns:
+            dict -- Column name mapped to numpy.ndarray
+        """
+        _import_numpy()
+
+        result = {
+            'timestamp': _frombuffer(self._timestamps, numpy.int64),
+            'capabilityId': numpy.array(self._capability_ids.dictionary, dtype=object)[
+                _frombuffer(self._capability_ids.codes, numpy.int32)],
+            'sensorId': numpy.array(self._sensor_ids.dictionary, dtype=object)[
+                _frombuffer(self._sensor_ids.codes, numpy.int32)],
+        }
+        for name, column in self._columns.items():
+            if column.typecode == 'd':
+                values = _frombuffer(column.values, numpy.float64)
+            elif column.typecode == 'q':
+                values = _frombuffer(column.values, numpy.int64)
+            elif column.typecode == 'b':
+                values = _frombuffer(column.values, numpy.int8).view(numpy.bool_)
+            else:
+                values = numpy.array(column.values, dtype=object)
+            valid = numpy.frombuffer(bytes(column.valid), dtype=numpy.uint8) if len(column) > 0 \
+                else numpy.empty(0, dtype=numpy.uint8)
+            if not valid.all():
+                values = numpy.ma.masked_array(values, mask=valid == 0)
+            result[name] = values
+        return result
+
+    def to_arrow(self):
+        """Returns the columns as Arrow table. Capability and sensor ids become dictionary arrays.
+
+        Raises:
+            ImportError -- Raised if pyarrow or NumPy is not installed
+
+        Returns:
+            pyarrow.Table -- The measures
+        """
+        _import_pyarrow()
+
+        columns = self.to_numpy()
+        arrays = {
+            'timestamp': pyarrow.array(columns['timestamp'], type=pyarrow.timestamp('ms', tz='UTC')),
+            'capabilityId': _dictionary_array(self._capability_ids),
+            'sensorId': _dictionary_array(self._sensor_ids),
+        }
+        for name in self._columns:
+            values = columns[name]
+            if isinstance(values, numpy.ma.MaskedArray):
+                arrays[name] = pyarrow.array(values.data, mask=values.mask)
+            else:
+                arrays[name] = pyarrow.array(values)
+        return pyarrow.table(arrays)
+
+    def to_parquet(self, path: str, **kwargs):
+        """Writes the columns to a Parquet file
+
+        Arguments:
+            path {str} -- Path of the Parquet file
+
+        Raises:
+            ImportError -- Raised if pyarrow or NumPy is not installed
+        """
+        table = self.to_arrow()
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, path, **kwargs)
+
+
+def _convert(typecode: str, value):
+    if typecode == 'd':
+        return float(value)
+    if typecode == 'q':
+        if isinstance(value, str):
+            return int(value)
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError('Not an integer: ' + str(value))
+        return int(value)
+    if isinstance(value, str):
+        return _BOOLEANS[value.lower()]
+    return 1 if value else 0
+
+
+def _import_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('NumPy is required for columnar export. Install it with "pip install numpy".')
+
+
+def _import_pyarrow():
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('pyarrow is required for Arrow and Parquet export. Install it with "pip install pyarrow".')
+
+
+def _frombuffer(values: array, dtype):
+    if len(values) == 0:
+        return numpy.empty(0, dtype=dtype)
+    return numpy.frombuffer(values, dtype=dtype)
+
+
+def _dictionary_array(column: _DictionaryColumn):
+    indices = pyarrow.array(_frombuffer(column.codes, numpy.int32))
+    return pyarrow.DictionaryArray.from_arrays(indices, pyarrow.array(column.dictionary, type=pyarrow.string()))
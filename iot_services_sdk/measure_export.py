@@ -0,0 +1,129 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .utils import to_milli_time, format_timestamp
+
+
+class MeasureExporter(object):
+    """Downloads the measures of a device for a time range by splitting it into windows which are fetched in parallel.
+
+    Windows are sized adaptively: the record density of finished windows determines the length of the next ones,
+    and windows that hit the page size are split in half and fetched again. Measures are yielded in timestamp order.
+    """
+
+    def __init__(self, device_service, max_workers: int = 8, page_size: int = 1000, initial_window: int = 3600000):
+        """Instantiate MeasureExporter object
+
+        Arguments:
+            device_service {DeviceService} -- The device service used to download the measures
+
+        Keyword Arguments:
+            max_workers {int} -- Number of windows fetched concurrently (default: {8})
+            page_size {int} -- Maximum number of measures requested per window (default: {1000})
+            initial_window {int} -- Length of the first windows in milliseconds (default: {3600000})
+        """
+        if max_workers < 1 or page_size < 1 or initial_window < 1:
+            raise ValueError('max_workers, page_size and initial_window must be positive.')
+
+        self.device_service = device_service
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.initial_window = initial_window
+
+        # Windows are sized to be half full, which leaves room for bursts without splitting
+        self._target_records = max(1, page_size // 2)
+
+    def export(self, device_id: str, start, end, filters=None):
+        """Yields the measures of the device in the time range [start, end) in timestamp order.
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            start {int|datetime|str} -- Start of the time range (inclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+            end {int|datetime|str} -- End of the time range (exclusive), UNIX time in milliseconds, datetime or ISO 8601 string
+
+        Keyword Arguments:
+            filters {list} -- Additional filters, e.g. ["capabilityId eq '111'"] (default: {None})
+
+        Yields:
+            dict -- The measures of the device
+        """
+        start = to_milli_time(start)
+        end = to_milli_time(end)
+        if start >= end:
+            return
+
+        window_size = min(self.initial_window, end - start)
+        cursor = start
+        pending = deque()
+        # The windows are fetched in the trace context of the caller
+        fetch_window = tracing.wrap(self._fetch_window)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while cursor < end or pending:
+                    while cursor < end and len(pending) < self.max_workers:
+                        window_end = min(cursor + window_size, end)
+                        pending.append((cursor, window_end, executor.submit(
+                            fetch_window, device_id, cursor, window_end, filters)))
+                        cursor = window_end
+
+                    window_start, window_end, future = pending.popleft()
+                    measures, saturated = future.result()
+
+                    if saturated:
+                        # Too many records for a single page. Split the window and fetch both halves again.
+                        middle = window_start + (window_end - window_start) // 2
+                        pending.appendleft((middle, window_end, executor.submit(
+                            fetch_window, device_id, middle, window_end, filters)))
+                        pending.appendleft((window_start, middle, executor.submit(
+                            fetch_window, device_id, window_start, middle, filters)))
+                        window_size = max(1, min(window_size, middle - window_start))
+                        continue
+
+                    window_size = self._next_window_size(window_size, window_end - window_start, len(measures))
+                    window_size = min(window_size, max(1, end - cursor))
+
+                    measures.sort(key=_measure_timestamp)
+                    yield from measures
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def _next_window_size(self, window_size: int, length: int, count: int) -> int:
+        if count == 0:
+            return window_size * 4
+        estimated = int(length * self._target_records / count)
+        return max(1, min(estimated, window_size * 4))
+
+    def _fetch_window(self, device_id: str, start: int, end: int, filters=None):
+        window_filters = ["timestamp ge '" + format_timestamp(start) + "'",
+                          "timestamp lt '" + format_timestamp(end) + "'"]
+        if filters is not None:
+            window_filters += filters
+
+        if end - start > 1:
+            measures = self._fetch_page(device_id, window_filters, 0)
+            return measures, len(measures) >= self.page_size
+
+        # A single millisecond cannot be split any further, page through it instead
+        measures = []
+        while True:
+            page = self._fetch_page(device_id, window_filters, len(measures))
+            measures += page
+            if len(page) < self.page_size:
+                return measures, False
+
+    def _fetch_page(self, device_id: str, filters: list, skip: int) -> list:
+        response = self.device_service.get_measures(device_id, filters=filters, orderby='timestamp', asc=True,
+                                                    skip=str(skip) if skip > 0 else None, top=str(self.page_size))
+        return list(response.iter_result())
+
+
+def _measure_timestamp(measure) -> int:
+    timestamp = measure.get('timestamp')
+    if timestamp is None:
+        return 0
+    return to_milli_time(timestamp)
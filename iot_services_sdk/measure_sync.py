@@ -0,0 +1,190 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .utils import to_milli_time, format_timestamp, get_measure_key
+
+
+class JsonLinesMeasureStore(object):
+    """Appends measures to one JSON Lines file per device"""
+
+    def __init__(self, directory: str):
+        """Instantiate JsonLinesMeasureStore object
+
+        Arguments:
+            directory {str} -- Directory the measure files are written to
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, device_id: str, measures: list):
+        """Appends measures to the file of the device
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            measures {list} -- The measures to append
+        """
+        path = os.path.join(self.directory, device_id + '.jsonl')
+        with open(path, 'a', encoding='utf-8') as measure_file:
+            for measure in measures:
+                measure_file.write(json.dumps(measure) + '\n')
+
+
+class MeasureSync(object):
+    """Incrementally downloads new measures of many devices.
+
+    The timestamp of the latest measure seen per device (the high-water mark) is persisted in a JSON state file,
+    together with the keys of the measures at exactly that timestamp as tie-breaker. Each poll only queries
+    measures newer than the high-water mark and skips the ones already seen.
+
+    High-water marks are kept in memory while devices are synchronized and written at most every save_interval
+    seconds and when a sync finishes. After a crash, the measures received since the last save are downloaded and
+    appended again.
+    """
+
+    def __init__(self, device_service, state_path: str, store, max_workers: int = 8, page_size: int = 1000,
+                 save_interval: float = 5.0):
+        """Instantiate MeasureSync object
+
+        Arguments:
+            device_service {DeviceService} -- The device service used to download the measures
+            state_path {str} -- Path of the JSON file the high-water marks are persisted in
+            store {object} -- Store the new measures are appended to. Must provide append(device_id, measures), e.g. JsonLinesMeasureStore.
+
+        Keyword Arguments:
+            max_workers {int} -- Number of devices synchronized concurrently (default: {8})
+            page_size {int} -- Maximum number of measures requested per page (default: {1000})
+            save_interval {float} -- Minimum number of seconds between two writes of the state file during a sync (default: {5.0})
+        """
+        self.device_service = device_service
+        self.state_path = state_path
+        self.store = store
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.save_interval = save_interval
+
+        self._lock = threading.Lock()
+        # Serializes writes of the state file, so that an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._state = self._load_state()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def get_high_water_mark(self, device_id: str) -> int:
+        """Returns the timestamp of the latest measure synchronized for the device
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            int -- UNIX time in milliseconds or None if the device has not been synchronized yet
+        """
+        with self._lock:
+            device_state = self._state.get(device_id)
+        return device_state['timestamp'] if device_state is not None else None
+
+    def sync(self, device_ids: list) -> dict:
+        """Downloads the measures of the devices which are newer than their high-water marks
+
+        Arguments:
+            device_ids {list} -- Unique identifiers of the devices
+
+        Returns:
+            dict -- Number of new measures per device id
+        """
+        sync_device = tracing.wrap(self._sync_device)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {device_id: executor.submit(sync_device, device_id) for device_id in device_ids}
+                return {device_id: future.result() for device_id, future in futures.items()}
+        finally:
+            self.save_state()
+
+    def sync_device(self, device_id: str) -> int:
+        """Downloads the measures of a single device which are newer than its high-water mark
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+
+        Returns:
+            int -- Number of new measures
+        """
+        try:
+            return self._sync_device(device_id)
+        finally:
+            self.save_state()
+
+    def save_state(self):
+        """Writes the high-water marks to the state file if they changed since the last write"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                content = json.dumps(self._state)
+                self._dirty = False
+                self._last_save = time.monotonic()
+            # Write to a temporary file first so that a crash never leaves a truncated state file behind
+            temp_path = self.state_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as state_file:
+                state_file.write(content)
+            os.replace(temp_path, self.state_path)
+
+    def _sync_device(self, device_id: str) -> int:
+        with self._lock:
+            device_state = self._state.get(device_id)
+        if device_state is None:
+            timestamp, seen_keys = None, set()
+        else:
+            timestamp, seen_keys = device_state['timestamp'], set(device_state['keys'])
+
+        filters = None
+        if timestamp is not None:
+            # Measures at the high-water mark itself are queried again, already seen ones are dropped via their keys
+            filters = ["timestamp gt '" + format_timestamp(timestamp - 1) + "'"]
+
+        count = 0
+        skip = 0
+        while True:
+            response = self.device_service.get_measures(device_id, filters=filters, orderby='timestamp', asc=True,
+                                                        skip=str(skip) if skip > 0 else None, top=str(self.page_size))
+            page = list(response.iter_result())
+            skip += len(page)
+
+            new_measures = []
+            for measure in page:
+                measure_timestamp = to_milli_time(measure['timestamp'])
+                key = get_measure_key(measure)
+                if timestamp is not None and measure_timestamp < timestamp:
+                    continue
+                if measure_timestamp == timestamp:
+                    if key in seen_keys:
+                        continue
+                    seen_keys.add(key)
+                else:
+                    timestamp, seen_keys = measure_timestamp, {key}
+                new_measures.append(measure)
+
+            if len(new_measures) > 0:
+                self.store.append(device_id, new_measures)
+                count += len(new_measures)
+                with self._lock:
+                    self._state[device_id] = {'timestamp': timestamp, 'keys': sorted(seen_keys)}
+                    self._dirty = True
+                    save = time.monotonic() - self._last_save >= self.save_interval
+                if save:
+                    self.save_state()
+
+            if len(page) < self.page_size:
+                return count
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
@@ -0,0 +1,513 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import heapq
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .utils import current_milli_time
+
+# MQTT 3.1.1 control packet types
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+class MockGateway(object):
+    """Local stand-in for the REST and MQTT Cloud Gateways.
+
+    The REST side accepts posts to /iot/gateway/rest/measures/<device> and /commands/<device> and answers with 202,
+    or with 207 if only some messages of a batch fail. The MQTT side is a minimal MQTT 3.1.1 broker which accepts
+    publishes to measures/<device> and answers each with a message on ack/<device> after ack_delay seconds. Commands
+    posted over REST, pushed with push_command or sent through the API of the linked MockIoTServer are delivered to
+    the subscribers of commands/<device>.
+
+    Connect the clients with RestClient(gateway.rest_instance, ...) and MQTTClient(gateway.mqtt_instance, ...).
+    """
+
+    def __init__(self, host: str = '127.0.0.1', rest_port: int = 0, mqtt_port: int = 0, latency: float = 0.0,
+                 ack_delay: float = 0.0, error_rate: float = 0.0, seed: int = None, server=None):
+        """Instantiate MockGateway object
+
+        Keyword Arguments:
+            host {str} -- Host to bind to (default: {'127.0.0.1'})
+            rest_port {int} -- Port of the REST gateway. 0 picks a free port. (default: {0})
+            mqtt_port {int} -- Port of the MQTT broker. 0 picks a free port. (default: {0})
+            latency {float} -- Seconds every REST post is delayed (default: {0.0})
+            ack_delay {float} -- Seconds after which MQTT measures are acknowledged (default: {0.0})
+            error_rate {float} -- Share of measure messages rejected with code 400 (default: {0.0})
+            seed {int} -- Seed for the error injection (default: {None})
+            server {MockIoTServer} -- If set, accepted measures of its devices are added to it and commands sent through its API are delivered (default: {None})
+        """
+        self.latency = latency
+        self.ack_delay = ack_delay
+        self.error_rate = error_rate
+        self.server = server
+
+        self.received = 0
+        self.rejected = 0
+        self.messages = []
+        self.commands = []
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._subscriptions_lock = threading.Lock()
+        self._scheduler = _Scheduler()
+        if server is not None:
+            server.on_command = self._deliver_command
+
+        self._rest_server = ThreadingHTTPServer((host, rest_port), _RestRequestHandler)
+        self._rest_server.daemon_threads = True
+        self._rest_server.gateway = self
+
+        self._mqtt_server = _ThreadingTCPServer((host, mqtt_port), _MQTTConnectionHandler)
+        self._mqtt_server.gateway = self
+
+        self._threads = []
+
+    @property
+    def rest_instance(self) -> str:
+        """The instance to pass to RestClient"""
+        host, port = self._rest_server.server_address[:2]
+        return 'http://' + host + ':' + str(port)
+
+    @property
+    def mqtt_instance(self) -> str:
+        """The instance to pass to MQTTClient"""
+        host, port = self._mqtt_server.server_address[:2]
+        return 'mqtt://' + host + ':' + str(port)
+
+    def start(self):
+        """Starts serving in background threads
+
+        Returns:
+            MockGateway -- The gateway itself
+        """
+        for server in (self._rest_server, self._mqtt_server):
+            thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._scheduler.start()
+        return self
+
+    def stop(self):
+        """Stops serving, closes all MQTT connections and releases the ports"""
+        self._scheduler.stop()
+        for server in (self._rest_server, self._mqtt_server):
+            server.shutdown()
+            server.server_close()
+        with self._subscriptions_lock:
+            connections = set(connection for subscribers in self._subscriptions.values() for connection in subscribers)
+        for connection in connections | self._mqtt_server.close_connections():
+            connection.close()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def push_command(self, device_alternate_id: str, command: dict):
+        """Sends a command to the MQTT subscribers of the device
+
+        Arguments:
+            device_alternate_id {str} -- Alternate ID of the device
+            command {dict} -- The command message, e.g. with sensorAlternateId, capabilityAlternateId and command
+        """
+        with self._lock:
+            self.commands.append((device_alternate_id, command))
+        self._publish('commands/' + device_alternate_id, json.dumps(command).encode('utf-8'))
+
+    def accept_measures(self, device_alternate_id: str, messages: list) -> list:
+        """Processes measure messages and returns their results, used by both gateways
+
+        Arguments:
+            device_alternate_id {str} -- Alternate ID of the device
+            messages {list} -- Measure messages with capabilityAlternateId, sensorAlternateId and measures
+
+        Returns:
+            list -- Result per message with the keys code and messages
+        """
+        results = []
+        accepted = []
+        with self._lock:
+            for message in messages:
+                if self.error_rate > 0 and self._random.random() < self.error_rate:
+                    self.rejected += 1
+                    results.append({'code': 400, 'messages': ['Injected error']})
+                else:
+                    self.received += 1
+                    self.messages.append((device_alternate_id, message))
+                    accepted.append(message)
+                    results.append({'code': 202, 'messages': []})
+
+        if self.server is not None and len(accepted) > 0:
+            self._forward(device_alternate_id, accepted)
+        return results
+
+    def _forward(self, device_alternate_id: str, messages: list):
+        device = next((device for device in self.server.get_collection('devices')
+                       if device.get('alternateId') == device_alternate_id), None)
+        if device is None:
+            return
+        measures = []
+        for message in messages:
+            for values in message.get('measures') or []:
+                measures.append({'capabilityId': message.get('capabilityAlternateId'),
+                                 'sensorId': message.get('sensorAlternateId'),
+                                 'timestamp': message.get('timestamp', current_milli_time()), 'measure': values})
+        self.server.add_measures(device['id'], measures)
+
+    def _deliver_command(self, device: dict, body):
+        body = body if isinstance(body, dict) else {}
+        capability = self._find_entity('capabilities', body.get('capabilityId'))
+        sensor = self._find_entity('sensors', body.get('sensorId'))
+        self.push_command(device['alternateId'], {
+            'capabilityAlternateId': capability['alternateId'] if capability is not None else body.get('capabilityId'),
+            'sensorAlternateId': sensor['alternateId'] if sensor is not None else body.get('sensorId'),
+            'command': body.get('command'),
+        })
+
+    def _find_entity(self, collection: str, entity_id: str):
+        return next((entity for entity in self.server.get_collection(collection) if entity['id'] == entity_id), None)
+
+    def _on_publish(self, topic: str, payload: bytes):
+        if not topic.startswith('measures/'):
+            return
+        device_alternate_id = topic[len('measures/'):]
+        try:
+            message = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            message = None
+
+        if isinstance(message, dict):
+            result = self.accept_measures(device_alternate_id, [message])[0]
+        else:
+            result = {'code': 400, 'messages': ['Invalid JSON']}
+        ack = dict(result, id=message.get('measureMessageId') if isinstance(message, dict) else None)
+        ack_payload = json.dumps([ack]).encode('utf-8')
+        self._scheduler.schedule(self.ack_delay, self._publish, 'ack/' + device_alternate_id, ack_payload)
+
+    def _subscribe(self, connection, topic_filter: str):
+        with self._subscriptions_lock:
+            self._subscriptions.setdefault(topic_filter, set()).add(connection)
+
+    def _unsubscribe(self, connection, topic_filter: str = None):
+        with self._subscriptions_lock:
+            for current_filter, subscribers in list(self._subscriptions.items()):
+                if topic_filter is None or current_filter == topic_filter:
+                    subscribers.discard(connection)
+                    if len(subscribers) == 0:
+                        del self._subscriptions[current_filter]
+
+    def _publish(self, topic: str, payload: bytes):
+        with self._subscriptions_lock:
+            # Filters without wildcards are looked up directly, so a fleet of devices does not make every ack scan
+            # the subscriptions of all others
+            subscribers = set(self._subscriptions.get(topic, ()))
+            for topic_filter, connections in self._subscriptions.items():
+                if ('+' in topic_filter or '#' in topic_filter) and topic_matches(topic_filter, topic):
+                    subscribers |= connections
+        for connection in subscribers:
+            connection.send_publish(topic, payload)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Returns whether the topic matches the MQTT topic filter with + and # wildcards
+
+    Arguments:
+        topic_filter {str} -- The topic filter
+        topic {str} -- The topic
+
+    Returns:
+        bool -- True if it matches
+    """
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for idx, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if idx >= len(topic_levels) or (level != '+' and level != topic_levels[idx]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Scheduler(object):
+    """Runs delayed calls, e.g. acks, on a single thread"""
+
+    def __init__(self):
+        self._queue = []
+        self._counter = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def schedule(self, delay: float, func, *args):
+        with self._condition:
+            self._counter += 1
+            heapq.heappush(self._queue, (time.monotonic() + delay, self._counter, func, args))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (len(self._queue) == 0 or self._queue[0][0] > time.monotonic()):
+                    timeout = self._queue[0][0] - time.monotonic() if len(self._queue) > 0 else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                _, _, func, args = heapq.heappop(self._queue)
+            try:
+                func(*args)
+            except OSError:
+                pass
+
+
+class _RestRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    gateway_path = '/iot/gateway/rest'
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+
+        if gateway.latency > 0:
+            time.sleep(gateway.latency)
+
+        path = self.path.split('?')[0]
+        if not path.startswith(self.gateway_path + '/'):
+            return self._send(404, [{'code': 404, 'messages': ['Not found']}])
+        kind, _, device_alternate_id = path[len(self.gateway_path) + 1:].partition('/')
+
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return self._send(400, [{'code': 400, 'messages': ['Invalid JSON']}])
+
+        if kind == 'commands':
+            gateway.push_command(device_alternate_id, payload)
+            return self._send(202, [{'code': 202, 'messages': []}])
+        if kind != 'measures':
+            return self._send(404, [{'code': 404, 'messages': ['Not found']}])
+
+        messages = payload if isinstance(payload, list) else [payload]
+        results = gateway.accept_measures(device_alternate_id, messages)
+        failed = sum(1 for result in results if result['code'] != 202)
+        if failed == 0:
+            status = 202
+        elif failed == len(results):
+            status = 400
+        else:
+            status = 207
+        self._send(status, results)
+
+    def setup(self):
+        super(_RestRequestHandler, self).setup()
+        # Headers and body are written separately, which stalls on delayed ACKs unless Nagle is switched off
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, result):
+        content = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Fleets of simulated devices connect at once, which overflows the default backlog of 5
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        self.closing = False
+        super(_ThreadingTCPServer, self).__init__(*args, **kwargs)
+
+    def add_connection(self, connection) -> bool:
+        # Returns False if the server is closing, since stop() may already have taken its copy of the connections
+        with self.connections_lock:
+            if self.closing:
+                return False
+            self.connections.add(connection)
+            return True
+
+    def remove_connection(self, connection):
+        with self.connections_lock:
+            self.connections.discard(connection)
+
+    def close_connections(self) -> set:
+        # Returns a copy of the open connections and refuses new ones
+        with self.connections_lock:
+            self.closing = True
+            return set(self.connections)
+
+
+class _MQTTConnectionHandler(socketserver.BaseRequestHandler):
+    """Speaks the subset of MQTT 3.1.1 used by the SDK. Messages to clients are always sent with QoS 0."""
+
+    def setup(self):
+        self.gateway = self.server.gateway
+        self.client_id = None
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self.server.add_connection(self):
+            self.close()
+
+    def handle(self):
+        try:
+            while not self._closed:
+                packet = self._read_packet()
+                if packet is None:
+                    return
+                packet_type, flags, body = packet
+                if not self._dispatch(packet_type, flags, body):
+                    return
+        except (OSError, ValueError, struct.error):
+            return
+
+    def finish(self):
+        self.gateway._unsubscribe(self)
+        self.server.remove_connection(self)
+        self.close()
+
+    def close(self):
+        self._closed = True
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.request.close()
+
+    def send_publish(self, topic: str, payload: bytes):
+        self._write(PUBLISH << 4, _encode_string(topic) + payload)
+
+    def _dispatch(self, packet_type: int, flags: int, body: bytes) -> bool:
+        if packet_type == CONNECT:
+            self.client_id = self._parse_connect(body)
+            self._write(CONNACK << 4, b'\x00\x00')
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _decode_string(body, 0)
+            packet_id = None
+            if qos > 0:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+            self.gateway._on_publish(topic, body[offset:])
+            if qos == 1:
+                self._write(PUBACK << 4, packet_id)
+            elif qos == 2:
+                self._write(PUBREC << 4, packet_id)
+        elif packet_type == PUBREL:
+            self._write(PUBCOMP << 4, body[:2])
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            granted = bytearray()
+            while offset < len(body):
+                topic_filter, offset = _decode_string(body, offset)
+                granted.append(min(body[offset], 1))
+                offset += 1
+                self.gateway._subscribe(self, topic_filter)
+            self._write((SUBACK << 4), packet_id + bytes(granted))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                topic_filter, offset = _decode_string(body, offset)
+                self.gateway._unsubscribe(self, topic_filter)
+            self._write(UNSUBACK << 4, packet_id)
+        elif packet_type == PINGREQ:
+            self._write(PINGRESP << 4, b'')
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _parse_connect(self, body: bytes) -> str:
+        _, offset = _decode_string(body, 0)
+        # Protocol level, connect flags and keep alive
+        offset += 4
+        client_id, _ = _decode_string(body, offset)
+        return client_id
+
+    def _read_packet(self):
+        header = self._read_exactly(1)
+        if header is None:
+            return None
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self._read_exactly(1)
+            if byte is None:
+                return None
+            length += (byte[0] & 0x7F) * multiplier
+            if byte[0] & 0x80 == 0:
+                break
+            multiplier *= 128
+        body = self._read_exactly(length) if length > 0 else b''
+        if body is None:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _read_exactly(self, size: int):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if len(chunk) == 0:
+                return None
+            data += chunk
+        return bytes(data)
+
+    def _write(self, header: int, body: bytes):
+        packet = bytes([header]) + _encode_length(len(body)) + body
+        with self._write_lock:
+            if not self._closed:
+                self.request.sendall(packet)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length > 0:
+            byte |= 0x80
+        encoded.append(byte)
+        if length == 0:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    return struct.pack('!H', len(encoded)) + encoded
+
+
+def _decode_string(data: bytes, offset: int):
+    length = struct.unpack_from('!H', data, offset)[0]
+    offset += 2
+    return data[offset:offset + length].decode('utf-8'), offset + length
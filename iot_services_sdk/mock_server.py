@@ -0,0 +1,487 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import base64
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .utils import to_milli_time, current_milli_time, format_timestamp
+
+_FILTER_PATTERN = re.compile(r"^\s*(\w+)\s+(eq|ne|gt|ge|lt|le)\s+'(.*)'\s*$")
+
+# Tenant-scoped collections and the collections at the top level of the API
+TENANT_COLLECTIONS = ('devices', 'sensors', 'sensorTypes', 'capabilities', 'gateways', 'protocols', 'vendors')
+ROOT_COLLECTIONS = ('tenants', 'users')
+
+
+class MockIoTServer(object):
+    """Local stand-in for the Device Management API (/iot/core/api/v1) with in-memory state.
+
+    Meant for offline tests and reproducible benchmarks: point any service at the instance of the server, e.g.
+    DeviceService(server.instance, 'user', 'password', server.tenant_id). Collections support filter, orderby, skip
+    and top, the count endpoints and custom properties. Each request can be delayed by a fixed latency and failed
+    with a configurable error rate, or the next requests can be failed explicitly with fail_next.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, tenant_id: str = '1', user: str = None,
+                 password: str = None, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 seed: int = None):
+        """Instantiate MockIoTServer object
+
+        Keyword Arguments:
+            host {str} -- Host to bind to (default: {'127.0.0.1'})
+            port {int} -- Port to bind to. 0 picks a free port. (default: {0})
+            tenant_id {str} -- Id of the tenant created upfront (default: {'1'})
+            user {str} -- If set, requests must authenticate with this user (default: {None})
+            password {str} -- Password of the user (default: {None})
+            latency {float} -- Seconds every request is delayed (default: {0.0})
+            error_rate {float} -- Share of requests failed with error_status (default: {0.0})
+            error_status {int} -- Status code of injected errors (default: {503})
+            seed {int} -- Seed for the error injection (default: {None})
+        """
+        self.tenant_id = tenant_id
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+        self.requests = 0
+        self.measures = {}
+        self.commands = {}
+        self.certificates = {}
+        # Called with the device and the body of every command sent through the API, e.g. by a MockGateway
+        self.on_command = None
+
+        self._collections = {}
+        self._next_id = 1
+        self._failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+        self._server = ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+        self.create('tenants', {'id': tenant_id, 'name': 'mock'})
+        self.create('protocols', {'id': 'rest', 'name': 'REST'}, tenant_id)
+        self.create('protocols', {'id': 'mqtt', 'name': 'MQTT'}, tenant_id)
+        self.create('gateways', {'name': 'Cloud Gateway REST', 'protocolId': 'rest', 'status': 'online'}, tenant_id)
+        self.create('gateways', {'name': 'Cloud Gateway MQTT', 'protocolId': 'mqtt', 'status': 'online'}, tenant_id)
+
+    @property
+    def instance(self) -> str:
+        """The instance to pass to the services, i.e. the base URL of the server"""
+        host, port = self._server.server_address[:2]
+        return 'http://' + host + ':' + str(port)
+
+    def start(self):
+        """Starts serving in a background thread
+
+        Returns:
+            MockIoTServer -- The server itself
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and releases the port"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def fail_next(self, count: int = 1, status: int = 503, retry_after: float = None):
+        """Fails the next requests regardless of the error rate
+
+        Keyword Arguments:
+            count {int} -- Number of requests to fail (default: {1})
+            status {int} -- Status code (default: {503})
+            retry_after {float} -- Value of the Retry-After header in seconds (default: {None})
+        """
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def create(self, collection: str, entity: dict, tenant_id: str = None) -> dict:
+        """Adds an entity, assigning id and alternateId if missing
+
+        Arguments:
+            collection {str} -- Name of the collection, e.g. devices
+            entity {dict} -- The entity
+
+        Keyword Arguments:
+            tenant_id {str} -- Tenant of tenant-scoped collections (default: {None})
+
+        Returns:
+            dict -- The stored entity
+        """
+        with self._lock:
+            entity = dict(entity)
+            if entity.get('id') is None:
+                entity['id'] = str(self._next_id)
+                self._next_id += 1
+            if collection not in ROOT_COLLECTIONS and entity.get('alternateId') is None:
+                entity['alternateId'] = uuid.uuid4().hex
+            if entity.get('customProperties') is None:
+                entity['customProperties'] = []
+            if collection == 'devices':
+                entity.setdefault('online', True)
+                entity.setdefault('sensors', [])
+            self._get_collection(collection, tenant_id)[entity['id']] = entity
+            return entity
+
+    def add_measures(self, device_id: str, measures: list):
+        """Adds measures of a device as returned by the measures endpoint
+
+        Arguments:
+            device_id {str} -- Unique identifier of a device
+            measures {list} -- Dicts with capabilityId, sensorId, timestamp (UNIX time in milliseconds or ISO string) and measure
+        """
+        with self._lock:
+            stored = self.measures.setdefault(device_id, [])
+            for measure in measures:
+                measure = dict(measure, deviceId=device_id)
+                measure['timestamp'] = format_timestamp(to_milli_time(measure.get('timestamp', current_milli_time())))
+                stored.append(measure)
+
+    def get_collection(self, collection: str, tenant_id: str = None) -> list:
+        """Returns the entities of a collection
+
+        Arguments:
+            collection {str} -- Name of the collection, e.g. devices
+
+        Keyword Arguments:
+            tenant_id {str} -- Tenant of tenant-scoped collections (default: {None})
+
+        Returns:
+            list -- The entities
+        """
+        with self._lock:
+            return list(self._get_collection(collection, tenant_id).values())
+
+    def _get_collection(self, collection: str, tenant_id: str = None) -> dict:
+        if collection in TENANT_COLLECTIONS and tenant_id is None:
+            tenant_id = self.tenant_id
+        if collection in ROOT_COLLECTIONS:
+            tenant_id = None
+        return self._collections.setdefault((tenant_id, collection), {})
+
+    def _next_failure(self):
+        with self._lock:
+            self.requests += 1
+            if len(self._failures) > 0:
+                return self._failures.pop(0)
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                return self.error_status, None
+        return None
+
+    def handle(self, method: str, path: str, query: dict, body):
+        """Answers a request against the API
+
+        Arguments:
+            method {str} -- HTTP method
+            path {str} -- Path below /iot/core/api/v1
+            query {dict} -- Query parameters
+            body {object} -- Decoded JSON body, raw text or None
+
+        Returns:
+            int -- Status code
+            object -- Result, serialized as JSON unless it is a string
+        """
+        segments = [unquote(segment) for segment in path.strip('/').split('/') if segment != '']
+        if len(segments) == 0:
+            return 404, _error('Not found')
+
+        if segments == ['about']:
+            return 200, {'version': 'mock', 'instance': self.instance}
+        if segments == ['me']:
+            return 200, {'name': self.user}
+        if segments == ['logout']:
+            return 200, {}
+
+        tenant_id = None
+        if segments[0] == 'tenant':
+            if len(segments) < 3:
+                return 404, _error('Not found')
+            tenant_id, segments = segments[1], segments[2:]
+            if segments[0] not in TENANT_COLLECTIONS:
+                return 404, _error('Not found')
+        elif segments[0] not in ROOT_COLLECTIONS:
+            return 404, _error('Not found')
+
+        with self._lock:
+            return self._handle_collection(method, segments, query, body, tenant_id)
+
+    def _handle_collection(self, method, segments, query, body, tenant_id):
+        collection = self._get_collection(segments[0], tenant_id)
+
+        if len(segments) == 1:
+            if method == 'GET':
+                return 200, _apply_query(list(collection.values()), query)
+            if method == 'POST':
+                return 200, self.create(segments[0], body or {}, tenant_id)
+            return 405, _error('Method not allowed')
+
+        if segments[1] == 'count' and len(segments) == 2:
+            return 200, {'count': len(_apply_query(list(collection.values()), {'filter': query.get('filter')}))}
+
+        entity = collection.get(segments[1])
+        if entity is None:
+            return 404, _error(segments[0] + ' with id ' + segments[1] + ' not found')
+
+        if len(segments) == 2:
+            if method == 'GET':
+                return 200, entity
+            if method == 'PUT':
+                entity.update(body or {})
+                return 200, entity
+            if method == 'DELETE':
+                del collection[segments[1]]
+                return 200, None
+            return 405, _error('Method not allowed')
+
+        if segments[0] == 'devices' and segments[2] == 'measures':
+            return 200, _apply_query(list(self.measures.get(entity['id'], [])), query)
+        if segments[0] == 'devices' and segments[2] == 'commands' and method == 'POST':
+            self.commands.setdefault(entity['id'], []).append(body)
+            if self.on_command is not None:
+                self.on_command(entity, body)
+            return 200, {}
+        if segments[2] == 'authentications' or segments[2] == 'gatewayRegistrations':
+            return self._handle_certificates(method, segments[3:], entity)
+        if segments[0] == 'gateways' and segments[2] == 'configuration':
+            if method == 'PUT':
+                entity['configuration'] = body
+                return 200, None
+            return 200, entity.get('configuration', '<configuration/>')
+        if segments[0] == 'tenants' and segments[2] == 'trustedCACertificates':
+            return 200, entity.get('trustedCACertificates', [])
+
+        return self._handle_items(method, segments[2:], entity, body)
+
+    def _handle_items(self, method, segments, entity, body):
+        # Generic handling of lists within an entity, e.g. customProperties, capabilities or bundles
+        items = entity.setdefault(segments[0], [])
+        if len(segments) == 1:
+            if method == 'GET':
+                return 200, items
+            if method == 'POST':
+                item = dict(body) if isinstance(body, dict) else {'value': body}
+                items.append(item)
+                return 200, entity
+            return 405, _error('Method not allowed')
+
+        item = next((item for item in items if segments[1] in (item.get('key'), item.get('id'))), None)
+        if item is None:
+            return 404, _error(segments[0] + ' ' + segments[1] + ' not found')
+        if len(segments) > 2 and method == 'POST':
+            item['state'] = segments[2]
+            return 200, item
+        if method == 'GET':
+            return 200, item
+        if method == 'PUT':
+            item.update(body or {})
+            return 200, entity
+        if method == 'DELETE':
+            items.remove(item)
+            return 200, entity
+        return 405, _error('Method not allowed')
+
+    def _handle_certificates(self, method, segments, entity):
+        certificates = self.certificates.setdefault(entity['id'], [])
+        if segments == ['clientCertificate'] and method == 'GET':
+            return 200, [{'fingerprint': cert['fingerprint'], 'expiry': cert['expiry']} for cert in certificates]
+        if segments == ['clientCertificate', 'pem'] or segments == ['clientCertificate', 'p12']:
+            # Every download issues a new certificate, like the API does. The certificate has the structure and
+            # validity of a real one, but its key and signature are placeholders.
+            secret = uuid.uuid4().hex
+            expiry = current_milli_time() // 1000 * 1000 + 365 * 24 * 3600 * 1000
+            der = _create_certificate(expiry)
+            content = base64.b64encode(der).decode('ascii')
+            fingerprint = hashlib.sha256(der).hexdigest()
+            certificates.append({'fingerprint': fingerprint, 'expiry': format_timestamp(expiry)})
+            if segments[1] == 'pem':
+                return 200, {'pem': '-----BEGIN CERTIFICATE-----\n' + content + '\n-----END CERTIFICATE-----\n',
+                             'secret': secret}
+            return 200, {'p12': content, 'secret': secret}
+        if len(segments) == 2 and method == 'DELETE':
+            certificates[:] = [cert for cert in certificates if cert['fingerprint'] != segments[1].lower()]
+            return 200, None
+        return 404, _error('Not found')
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    api_path = '/iot/core/api/v1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def setup(self):
+        super(_MockRequestHandler, self).setup()
+        # Headers and body are written separately, which stalls on delayed ACKs unless Nagle is switched off
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        mock = self.server.mock
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length > 0 else b''
+
+        if mock.latency > 0:
+            time.sleep(mock.latency)
+
+        failure = mock._next_failure()
+        if failure is not None:
+            status, retry_after = failure
+            headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+            return self._send(status, _error('Injected error'), headers)
+
+        if mock.user is not None and not self._is_authorized(mock):
+            return self._send(401, _error('Unauthorized'), {'WWW-Authenticate': 'Basic realm="mock"'})
+
+        parts = urlsplit(self.path)
+        if not parts.path.startswith(self.api_path):
+            return self._send(404, _error('Not found'))
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        body = None
+        if len(raw_body) > 0:
+            try:
+                body = json.loads(raw_body.decode('utf-8'))
+            except ValueError:
+                body = raw_body.decode('utf-8', 'replace')
+
+        status, result = mock.handle(method, parts.path[len(self.api_path):], query, body)
+
+        headers = {}
+        if method == 'GET' and status == 200:
+            content = _encode(result)
+            etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, None, headers)
+        self._send(status, result, headers)
+
+    def _is_authorized(self, mock) -> bool:
+        authorization = self.headers.get('Authorization') or ''
+        if not authorization.startswith('Basic '):
+            return False
+        expected = base64.b64encode((mock.user + ':' + (mock.password or '')).encode('utf-8')).decode('ascii')
+        return authorization[len('Basic '):] == expected
+
+    def _send(self, status, result, headers=None):
+        content = _encode(result) if status != 304 else b''
+        self.send_response(status)
+        is_text = isinstance(result, str)
+        self.send_header('Content-Type', 'application/xml' if is_text else 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _encode(result) -> bytes:
+    if result is None:
+        return b''
+    if isinstance(result, str):
+        return result.encode('utf-8')
+    return json.dumps(result).encode('utf-8')
+
+
+def _error(message: str) -> dict:
+    return {'message': message}
+
+
+def _apply_query(entities: list, query: dict) -> list:
+    filters = query.get('filter')
+    if filters:
+        for expression in re.split(r'\s+and\s+', filters):
+            match = _FILTER_PATTERN.match(expression)
+            if match is None:
+                continue
+            attribute, operator, value = match.groups()
+            entities = [entity for entity in entities
+                        if _compare(entity.get(attribute), operator, value, attribute == 'timestamp')]
+
+    orderby = query.get('orderby')
+    if orderby:
+        parts = orderby.split()
+        attribute = parts[0]
+        is_timestamp = attribute == 'timestamp'
+        entities.sort(key=lambda entity: _sort_value(entity.get(attribute), is_timestamp),
+                      reverse=len(parts) > 1 and parts[1] == 'desc')
+
+    skip = int(query.get('skip') or 0)
+    entities = entities[skip:]
+    if query.get('top') is not None:
+        entities = entities[:int(query['top'])]
+    return entities
+
+
+def _sort_value(value, is_timestamp):
+    if value is None:
+        return (0, '')
+    return (1, to_milli_time(value) if is_timestamp else str(value))
+
+
+def _compare(actual, operator, expected, is_timestamp) -> bool:
+    if actual is None:
+        return operator == 'ne'
+    if is_timestamp:
+        actual, expected = to_milli_time(actual), to_milli_time(expected)
+    else:
+        actual = str(actual).lower() if isinstance(actual, bool) else str(actual)
+    return {'eq': actual == expected, 'ne': actual != expected, 'gt': actual > expected,
+            'ge': actual >= expected, 'lt': actual < expected, 'le': actual <= expected}[operator]
+
+
+def _create_certificate(expiry: int) -> bytes:
+    # DER encoded X.509 certificate with a random serial number, valid until expiry (UNIX time in milliseconds)
+    algorithm = _der(0x30, _der(0x06, bytes.fromhex('2a864886f70d01010b')) + _der(0x05, b''))
+    name = _der(0x30, _der(0x31, _der(0x30, _der(0x06, bytes.fromhex('550403')) + _der(0x0c, b'mock'))))
+    validity = _der(0x30, _der(0x18, _generalized_time(current_milli_time())) + _der(0x18, _generalized_time(expiry)))
+    public_key = _der(0x30, _der(0x30, _der(0x06, bytes.fromhex('2a864886f70d010101')) + _der(0x05, b'')) +
+                      _der(0x03, b'\x00' + uuid.uuid4().bytes * 4))
+    tbs = _der(0x30, _der(0xa0, _der(0x02, b'\x02')) + _der(0x02, b'\x01' + uuid.uuid4().bytes) + algorithm + name +
+               validity + name + public_key)
+    return _der(0x30, tbs + algorithm + _der(0x03, b'\x00' + uuid.uuid4().bytes * 2))
+
+
+def _der(tag: int, content: bytes) -> bytes:
+    length = len(content)
+    if length < 0x80:
+        return bytes((tag, length)) + content
+    size = (length.bit_length() + 7) // 8
+    return bytes((tag, 0x80 | size)) + length.to_bytes(size, 'big') + content
+
+
+def _generalized_time(milli_time: int) -> bytes:
+    return time.strftime('%Y%m%d%H%M%SZ', time.gmtime(milli_time // 1000)).encode('ascii')
@@ -4,11 +4,17 @@ import ssl
 import json
 import uuid
 import time
+import threading
 from datetime import datetime
 import random
 import base64
 import paho.mqtt.client as mqtt
+from urllib.parse import urlsplit
 
+from . import tracing
+from .profiling import profiler, STAGE_MQTT_ACK, STAGE_MQTT_CALLBACK, STAGE_MQTT_DISPATCH, \
+    STAGE_MQTT_SERIALIZE, STAGE_MQTT_WRITE
+from .ssl_context import ssl_context_cache
 from .utils import current_milli_time
 
 
@@ -16,7 +22,7 @@ class PahoMQTT(mqtt.Client):
     """Overwrites the mqtt.Client class to work with password protected pem files
     """
 
-    def tls_set(self, ca_certs=None, pemfile=None, secret=None, tls_version=None):
+    def tls_set(self, ca_certs=None, pemfile=None, secret=None, tls_version=None, pem=None):
         """Configure network encryption and authentication options. Enables SSL/TLS support.
         ca_certs : a string path to the Certificate Authority certificate files
         that are to be treated as trusted by this client. If this is the only
@@ -39,60 +45,88 @@ class PahoMQTT(mqtt.Client):
         specified. By default TLS v1 is used. Previous versions (all versions
         beginning with SSL) are possible but not recommended due to possible
         security problems.
+        pem is the content of the PEM as bytes or string. If given, it is
+        loaded from memory instead of the pemfile.
         Must be called before connect() or connect_async()."""
-        if ssl is None:
-            raise ValueError('This platform has no SSL/TLS.')
+        # Contexts are shared by all clients with the same certificate, so the key is only decrypted once and
+        # reconnects can resume earlier TLS sessions
+        context = ssl_context_cache.get(pemfile, secret, tls_version=tls_version, verify=True, pem=pem)
+        self._tls_version = tls_version
 
-        if not hasattr(ssl, 'SSLContext'):
-            # Require Python version that has SSL context support in standard library
-            raise ValueError('Python 2.7.9 and 3.2 are the minimum supported versions for TLS.')
-
-        # Create SSLContext object
-        if tls_version is None:
-            tls_version = ssl.PROTOCOL_TLSv1
-            # If the python version supports it, use highest TLS version automatically
-            if hasattr(ssl, "PROTOCOL_TLS"):
-                tls_version = ssl.PROTOCOL_TLS
-        context = ssl.SSLContext(tls_version)
-
-        # Configure context
-        if pemfile is not None:
-            context.load_cert_chain(pemfile, password=secret)
+        self.tls_set_context(context)
 
-        context.verify_mode = ssl.CERT_REQUIRED
+        self.tls_insecure_set(False)
 
-        context.load_default_certs()
+    def set_certificate(self, pemfile: str = None, secret: str = None, pem=None, tls_version=None):
+        """Switches the client to another certificate, e.g. after a rotation
 
-        self.tls_set_context(context)
+        The current connection and its messages in flight are kept. The new certificate is used from the next
+        (re)connect on.
 
-        self.tls_insecure_set(False)
+        Keyword Arguments:
+            pemfile {str} -- Path to the PEM file (default: {None})
+            secret {str} -- Secret of the private key (default: {None})
+            pem {str|bytes} -- Content of the PEM, used instead of the pemfile (default: {None})
+            tls_version {int} -- TLS protocol version. If None, the version passed to tls_set is used. (default: {None})
+        """
+        if (pemfile is None and pem is None) or secret is None:
+            raise ValueError('Either "pemfile" or "secret" is missing')
+        if not hasattr(self, '_ssl_context') or not hasattr(self, '_ssl'):
+            raise RuntimeError('This version of paho-mqtt does not allow switching certificates. Create a new '
+                               'client with the new certificate instead.')
+        if tls_version is None:
+            tls_version = getattr(self, '_tls_version', None)
+        # tls_set_context only allows configuring TLS once, so the context is replaced directly. The private
+        # attributes exist in all paho-mqtt versions allowed by setup.py.
+        self._ssl_context = ssl_context_cache.get(pemfile, secret, tls_version=tls_version, verify=True, pem=pem)
+        self._ssl = True
 
 
 class MQTTClient(PahoMQTT):
     """Wrapper around the Paho MQTT Client to simplify its usage with the IoTS Cloud Gateway
     """
 
-    def __init__(self, instance: str, device_alternate_id: str, pemfile: str, secret: str):
+    # Seconds after which the span of a published message is ended as failed if no ack arrived
+    ack_span_timeout = 60.0
+
+    def __init__(self, instance: str, device_alternate_id: str, pemfile: str = None, secret: str = None, pem=None):
         """Instantiate MQTT Client configured for specified instance and device
         
         Arguments:
             instance {str} -- IoT Services instance
             device_alternate_id {str} -- The alternate id of the mqtt (router) device
             certfile_path {str} -- The certfile path for the mqtt (router) device
-            keyfile_path {str} -- The keyfile path for the mqtt (router) device
+            keyfile_path {str} -- The keyfile path for the mqtt (router) device. Instances with scheme mqtt:// are connected to without TLS and certificate.
+
+        Keyword Arguments:
+            pem {str|bytes} -- Content of the PEM as returned by get_device_pem, used instead of the pemfile (default: {None})
         """
         super(MQTTClient, self).__init__(client_id=device_alternate_id)
 
-        self.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2, pemfile=pemfile, secret=secret)
-
         self.host = instance
         self.port = 8883
+        use_tls = True
+        if '://' in instance:
+            # Brokers given with scheme, e.g. mqtt://localhost:1883 for a local mock gateway
+            parts = urlsplit(instance)
+            if parts.scheme not in ('mqtt', 'mqtts'):
+                raise ValueError('Unsupported scheme: ' + parts.scheme)
+            use_tls = parts.scheme == 'mqtts'
+            self.host = parts.hostname
+            self.port = parts.port or (8883 if use_tls else 1883)
+
+        if use_tls:
+            self.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2, pemfile=pemfile, secret=secret, pem=pem)
+
         self.device_alternate_id = device_alternate_id
 
         self._on_error = None
         self._on_command = None
         self._message_buffer = {}
         self._command_callbacks = {}
+        # Spans and deadlines of published messages which end when their ack arrives, only filled while tracing
+        self._ack_spans = {}
+        self._ack_spans_lock = threading.Lock()
 
     @property
     def on_error(self):
@@ -125,26 +159,85 @@ class MQTTClient(PahoMQTT):
         super(MQTTClient, self).connect(host=self.host, port=self.port, keepalive=keepalive)
         self._subscribe_ack()
 
+    def disconnect(self, *args, **kwargs):
+        """Disconnects from the broker. Acks of messages in flight will not arrive anymore, so their spans end."""
+        result = super(MQTTClient, self).disconnect(*args, **kwargs)
+        if len(self._ack_spans) > 0:
+            self._end_ack_spans('Disconnected before the acknowledgement arrived')
+        return result
+
+    def loop_misc(self):
+        """Handles keepalives and timeouts. Called by the network loop at least once per second."""
+        result = super(MQTTClient, self).loop_misc()
+        if len(self._ack_spans) > 0:
+            # Also ends the spans of a client which stopped publishing
+            self._end_ack_spans('No acknowledgement received', time.monotonic())
+        return result
+
+    def _sock_send(self, buf: bytes) -> int:
+        # All writes of paho-mqtt go through this method in the versions allowed by setup.py
+        started = profiler.start(STAGE_MQTT_WRITE) if profiler.enabled else None
+        try:
+            return super(MQTTClient, self)._sock_send(buf)
+        finally:
+            if started is not None:
+                profiler.stop(STAGE_MQTT_WRITE, started)
+
     def _subscribe_ack(self):
         service = 'ack/' + self.device_alternate_id
         self.message_callback_add(service, self._ack_message_handler)
         return super(MQTTClient, self).subscribe(service, 1)
 
     def _ack_message_handler(self, client, userdata, message):
+        started = profiler.start(STAGE_MQTT_ACK) if profiler.enabled else None
         message_infos = json.loads(message.payload.decode("utf-8"))
         report = []
         for msg_info in message_infos:
+            span = self._pop_ack_span(msg_info.get('id')) if len(self._ack_spans) > 0 else None
             if msg_info.get('code') != 200 and msg_info.get('code') != 202:
                 error = {
                     'message': self._message_buffer.get(msg_info.get('id')),
                     'error': ' '.join(msg_info.get('messages'))
                 }
                 report.append(error)
+                if span is not None:
+                    tracing.set_error(span, error['error'])
+            if span is not None:
+                span.set_attribute('iot.ack.code', msg_info.get('code'))
+                span.end()
             if msg_info.get('id') in self._message_buffer:
                 del self._message_buffer[msg_info.get('id')]
 
+        if started is not None:
+            profiler.stop(STAGE_MQTT_ACK, started)
         if len(report) > 0:
-            self.on_error(self, userdata, report)
+            self._call_application(self.on_error, userdata, report)
+
+    def _pop_ack_span(self, message_id: str):
+        with self._ack_spans_lock:
+            entry = self._ack_spans.pop(message_id, None)
+        return entry[0] if entry is not None else None
+
+    def _end_ack_spans(self, description: str, now: float = None):
+        # Ends all spans, or only those whose deadline passed before now. The spans are ordered by deadline.
+        with self._ack_spans_lock:
+            expired = []
+            for message_id, (span, deadline) in self._ack_spans.items():
+                if now is not None and deadline > now:
+                    break
+                expired.append(message_id)
+            spans = [self._ack_spans.pop(message_id)[0] for message_id in expired]
+        for span in spans:
+            tracing.set_error(span, description)
+            span.end()
+
+    def _call_application(self, callback, userdata, message):
+        started = profiler.start(STAGE_MQTT_CALLBACK) if profiler.enabled else None
+        try:
+            callback(self, userdata, message)
+        finally:
+            if started is not None:
+                profiler.stop(STAGE_MQTT_CALLBACK, started)
 
     def subscribe(self, device_alternate_id: str) -> (str, str):
         """Subscribe to a devices commands
@@ -161,8 +254,13 @@ class MQTTClient(PahoMQTT):
         return super(MQTTClient, self).subscribe(service, 1)
 
     def _command_message_handler(self, client, userdata, message):
+        started = profiler.start(STAGE_MQTT_DISPATCH) if profiler.enabled else None
         parsed_message = json.loads(message.payload.decode("utf-8"))
-        self.on_command(self, userdata, parsed_message)
+        if started is not None:
+            profiler.stop(STAGE_MQTT_DISPATCH, started)
+        with tracing.start_span('commands receive', kind=tracing.SPAN_KIND_CONSUMER,
+                                attributes={'messaging.system': 'mqtt', 'messaging.destination.name': message.topic}):
+            self._call_application(self.on_command, userdata, parsed_message)
 
     def publish(self, capability_alternate_id: str, sensor_alternate_id: str, measures: list,
                 device_alternate_id: str = None, timestamp: int = None) -> mqtt.MQTTMessageInfo:
@@ -178,6 +276,7 @@ class MQTTClient(PahoMQTT):
         Returns:
             mqtt.MQTTMessageInfo -- MQTT Message Info
         """
+        started = profiler.start(STAGE_MQTT_SERIALIZE) if profiler.enabled else None
         if device_alternate_id is None:
             device_alternate_id = self.device_alternate_id
 
@@ -196,4 +295,28 @@ class MQTTClient(PahoMQTT):
 
         self._message_buffer[measure_message_id] = payload
         payload_json = json.dumps(payload)
-        return super(MQTTClient, self).publish(service, payload=payload_json)
+        if started is not None:
+            profiler.stop(STAGE_MQTT_SERIALIZE, started)
+        if tracing.get_tracer() is None:
+            return super(MQTTClient, self).publish(service, payload=payload_json)
+
+        attributes = {'messaging.system': 'mqtt', 'messaging.destination.name': service,
+                      'messaging.message.id': measure_message_id}
+        now = time.monotonic()
+        if len(self._ack_spans) > 0:
+            self._end_ack_spans('No acknowledgement received', now)
+        with tracing.start_span('measures publish', kind=tracing.SPAN_KIND_PRODUCER, attributes=attributes):
+            # The ack may arrive on the network thread before publish returns, so its span has to exist beforehand
+            ack_span = tracing.start_detached_span('measures ack', kind=tracing.SPAN_KIND_CONSUMER,
+                                                   attributes=attributes)
+            if ack_span.is_recording():
+                with self._ack_spans_lock:
+                    self._ack_spans[measure_message_id] = (ack_span, now + self.ack_span_timeout)
+            info = super(MQTTClient, self).publish(service, payload=payload_json)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                # No ack will come for a message which was not sent
+                ack_span = self._pop_ack_span(measure_message_id)
+                if ack_span is not None:
+                    tracing.set_error(ack_span, mqtt.error_string(info.rc))
+                    ack_span.end()
+            return info
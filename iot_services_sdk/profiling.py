@@ -0,0 +1,147 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import itertools
+import threading
+import time
+
+STAGE_MQTT_SERIALIZE = 'mqtt.serialize'
+STAGE_MQTT_WRITE = 'mqtt.write'
+STAGE_MQTT_ACK = 'mqtt.ack'
+STAGE_MQTT_DISPATCH = 'mqtt.dispatch'
+STAGE_MQTT_CALLBACK = 'mqtt.callback'
+STAGE_REST_SERIALIZE = 'rest.serialize'
+STAGE_REST_REQUEST = 'rest.request'
+
+# Stages in which the application runs instead of the SDK
+APPLICATION_STAGES = frozenset([STAGE_MQTT_CALLBACK])
+
+
+class StageProfiler(object):
+    """Times the internal stages of the clients, e.g. serializing a message or writing it to the socket.
+
+    The profiler is off by default and can be switched on and off at runtime. While it is off, every hook costs a
+    single attribute lookup. To keep the overhead low in production, only every n-th call of each stage can be
+    timed.
+
+    Stages:
+        mqtt.serialize -- Building and encoding the payload in MQTTClient.publish
+        mqtt.write -- Writing to the (TLS) socket of the MQTT client
+        mqtt.ack -- Decoding acks and matching them with the published messages
+        mqtt.dispatch -- Decoding commands before they are passed to on_command
+        mqtt.callback -- Time spent in on_command and on_error, i.e. in the application
+        rest.serialize -- Building and encoding the payload of the REST client
+        rest.request -- Posting to the REST gateway including the wait for the response
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = 1
+        # Call counter per stage, so that stages which always run together are all sampled
+        self._calls = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def enable(self, sample_every: int = 1):
+        """Starts timing the stages. Results of earlier runs are kept until reset is called.
+
+        Keyword Arguments:
+            sample_every {int} -- Only every n-th call of each stage is timed (default: {1})
+        """
+        if sample_every < 1:
+            raise ValueError('sample_every must be at least 1')
+        self._calls = {}
+        self.sample_every = sample_every
+        self.enabled = True
+
+    def disable(self):
+        """Stops timing the stages"""
+        self.enabled = False
+
+    def start(self, stage: str) -> int:
+        """Returns the start time of a stage, or None if the call is not sampled
+
+        Arguments:
+            stage {str} -- One of the STAGE constants
+
+        Returns:
+            int -- Start time in nanoseconds, which is passed to stop
+        """
+        if self.sample_every > 1:
+            calls = self._calls.get(stage)
+            if calls is None:
+                calls = self._calls.setdefault(stage, itertools.count())
+            if next(calls) % self.sample_every != 0:
+                return None
+        return time.perf_counter_ns()
+
+    def stop(self, stage: str, started: int):
+        """Records the duration of a stage started with start
+
+        Arguments:
+            stage {str} -- One of the STAGE constants
+            started {int} -- Return value of start. If None, nothing is recorded.
+        """
+        if started is not None:
+            self.record(stage, time.perf_counter_ns() - started)
+
+    def record(self, stage: str, duration: int):
+        """Records the duration of a stage
+
+        Arguments:
+            stage {str} -- Name of the stage
+            duration {int} -- Duration in nanoseconds
+        """
+        with self._lock:
+            totals = self._stages.get(stage)
+            if totals is None:
+                totals = self._stages[stage] = [0, 0, 0]
+            totals[0] += 1
+            totals[1] += duration
+            if duration > totals[2]:
+                totals[2] = duration
+
+    def reset(self):
+        """Drops all recorded durations"""
+        with self._lock:
+            self._stages = {}
+
+    def get_report(self) -> list:
+        """Returns the breakdown of the recorded time by stage
+
+        Returns:
+            list -- One dict per stage, sorted by total time, with the keys stage, samples, total_seconds, mean_microseconds, max_microseconds, share of the time of all stages and application, which is True for stages in which the application runs
+        """
+        with self._lock:
+            stages = [(stage, list(totals)) for stage, totals in self._stages.items()]
+        total = sum(totals[1] for _, totals in stages)
+        report = [{
+            'stage': stage,
+            'samples': count,
+            'total_seconds': duration / 1e9,
+            'mean_microseconds': duration / count / 1e3,
+            'max_microseconds': maximum / 1e3,
+            'share': duration / total if total > 0 else 0.0,
+            'application': stage in APPLICATION_STAGES,
+        } for stage, (count, duration, maximum) in stages]
+        report.sort(key=lambda row: row['total_seconds'], reverse=True)
+        return report
+
+    def render(self) -> str:
+        """Returns the report as text table
+
+        Returns:
+            str -- The table
+        """
+        lines = ['%-16s %10s %12s %12s %12s %7s' % ('stage', 'samples', 'total ms', 'mean us', 'max us', 'share')]
+        for row in self.get_report():
+            lines.append('%-16s %10d %12.1f %12.1f %12.1f %6.1f%%' % (
+                row['stage'] + (' *' if row['application'] else ''), row['samples'], row['total_seconds'] * 1e3,
+                row['mean_microseconds'], row['max_microseconds'], row['share'] * 100.0))
+        if self.sample_every > 1:
+            lines.append('Every %d. call sampled' % self.sample_every)
+        lines.append('* time spent in the application')
+        return '\n'.join(lines) + '\n'
+
+
+# Profiler of all MQTT and REST clients
+profiler = StageProfiler()
@@ -0,0 +1,246 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+_TENANT_PATTERN = re.compile(r'/tenant/([^/?]+)')
+
+# Status codes signalling that the server is overloaded
+THROTTLE_STATUS_CODES = frozenset([429, 503])
+
+
+class AdaptiveTokenBucket(object):
+    """Token bucket whose rate follows the throttling signals of the server.
+
+    The rate is decreased multiplicatively on throttling and increased additively on success. Without an initial
+    rate the bucket does not limit at all until the server throttles for the first time; the rate then starts at
+    a fraction of the throughput observed so far.
+    """
+
+    def __init__(self, rate: float = None, burst: float = None, min_rate: float = 1.0, max_rate: float = None,
+                 increase: float = 1.0, decrease: float = 0.5):
+        """Instantiate AdaptiveTokenBucket object
+
+        Keyword Arguments:
+            rate {float} -- Initial rate in requests per second. If None, no limit applies until the first throttling. (default: {None})
+            burst {float} -- Maximum number of tokens. If None, one second worth of tokens. (default: {None})
+            min_rate {float} -- Lower bound for the rate (default: {1.0})
+            max_rate {float} -- Upper bound for the rate (default: {None})
+            increase {float} -- Requests per second added to the rate per second of successful requests (default: {1.0})
+            decrease {float} -- Factor the rate is multiplied with on throttling (default: {0.5})
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        self._tokens = self._capacity() if rate is not None else 0.0
+        self._last_refill = time.monotonic()
+        self._window_start = self._last_refill
+        self._window_count = 0
+        self._observed_rate = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._observe(now)
+                if self.rate is None:
+                    return
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """Increases the rate additively"""
+        with self._lock:
+            if self.rate is not None:
+                # Adding increase / rate per request adds roughly increase requests per second every second
+                self.rate += self.increase / self.rate
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+    def on_throttle(self):
+        """Decreases the rate multiplicatively"""
+        with self._lock:
+            if self.rate is None:
+                self.rate = max(self._observed_rate, self._window_count, self.min_rate)
+                self._tokens = 0.0
+                self._last_refill = time.monotonic()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, self._capacity())
+
+    def _capacity(self) -> float:
+        return self.burst if self.burst is not None else max(1.0, self.rate)
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity(), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _observe(self, now: float):
+        if now - self._window_start >= 1.0:
+            self._observed_rate = self._window_count / (now - self._window_start)
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+
+
+class AIMDConcurrencyLimiter(object):
+    """Limits the number of requests in flight with additive increase and multiplicative decrease.
+
+    The limit grows by one per limit successful requests and is halved on throttling or if the latency exceeds the
+    target, but at most once per cooldown so that a burst of failures of requests sent under the old limit only
+    counts once.
+    """
+
+    def __init__(self, initial_limit: int = 32, min_limit: int = 1, max_limit: int = 256, decrease: float = 0.5,
+                 latency_target: float = None, cooldown: float = 1.0):
+        """Instantiate AIMDConcurrencyLimiter object
+
+        Keyword Arguments:
+            initial_limit {int} -- Initial number of concurrent requests (default: {32})
+            min_limit {int} -- Lower bound for the limit (default: {1})
+            max_limit {int} -- Upper bound for the limit (default: {256})
+            decrease {float} -- Factor the limit is multiplied with on throttling (default: {0.5})
+            latency_target {float} -- Latency in seconds above which the limit is decreased. If None, only throttling decreases it. (default: {None})
+            cooldown {float} -- Minimum number of seconds between two decreases (default: {1.0})
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until the number of requests in flight is below the limit"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False, latency: float = None):
+        """Marks a request as finished and adapts the limit
+
+        Keyword Arguments:
+            throttled {bool} -- If set to true, the server signalled overload (default: {False})
+            latency {float} -- Latency of the request in seconds (default: {None})
+        """
+        with self._condition:
+            self.in_flight -= 1
+            too_slow = self.latency_target is not None and latency is not None and latency > self.latency_target
+            if throttled or too_slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class Governor(object):
+    """Rate and concurrency limits of a transport, kept separately for each tenant or instance"""
+
+    def __init__(self, rate: float = None, burst: float = None, max_rate: float = None, initial_concurrency: int = 32,
+                 max_concurrency: int = 256, latency_target: float = None):
+        """Instantiate Governor object
+
+        Keyword Arguments:
+            rate {float} -- Initial rate in requests per second. If None, the rate is only limited after the first throttling. (default: {None})
+            burst {float} -- Maximum burst of requests (default: {None})
+            max_rate {float} -- Upper bound for the rate in requests per second (default: {None})
+            initial_concurrency {int} -- Initial number of concurrent requests (default: {32})
+            max_concurrency {int} -- Upper bound for the number of concurrent requests (default: {256})
+            latency_target {float} -- Latency in seconds above which the concurrency is decreased (default: {None})
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+
+        self._scopes = {}
+        self._lock = threading.Lock()
+
+    def get_limits(self, url: str):
+        """Returns the token bucket and concurrency limiter for the scope of the URL
+
+        Arguments:
+            url {str} -- URL of the request
+
+        Returns:
+            AdaptiveTokenBucket -- The token bucket of the scope
+            AIMDConcurrencyLimiter -- The concurrency limiter of the scope
+        """
+        scope = get_scope(url)
+        with self._lock:
+            limits = self._scopes.get(scope)
+            if limits is None:
+                limits = (AdaptiveTokenBucket(rate=self.rate, burst=self.burst, max_rate=self.max_rate),
+                          AIMDConcurrencyLimiter(initial_limit=self.initial_concurrency,
+                                                 max_limit=self.max_concurrency, latency_target=self.latency_target))
+                self._scopes[scope] = limits
+            return limits
+
+    def acquire(self, url: str):
+        """Waits until a request to the URL may be sent
+
+        Arguments:
+            url {str} -- URL of the request
+        """
+        bucket, limiter = self.get_limits(url)
+        limiter.acquire()
+        try:
+            bucket.acquire()
+        except BaseException:
+            limiter.release()
+            raise
+
+    def release(self, url: str, status_code: int = None, latency: float = None):
+        """Reports the outcome of a request to the URL
+
+        Arguments:
+            url {str} -- URL of the request
+
+        Keyword Arguments:
+            status_code {int} -- Status code of the response or None for connection errors (default: {None})
+            latency {float} -- Latency of the request in seconds (default: {None})
+        """
+        bucket, limiter = self.get_limits(url)
+        throttled = status_code in THROTTLE_STATUS_CODES
+        limiter.release(throttled=throttled, latency=latency)
+        if throttled:
+            bucket.on_throttle()
+        elif status_code is not None:
+            bucket.on_success()
+
+
+def get_scope(url: str) -> str:
+    """Returns the scope of the URL for rate limiting, i.e. the host and, if present, the tenant
+
+    Arguments:
+        url {str} -- URL of the request
+
+    Returns:
+        str -- The scope
+    """
+    parts = urlsplit(url)
+    match = _TENANT_PATTERN.search(parts.path)
+    if match is not None:
+        return parts.netloc + '/tenant/' + match.group(1)
+    return parts.netloc
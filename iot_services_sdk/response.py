@@ -1,13 +1,44 @@
 """ Author: Philipp Steinrötter (steinroe) """
 
+import json
+
+from .json_stream import iter_json_array
+
+_NOT_DECODED = object()
+
 
 class Response(object):
     """Objects contain information received from API"""
 
-    def __init__(self, status_code, response, headers):
+    def __init__(self, status_code, response=_NOT_DECODED, headers=None, raw=None, is_json=False, encoding=None,
+                 stream=None, close=None):
+        """Instantiate Response object
+
+        The body can either be passed already decoded or as raw bytes. Raw bodies are only decoded on the first
+        call of get_result(), so callers that only check the status code never pay for decoding.
+
+        Arguments:
+            status_code {int} -- The status code of the HTTP communication
+            response {object} -- The decoded body of the response
+
+        Keyword Arguments:
+            headers {dict} -- The headers of the response (default: {None})
+            raw {bytes} -- The undecoded body of the response (default: {None})
+            is_json {bool} -- If set to true, the raw body is parsed as JSON on first access (default: {False})
+            encoding {str} -- Encoding of the raw body if it is returned as text (default: {None})
+            stream {iterable} -- Iterable of raw body chunks which are still to be read from the connection. Takes
+                                 precedence over raw and can only be consumed once. (default: {None})
+            close {callable} -- Called to release the underlying connection of a streamed body (default: {None})
+        """
         self._status_code = status_code
         self._result = response
         self._headers = headers
+        self._raw = raw
+        self._is_json = is_json
+        self._encoding = encoding
+        self._stream = stream
+        self._close = close
+        self._consumed = False
 
     def get_result(self) -> str:
         """Returns the result of the response, e.g. the body of the message
@@ -15,8 +46,55 @@ class Response(object):
         Returns:
             str -- The body of the response message. Mostly in JSON formatting.
         """
+        if self._result is _NOT_DECODED:
+            self._result = self._decode()
         return self._result
 
+    def iter_result(self):
+        """Iterates over the elements of a JSON array body without decoding the whole body at once.
+
+        Meant for very large list responses, e.g. measures. For streamed responses, elements are parsed straight
+        from the connection as they arrive, so memory stays bounded by the size of a single element. If the body
+        has already been decoded or is not an array, the decoded result is used instead.
+
+        Yields:
+            object -- The elements of the response body
+        """
+        if self._stream is not None and self._is_json:
+            stream = self._stream
+            self._stream = None
+            self._consumed = True
+            try:
+                yield from iter_json_array(stream)
+            finally:
+                self.close()
+            return
+        if self._result is not _NOT_DECODED or not self._is_json or self._raw is None:
+            result = self.get_result()
+            if isinstance(result, list):
+                yield from result
+            else:
+                yield result
+            return
+        yield from iter_json_array(self._iter_raw_chunks())
+
+    def raw(self) -> memoryview:
+        """Returns the undecoded body of the response without copying it
+
+        Returns:
+            memoryview -- View on the raw bytes of the response body
+        """
+        self._read_stream()
+        if self._raw is None:
+            result = self.get_result()
+            if result is None:
+                return memoryview(b'')
+            if self._is_json or not isinstance(result, str):
+                self._raw = json.dumps(result).encode('utf-8')
+            else:
+                self._raw = result.encode(self._encoding or 'utf-8')
+        return memoryview(self._raw)
+
     def get_headers(self) -> str:
         """Returns the header of the response
 
@@ -32,3 +110,56 @@ class Response(object):
             str -- The status code of the HTTP communication
         """
         return self._status_code
+
+    def copy(self):
+        """Returns a response with the same status, headers and body whose result is decoded separately, so that
+        changes to the result of one response are not visible in the other
+
+        Raises:
+            ValueError -- Raised if the body is streamed
+
+        Returns:
+            Response -- The copy
+        """
+        if self._stream is not None or self._consumed:
+            raise ValueError('Streamed responses cannot be copied.')
+        headers = self._headers.copy() if self._headers is not None else None
+        is_json = self._is_json
+        if self._raw is None and self._result is not _NOT_DECODED:
+            if self._result is None:
+                return Response(self._status_code, None, headers)
+            # Decoded results are copied through their serialization, see raw()
+            is_json = is_json or not isinstance(self._result, str)
+        self.raw()
+        return Response(self._status_code, headers=headers, raw=self._raw, is_json=is_json, encoding=self._encoding)
+
+    def close(self):
+        """Releases the connection of a streamed response. Not required if the body has been read completely."""
+        self._stream = None
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def _read_stream(self):
+        if self._stream is not None:
+            stream = self._stream
+            self._stream = None
+            try:
+                self._raw = b''.join(stream)
+            finally:
+                self.close()
+
+    def _decode(self):
+        self._read_stream()
+        if self._raw is None:
+            if self._consumed:
+                raise ValueError('The streamed body has already been consumed by iter_result().')
+            return None
+        if self._is_json:
+            return json.loads(self._raw)
+        return str(self._raw, self._encoding or 'utf-8', errors='replace')
+
+    def _iter_raw_chunks(self, chunk_size=65536):
+        view = memoryview(self._raw)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
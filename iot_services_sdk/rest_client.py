@@ -3,11 +3,19 @@
 from requests.adapters import HTTPAdapter
 
 import json
+import threading
+import time
 import requests
-import ssl
+from urllib.parse import urlsplit
 
+from . import tracing
+from .profiling import profiler, STAGE_REST_REQUEST, STAGE_REST_SERIALIZE
+from .http2 import HTTP2Session
+from .instrumentation import instrumentation as default_instrumentation, RequestEvent, SOURCE_GATEWAY, get_body_size, \
+    get_response_size, get_path_template
 from .response import Response
-from .utils import current_milli_time
+from .ssl_context import ssl_context_cache
+from .utils import current_milli_time, get_base_url
 
 
 class RESTGatewayException(Exception):
@@ -16,28 +24,99 @@ class RESTGatewayException(Exception):
 
 class RestClient(object):
 
-    def __init__(self, instance: str, device_alternate_id: str, pemfile: str, secret: str):
+    def __init__(self, instance: str, device_alternate_id: str, pemfile: str = None, secret: str = None,
+                 http2: bool = False, pem=None):
         """Instantiate REST Client configured for specified instance and device
         
         Arguments:
-            instance {str} -- IoT Services instance
+            instance {str} -- IoT Services instance. Instances with scheme http:// are posted to without client certificate.
             device_alternate_id {str} -- The alternate id of the device
             certfile_path {str} -- The certfile path for the device
             keyfile_path {str} -- The keyfile path for the device
+
+        Keyword Arguments:
+            http2 {bool} -- If set to true, posts are multiplexed over HTTP/2 connections. Requires httpx and h2. (default: {False})
+            pem {str|bytes} -- Content of the PEM as returned by get_device_pem, used instead of the pemfile (default: {None})
         """
 
         self.instance = instance
         self.device_alternate_id = device_alternate_id
         self.pemfile = pemfile
+        self.http2 = http2
 
-        self.session = self._init_session(pemfile, secret)
+        self.session = self._init_session(pemfile, secret, http2, pem)
+        # Posts in flight per session and sessions replaced by set_certificate which are closed after their last post
+        self._in_flight = {}
+        self._retired = set()
+        self._session_lock = threading.Lock()
 
         self.gateway_uri = '/iot/gateway'
+        # Receives an event per post. Replace it with an Instrumentation of its own to observe this client separately.
+        self.instrumentation = default_instrumentation
+
+    def set_certificate(self, pemfile: str = None, secret: str = None, pem=None):
+        """Switches the client to another certificate, e.g. after a rotation
 
-    def _init_session(self, pemfile: str, secret: str):
+        Requests in flight complete with the previous certificate, all following requests use the new one. The
+        connections of the previous certificate are closed once its last request completed.
+
+        Keyword Arguments:
+            pemfile {str} -- Path to the PEM file (default: {None})
+            secret {str} -- Secret of the private key (default: {None})
+            pem {str|bytes} -- Content of the PEM, used instead of the pemfile (default: {None})
+        """
+        session = self._init_session(pemfile, secret, self.http2, pem)
+        with self._session_lock:
+            previous = self.session
+            self.pemfile = pemfile
+            self.session = session
+            # Closing the session would abort the requests in flight, so it is closed by the last of them
+            idle = previous not in self._in_flight
+            if not idle:
+                self._retired.add(previous)
+        if idle:
+            previous.close()
+
+    def close(self):
+        """Closes the pooled connections of the client, including those of previous certificates"""
+        with self._session_lock:
+            sessions = [self.session] + list(self._retired)
+            self._retired.clear()
+        for session in sessions:
+            session.close()
+
+    def _acquire_session(self):
+        with self._session_lock:
+            session = self.session
+            self._in_flight[session] = self._in_flight.get(session, 0) + 1
+            return session
+
+    def _release_session(self, session):
+        with self._session_lock:
+            count = self._in_flight.pop(session) - 1
+            if count > 0:
+                self._in_flight[session] = count
+                return
+            if session not in self._retired:
+                return
+            self._retired.remove(session)
+        session.close()
+
+    def _init_session(self, pemfile: str, secret: str, http2: bool = False, pem=None):
+        # Plain HTTP, e.g. to a local mock gateway, needs no client certificate
+        plain = get_base_url(self.instance).startswith('http://') and pemfile is None and pem is None
+        if not plain and ((pemfile is None and pem is None) or secret is None):
+            raise ValueError('Either "pemfile" or "secret" is missing')
+        if http2:
+            if plain:
+                # Without TLS, httpx talks HTTP/1.1
+                return HTTP2Session()
+            return HTTP2Session(verify=_get_ssl_context(pemfile, secret, pem))
         session = requests.Session()
-        adapter = RESTGatewayAdapter(pemfile=pemfile, secret=secret)
-        session.mount('https://' + self.instance, adapter)
+        if plain:
+            return session
+        adapter = RESTGatewayAdapter(pemfile=pemfile, secret=secret, pem=pem)
+        session.mount(get_base_url(self.instance), adapter)
         return session
 
     def _request_gateway(self, service: str, headers: dict, payload: str) -> Response:
@@ -52,17 +131,45 @@ class RestClient(object):
             Response -- Response object
         """
 
-        service = 'https://' + self.instance + self.gateway_uri + '/rest' + service
-
+        service = get_base_url(self.instance) + self.gateway_uri + '/rest' + service
+
+        if tracing.get_tracer() is None:
+            return self._post_gateway(service, headers, payload)
+        with tracing.start_span('POST ' + get_path_template(urlsplit(service).path), kind=tracing.SPAN_KIND_CLIENT,
+                                attributes={'http.request.method': 'POST', 'url.full': service}) as span:
+            response = self._post_gateway(service, tracing.inject(headers), payload)
+            span.set_attribute('http.response.status_code', response.get_status_code())
+            return response
+
+    def _post_gateway(self, service: str, headers: dict, payload: str) -> Response:
+        events = self.instrumentation
+        start = time.perf_counter() if events.enabled else None
+        response = None
+        error = None
+        session = self._acquire_session()
         try:
-            response = self.session.request(method='POST', url=service, data=payload, headers=headers)
+            started = profiler.start(STAGE_REST_REQUEST) if profiler.enabled else None
+            response = session.request(method='POST', url=service, data=payload, headers=headers)
+            if started is not None:
+                profiler.stop(STAGE_REST_REQUEST, started)
             response.raise_for_status()
             if response.status_code == 207:
                 # Batch upload with partial failure. Raise Exception.
                 raise RESTGatewayException(self._parse_error(json.loads(response.text)))
-            return Response(response.status_code, json.loads(response.text), response.headers)
+            return Response(response.status_code, headers=response.headers, raw=response.content, is_json=True)
         except requests.exceptions.HTTPError as err:
-            raise RESTGatewayException(self._parse_error(json.loads(err.response.text)))
+            error = RESTGatewayException(self._parse_error(json.loads(err.response.text)))
+            raise error
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            self._release_session(session)
+            if start is not None:
+                events.emit(RequestEvent(
+                    SOURCE_GATEWAY, 'POST', service, status_code=response.status_code if response is not None else None,
+                    latency=time.perf_counter() - start, request_bytes=get_body_size(payload),
+                    response_bytes=get_response_size(response) if response is not None else None, error=error))
 
     def _parse_error(self, message_infos) -> str:
         messages = ''
@@ -82,6 +189,7 @@ class RestClient(object):
         Returns:
             Response -- Response object
         """
+        started = profiler.start(STAGE_REST_SERIALIZE) if profiler.enabled else None
         if device_alternate_id is None:
             device_alternate_id = self.device_alternate_id
 
@@ -90,6 +198,8 @@ class RestClient(object):
         payload_json = json.dumps(
             {"capabilityAlternateId": capability_alternate_id, "sensorAlternateId": sensor_alternate_id,
              "command": command})
+        if started is not None:
+            profiler.stop(STAGE_REST_SERIALIZE, started)
         response = self._request_gateway(service=service, headers=headers, payload=payload_json)
         return response
 
@@ -108,6 +218,7 @@ class RestClient(object):
         Returns:
             Response -- Response object
         """
+        started = profiler.start(STAGE_REST_SERIALIZE) if profiler.enabled else None
         if device_alternate_id is None:
             device_alternate_id = self.device_alternate_id
 
@@ -128,6 +239,8 @@ class RestClient(object):
                 payload['timestamp'] = timestamp
 
         payload_json = json.dumps(payload)
+        if started is not None:
+            profiler.stop(STAGE_REST_SERIALIZE, started)
         response = self._request_gateway(service=service, headers=headers, payload=payload_json)
         return response
 
@@ -141,12 +254,15 @@ class RestClient(object):
         Returns:
             Response -- Response object
         """
+        started = profiler.start(STAGE_REST_SERIALIZE) if profiler.enabled else None
         if device_alternate_id is None:
             device_alternate_id = self.device_alternate_id
 
         service = '/measures/' + device_alternate_id
         headers = {'Content-Type': 'application/json'}
         payload_json = json.dumps(messages)
+        if started is not None:
+            profiler.stop(STAGE_REST_SERIALIZE, started)
         response = self._request_gateway(service=service, headers=headers, payload=payload_json)
         return response
 
@@ -155,9 +271,10 @@ class RESTGatewayAdapter(HTTPAdapter):
     def __init__(self, *args, **kwargs):
         pemfile = kwargs.pop('pemfile', None)
         secret = kwargs.pop('secret', None)
-        if pemfile is None or secret is None:
+        pem = kwargs.pop('pem', None)
+        if (pemfile is None and pem is None) or secret is None:
             raise ValueError('Either "pemfile" or "secret" is missing')
-        self.ssl_context = self._create_ssl_context(pemfile, secret)
+        self.ssl_context = self._create_ssl_context(pemfile, secret, pem)
         super(RESTGatewayAdapter, self).__init__(*args, **kwargs)
 
     def init_poolmanager(self, *args, **kwargs):
@@ -170,21 +287,11 @@ class RESTGatewayAdapter(HTTPAdapter):
             kwargs['ssl_context'] = self.ssl_context
         return super(RESTGatewayAdapter, self).proxy_manager_for(*args, **kwargs)
 
-    def _create_ssl_context(self, pemfile, secret):
-        if ssl is None:
-            raise ValueError('This platform has no SSL/TLS.')
-        if not hasattr(ssl, 'SSLContext'):
-            # Require Python version that has SSL context support in standard library
-            raise ValueError('Python 2.7.9 and 3.2 are the minimum supported versions for TLS.')
-        # Create SSLContext object
-        tls_version = ssl.PROTOCOL_TLSv1
-        # If the python version supports it, use highest TLS version automatically
-        if hasattr(ssl, "PROTOCOL_TLS"):
-            tls_version = ssl.PROTOCOL_TLS
-        context = ssl.SSLContext(tls_version)
-
-        # Configure context
-        if pemfile is not None:
-            context.load_cert_chain(pemfile, password=secret)
-
-        return context
+    def _create_ssl_context(self, pemfile, secret, pem=None):
+        return _get_ssl_context(pemfile, secret, pem)
+
+
+def _get_ssl_context(pemfile: str, secret: str, pem=None):
+    # Contexts are shared by all clients with the same certificate, so the key is only decrypted once. They verify
+    # the server themselves, since httpx uses them as they are. urllib3 would set the same verify mode for requests.
+    return ssl_context_cache.get(pemfile, secret, verify=True, pem=pem)
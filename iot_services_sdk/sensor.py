@@ -30,7 +30,7 @@ class SensorService(TenantIoTService):
             tenant_id=tenant_id
         )
 
-    def get_sensors(self, filters=None, orderby=None, asc=True, skip=None, top=None) -> Response:
+    def get_sensors(self, filters=None, orderby=None, asc=True, skip=None, top=None, stream=False) -> Response:
         """The endpoint returns a list of sensors.
         
         Keyword Arguments:
@@ -39,12 +39,13 @@ class SensorService(TenantIoTService):
             asc {bool} -- Only considered if orderby is not none. Defines if the values should be ordered asc or desc. (default: {True})
             skip {int} -- This parameter specifies the number of items in the queried collection which will be skipped and therefore included in the result set. (default: {None})
             top {int} -- This parameter restricts the maximum number of items which will be returned by the request. (default: {None})
+            stream {bool} -- If set to true, the list is streamed from the connection. Use Response.iter_result() to consume it element by element with bounded memory. (default: {False})
         
         Returns:
             Response -- Response object
         """
         query = build_query(filters=filters, orderby=orderby, asc=asc, skip=skip, top=top)
-        return super().request_core(method='GET', service=self.service, query=query, accept_json=True)
+        return super().request_core(method='GET', service=self.service, query=query, accept_json=True, stream=stream)
 
     def get_sensor_count(self):
         """The endpoint returns the count of all sensors.
@@ -94,7 +94,7 @@ class SensorTypeService(TenantIoTService):
             Response -- Response object
         """
         service = self.service + '/' + sensor_type_id
-        return super().request_core(method='GET', service=service, accept_json=True)
+        return super().request_core(method='GET', service=service, accept_json=True, revalidate=True)
 
     def update_sensor_type(self, sensor_type_id: str, alternate_id: str, name: str) -> Response:
         """This endpoint is used to update the sensor type associated to the given id with details specified in the request body. To update capabilities, use the respective API.
@@ -0,0 +1,727 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import argparse
+import getpass
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import selectors
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .certificate_store import CertificateStore
+from .device import DeviceService
+from .gateway import GatewayService
+from .mqtt_client import MQTTClient
+from .rest_client import RestClient
+from .sensor import SensorService
+from .utils import current_milli_time, get_base_url
+
+PROTOCOLS = ('mqtt', 'rest')
+SHAPES = ('random', 'sine', 'constant', 'counter')
+# Environment variable the command line reads the password from if --password is omitted
+PASSWORD_VARIABLE = 'IOT_SERVICES_PASSWORD'
+
+
+class FleetSimulator(object):
+    """Load generator which simulates a fleet of devices with the SDK clients.
+
+    The devices are provisioned through the Device Management API, or reused if devices with the same names exist
+    already, and then send measures over the MQTT or REST Cloud Gateway at a fixed rate with jitter. The devices are
+    spread over several processes. Each process drives all of its MQTT connections from a single event loop, so
+    that tens of thousands of devices do not need a thread each. Commands can be sent to random devices through the
+    API to measure how long their delivery over MQTT takes.
+    """
+
+    def __init__(self, instance: str, user: str, password: str, tenant_id: str, gateway_instance: str = None,
+                 protocol: str = 'mqtt', devices: int = 100, prefix: str = 'simulated-device-', gateway_id: str = None,
+                 sensor_type_id: str = None, capability_alternate_id: str = 'capability',
+                 sensor_alternate_id: str = 'sensor', properties=('value',), rate: float = 1.0,
+                 batch_size: int = 1, shape: str = 'random', jitter: float = 0.1, duration: float = 60.0,
+                 processes: int = 1, rest_workers: int = 16, command_rate: float = 0.0,
+                 command_capability_id: str = None, command_property: str = 'timestamp',
+                 certificate_directory: str = None, drain: float = 5.0, report_interval: float = 5.0,
+                 on_progress=None):
+        """Instantiate FleetSimulator object
+
+        Arguments:
+            instance {str} -- IoT Services instance the devices are provisioned in
+            user {str} -- IoT Services user
+            password {str} -- IoT Services password
+            tenant_id {str} -- Id of the tenant
+
+        Keyword Arguments:
+            gateway_instance {str} -- Instance of the gateway the devices connect to. If None, instance is used. (default: {None})
+            protocol {str} -- Either 'mqtt' or 'rest' (default: {'mqtt'})
+            devices {int} -- Number of simulated devices (default: {100})
+            prefix {str} -- Prefix of the device names. Devices named prefix plus index are reused. (default: {'simulated-device-'})
+            gateway_id {str} -- Gateway new devices are created for. If None, the cloud gateway of the protocol is used. (default: {None})
+            sensor_type_id {str} -- If set, a sensor of this type is created for devices without one (default: {None})
+            capability_alternate_id {str} -- Alternate ID of the capability the measures are sent for (default: {'capability'})
+            sensor_alternate_id {str} -- Alternate ID of the sensor the measures are sent for (default: {'sensor'})
+            properties {tuple} -- Names of the properties of a measure (default: {('value',)})
+            rate {float} -- Messages per second and device (default: {1.0})
+            batch_size {int} -- Measures per message (default: {1})
+            shape {str} -- How values develop over time, one of 'random', 'sine', 'constant' and 'counter' (default: {'random'})
+            jitter {float} -- Relative random deviation of the interval between two messages (default: {0.1})
+            duration {float} -- Seconds measures are sent for (default: {60.0})
+            processes {int} -- Number of processes the devices are spread over (default: {1})
+            rest_workers {int} -- Concurrent posts per process over REST. At most twice as many posts are queued or running, so devices fall behind the rate if the gateway is too slow. (default: {16})
+            command_rate {float} -- Commands per second sent to random devices through the API. MQTT only. (default: {0.0})
+            command_capability_id {str} -- Id of the capability of the commands (default: {None})
+            command_property {str} -- Property of the command which carries its send time (default: {'timestamp'})
+            certificate_directory {str} -- If set, device certificates are kept in a CertificateStore there, so that later runs reuse them (default: {None})
+            drain {float} -- Seconds to wait for outstanding acknowledgements after the sending stopped (default: {5.0})
+            report_interval {float} -- Seconds between two progress reports (default: {5.0})
+            on_progress {callable} -- Called with the aggregated progress, a dict with sent, acked, errors and commands (default: {None})
+
+        Raises:
+            ValueError -- Raised if an argument is invalid
+        """
+        if protocol not in PROTOCOLS:
+            raise ValueError('The protocol must be one of ' + ', '.join(PROTOCOLS))
+        if shape not in SHAPES:
+            raise ValueError('The shape must be one of ' + ', '.join(SHAPES))
+        if rate <= 0 or devices <= 0 or processes <= 0 or batch_size <= 0:
+            raise ValueError('The rate and the numbers of devices, processes and measures per message must be positive')
+        if not 0 <= jitter < 1:
+            raise ValueError('The jitter must be at least 0 and less than 1')
+        if command_rate > 0 and (protocol != 'mqtt' or command_capability_id is None):
+            raise ValueError('Commands need the MQTT protocol and the id of their capability')
+
+        self.instance = instance
+        self.user = user
+        self.password = password
+        self.tenant_id = tenant_id
+        self.gateway_instance = gateway_instance if gateway_instance is not None else instance
+        self.protocol = protocol
+        self.devices = devices
+        self.prefix = prefix
+        self.gateway_id = gateway_id
+        self.sensor_type_id = sensor_type_id
+        self.capability_alternate_id = capability_alternate_id
+        self.sensor_alternate_id = sensor_alternate_id
+        self.properties = tuple(properties)
+        self.rate = rate
+        self.batch_size = batch_size
+        self.shape = shape
+        self.jitter = jitter
+        self.duration = duration
+        self.processes = processes
+        self.rest_workers = rest_workers
+        self.command_rate = command_rate
+        self.command_capability_id = command_capability_id
+        self.command_property = command_property
+        self.certificate_directory = certificate_directory
+        self.drain = drain
+        self.report_interval = report_interval
+        self.on_progress = on_progress
+
+        self.device_service = DeviceService(instance, user, password, tenant_id)
+
+    def provision(self, max_workers: int = 8) -> list:
+        """Creates the simulated devices, their sensors and certificates which do not exist yet
+
+        Keyword Arguments:
+            max_workers {int} -- Number of concurrent requests (default: {8})
+
+        Returns:
+            list -- One dict per device with id, alternateId, name, sensorId and, unless the gateway is reached without TLS, pem and secret
+        """
+        names = [self.prefix + str(idx) for idx in range(self.devices)]
+        existing = {device['name']: device for device in self.device_service.get_devices(stream=True).iter_result()
+                    if str(device.get('name')).startswith(self.prefix)}
+        missing = [name for name in names if name not in existing]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if len(missing) > 0:
+                gateway_id = self.gateway_id if self.gateway_id is not None else self._get_cloud_gateway_id()
+                created = executor.map(tracing.wrap(
+                    lambda name: self.device_service.create_device(gateway_id, name).get_result()), missing)
+                existing.update({device['name']: device for device in created})
+            devices = [existing[name] for name in names]
+
+            sensors = self._get_sensors(devices, executor)
+            certificates = [None] * len(devices)
+            if not _is_plain(self.gateway_instance):
+                get_certificate = self._get_certificate
+                if self.certificate_directory is not None:
+                    get_certificate = CertificateStore(self.device_service, self.certificate_directory).get
+                certificates = list(executor.map(tracing.wrap(get_certificate),
+                                                 [device['id'] for device in devices]))
+
+        return [{'id': device['id'], 'alternateId': device['alternateId'], 'name': device['name'],
+                 'sensorId': sensor['id'] if sensor is not None else None,
+                 'pem': certificate['pem'] if certificate is not None else None,
+                 'secret': certificate['secret'] if certificate is not None else None}
+                for device, sensor, certificate in zip(devices, sensors, certificates)]
+
+    def _get_cloud_gateway_id(self) -> str:
+        gateway_service = GatewayService(self.instance, self.user, self.password, self.tenant_id)
+        gateways = gateway_service.get_gateways(filters=["protocolId eq '" + self.protocol + "'"]).get_result()
+        if len(gateways) == 0:
+            raise ValueError('No gateway found for protocol ' + self.protocol + '. Please specify the gateway id.')
+        return gateways[0]['id']
+
+    def _get_sensors(self, devices: list, executor) -> list:
+        sensor_service = SensorService(self.instance, self.user, self.password, self.tenant_id)
+        sensors = {}
+        for sensor in sensor_service.get_sensors(stream=True).iter_result():
+            if sensor.get('alternateId') == self.sensor_alternate_id:
+                sensors[sensor.get('deviceId')] = sensor
+
+        without_sensor = [device['id'] for device in devices if device['id'] not in sensors]
+        if self.sensor_type_id is not None and len(without_sensor) > 0:
+            def create_sensor(device_id):
+                return sensor_service.create_sensor(device_id, self.sensor_alternate_id, self.sensor_alternate_id,
+                                                    self.sensor_type_id).get_result()
+
+            for device_id, sensor in zip(without_sensor, executor.map(tracing.wrap(create_sensor), without_sensor)):
+                sensors[device_id] = sensor
+        return [sensors.get(device['id']) for device in devices]
+
+    def _get_certificate(self, device_id: str) -> dict:
+        return self.device_service.get_device_pem(device_id).get_result()
+
+    def run(self, devices: list = None) -> dict:
+        """Runs the simulation
+
+        Keyword Arguments:
+            devices {list} -- Devices as returned by provision. If None, the devices are provisioned first. (default: {None})
+
+        Returns:
+            dict -- Report with the aggregate throughput, acknowledgement latency and command latency. Latency percentiles are estimated from a sample of up to 10000 values per process.
+        """
+        if devices is None:
+            devices = self.provision()
+        processes = min(self.processes, len(devices))
+        config = {key: getattr(self, key) for key in (
+            'gateway_instance', 'protocol', 'capability_alternate_id', 'sensor_alternate_id', 'properties', 'rate',
+            'batch_size', 'shape', 'jitter', 'duration', 'rest_workers', 'command_property', 'drain',
+            'report_interval')}
+
+        context = multiprocessing.get_context('spawn')
+        events = context.Queue()
+        start = context.Event()
+        workers = [context.Process(target=_work, args=(index, config, devices[index::processes], start, events),
+                                   daemon=True) for index in range(processes)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            self._wait_for(events, 'ready', workers)
+            commands = _CommandSender(self, devices)
+            start.set()
+            started = time.monotonic()
+            if self.command_rate > 0:
+                commands.start()
+            try:
+                results = self._wait_for(events, 'done', workers)
+            finally:
+                commands.stop()
+            elapsed = time.monotonic() - started
+        finally:
+            for worker in workers:
+                worker.join(10)
+                if worker.is_alive():
+                    worker.terminate()
+
+        return self._get_report(results, len(devices), processes, commands, min(elapsed, self.duration))
+
+    def _wait_for(self, events, kind: str, workers: list) -> list:
+        results = {}
+        progress = {}
+        while len(results) < len(workers):
+            try:
+                event, index, value = events.get(timeout=1.0)
+            except queue.Empty:
+                if any(not worker.is_alive() for index, worker in enumerate(workers) if index not in results):
+                    raise RuntimeError('A simulation process exited unexpectedly')
+                continue
+            if event == 'error':
+                raise RuntimeError('Simulation process ' + str(index) + ' failed: ' + value)
+            if event == 'progress':
+                progress[index] = value
+                if self.on_progress is not None:
+                    self.on_progress({key: sum(values[key] for values in progress.values())
+                                      for key in ('sent', 'acked', 'errors', 'commands')})
+            elif event == kind:
+                results[index] = value
+        return list(results.values())
+
+    def _get_report(self, results: list, devices: int, processes: int, commands, elapsed: float) -> dict:
+        report = {'protocol': self.protocol, 'devices': devices, 'processes': processes, 'seconds': elapsed}
+        for key in ('sent', 'acked', 'errors', 'commands'):
+            report[key] = sum(result[key] for result in results)
+        report['messages_per_second'] = report['sent'] / elapsed if elapsed > 0 else None
+        report['measures_per_second'] = report['sent'] * self.batch_size / elapsed if elapsed > 0 else None
+        report['acked_per_second'] = report['acked'] / elapsed if elapsed > 0 else None
+        ack_latencies = [value for result in results for value in result['ack_latencies']]
+        command_latencies = [value for result in results for value in result['command_latencies']]
+        for q in (50, 90, 99):
+            report['ack_p' + str(q) + '_ms'] = _percentile(ack_latencies, q)
+        report['commands_sent'] = commands.sent
+        report['command_errors'] = commands.errors
+        for q in (50, 99):
+            report['command_p' + str(q) + '_ms'] = _percentile(command_latencies, q)
+        return report
+
+
+class _CommandSender(object):
+    """Sends commands to random devices through the API at the command rate of the simulator"""
+
+    def __init__(self, simulator: FleetSimulator, devices: list):
+        self.simulator = simulator
+        self.devices = [device for device in devices if device['sensorId'] is not None]
+        self.sent = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if len(self.devices) == 0:
+            raise ValueError('Commands need devices with a sensor. Please specify a sensor type id.')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        simulator = self.simulator
+        interval = 1.0 / simulator.command_rate
+        due = time.monotonic()
+        end = due + simulator.duration
+        while not self._stop.is_set() and due < end:
+            device = random.choice(self.devices)
+            try:
+                simulator.device_service.send_command_to_device(device['id'], simulator.command_capability_id,
+                                                                device['sensorId'],
+                                                                {simulator.command_property: current_milli_time()})
+                self.sent += 1
+            except Exception:
+                self.errors += 1
+            due += interval
+            self._stop.wait(max(0.0, due - time.monotonic()))
+
+
+class _Stats(object):
+    """Counters of a simulation process with a reservoir sample of the latencies"""
+
+    def __init__(self, sample_size: int = 10000):
+        self.sample_size = sample_size
+        self.sent = 0
+        self.acked = 0
+        self.errors = 0
+        self.commands = 0
+        self.ack_latencies = []
+        self.command_latencies = []
+        self.lock = threading.Lock()
+
+    def add_ack(self, seconds: float):
+        self.acked += 1
+        self._sample(self.ack_latencies, self.acked, seconds * 1000.0)
+
+    def add_command(self, milliseconds: float):
+        self.commands += 1
+        self._sample(self.command_latencies, self.commands, milliseconds)
+
+    def get_progress(self) -> dict:
+        return {'sent': self.sent, 'acked': self.acked, 'errors': self.errors, 'commands': self.commands}
+
+    def get_result(self) -> dict:
+        return dict(self.get_progress(), ack_latencies=self.ack_latencies, command_latencies=self.command_latencies)
+
+    def _sample(self, samples: list, count: int, value: float):
+        if len(samples) < self.sample_size:
+            samples.append(value)
+            return
+        position = random.randrange(count)
+        if position < self.sample_size:
+            samples[position] = value
+
+
+class _SendTimes(dict):
+    # The installed simulator cannot import the benchmarks, so it keeps its own version of benchmarks.common.SendTimes
+    def __init__(self, sent: dict):
+        super(_SendTimes, self).__init__()
+        self.sent = sent
+
+    def __setitem__(self, message_id, payload):
+        self.sent[message_id] = time.perf_counter()
+        super(_SendTimes, self).__setitem__(message_id, payload)
+
+
+class _SimulatedMQTTClient(MQTTClient):
+    def __init__(self, gateway_instance: str, device: dict, stats: _Stats, command_property: str):
+        super(_SimulatedMQTTClient, self).__init__(gateway_instance, device['alternateId'], secret=device['secret'],
+                                                   pem=device['pem'])
+        self.stats = stats
+        self.command_property = command_property
+        self._send_times = {}
+        # The message id is generated inside publish, so the send time is taken when it enters the message buffer
+        self._message_buffer = _SendTimes(self._send_times)
+        self.on_error = self._on_simulated_error
+        self.on_command = self._on_simulated_command
+
+    def _ack_message_handler(self, client, userdata, message):
+        received = time.perf_counter()
+        for ack in json.loads(message.payload.decode('utf-8')):
+            sent = self._send_times.pop(ack.get('id'), None)
+            if sent is not None and ack.get('code') in (200, 202):
+                self.stats.add_ack(received - sent)
+        super(_SimulatedMQTTClient, self)._ack_message_handler(client, userdata, message)
+
+    def _on_simulated_error(self, client, userdata, report):
+        self.stats.errors += len(report)
+
+    def _on_simulated_command(self, client, userdata, message):
+        sent = (message.get('command') or {}).get(self.command_property)
+        if isinstance(sent, (int, float)):
+            self.stats.add_command(current_milli_time() - sent)
+        else:
+            self.stats.commands += 1
+
+
+class _Worker(object):
+    """Drives the devices of one simulation process"""
+
+    def __init__(self, index: int, config: dict, devices: list, start, events):
+        self.index = index
+        self.config = config
+        self.devices = devices
+        self.start = start
+        self.events = events
+        self.stats = _Stats()
+        self._random = random.Random()
+        self._next_report = None
+
+    def run(self):
+        if self.config['protocol'] == 'mqtt':
+            self._run_mqtt()
+        else:
+            self._run_rest()
+        self.events.put(('done', self.index, self.stats.get_result()))
+
+    def _get_schedule(self, now: float) -> list:
+        # The first messages are spread over one interval, so that the devices do not send in lockstep
+        interval = 1.0 / self.config['rate']
+        schedule = [(now + self._random.uniform(0, interval), idx) for idx in range(len(self.devices))]
+        heapq.heapify(schedule)
+        return schedule
+
+    def _get_next(self, due: float, now: float) -> float:
+        interval = 1.0 / self.config['rate']
+        jitter = self.config['jitter']
+        # A device which has fallen behind continues from now instead of sending a burst to catch up
+        return max(due + interval * self._random.uniform(1 - jitter, 1 + jitter), now)
+
+    def _get_measures(self, idx: int, sequence: int) -> list:
+        return make_measures(self.config['shape'], self.config['properties'], self.config['batch_size'], idx,
+                             sequence, self._random)
+
+    def _report(self, now: float, force: bool = False):
+        if force or now >= self._next_report:
+            self.events.put(('progress', self.index, self.stats.get_progress()))
+            self._next_report = now + self.config['report_interval']
+
+    def _run_mqtt(self):
+        config = self.config
+        clients = [_SimulatedMQTTClient(config['gateway_instance'], device, self.stats, config['command_property'])
+                   for device in self.devices]
+
+        def connect(client):
+            client.connect()
+            client.subscribe(client.device_alternate_id)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(connect, clients))
+
+        loop = _MQTTLoop(clients)
+        self.events.put(('ready', self.index, None))
+        self.start.wait()
+
+        now = time.monotonic()
+        end = now + config['duration']
+        self._next_report = now + config['report_interval']
+        schedule = self._get_schedule(now)
+        sequences = [0] * len(clients)
+        while now < end:
+            while len(schedule) > 0 and schedule[0][0] <= now:
+                due, idx = heapq.heappop(schedule)
+                info = clients[idx].publish(config['capability_alternate_id'], config['sensor_alternate_id'],
+                                            self._get_measures(idx, sequences[idx]))
+                sequences[idx] += 1
+                if info.rc == 0:
+                    self.stats.sent += 1
+                else:
+                    self.stats.errors += 1
+                heapq.heappush(schedule, (self._get_next(due, now), idx))
+            timeout = min(schedule[0][0] if len(schedule) > 0 else end, end) - now
+            loop.poll(max(0.0, min(timeout, 0.05)))
+            now = time.monotonic()
+            self._report(now)
+
+        # Wait for the acknowledgements of the messages in flight
+        drain_end = now + config['drain']
+        while now < drain_end and self.stats.acked + self.stats.errors < self.stats.sent:
+            loop.poll(0.05)
+            now = time.monotonic()
+        self._report(now, force=True)
+        loop.close()
+
+    def _run_rest(self):
+        config = self.config
+        clients = [RestClient(config['gateway_instance'], device['alternateId'], secret=device['secret'],
+                              pem=device['pem']) for device in self.devices]
+        stats = self.stats
+        # Posts which are queued or running. If the gateway cannot keep up with the rate, the devices fall behind
+        # instead of queueing an unbounded number of posts in the executor.
+        in_flight = threading.BoundedSemaphore(config['rest_workers'] * 2)
+
+        def post(idx, measures):
+            start = time.perf_counter()
+            try:
+                clients[idx].post_measures(config['capability_alternate_id'], config['sensor_alternate_id'],
+                                           measures, use_timestamp=True)
+            except Exception:
+                with stats.lock:
+                    stats.errors += 1
+                return
+            finally:
+                in_flight.release()
+            with stats.lock:
+                stats.add_ack(time.perf_counter() - start)
+
+        self.events.put(('ready', self.index, None))
+        self.start.wait()
+
+        now = time.monotonic()
+        end = now + config['duration']
+        self._next_report = now + config['report_interval']
+        schedule = self._get_schedule(now)
+        sequences = [0] * len(clients)
+        with ThreadPoolExecutor(max_workers=config['rest_workers']) as executor:
+            while now < end:
+                while len(schedule) > 0 and schedule[0][0] <= now:
+                    if not in_flight.acquire(timeout=max(0.0, end - time.monotonic())):
+                        break
+                    now = time.monotonic()
+                    due, idx = heapq.heappop(schedule)
+                    executor.submit(post, idx, self._get_measures(idx, sequences[idx]))
+                    sequences[idx] += 1
+                    with stats.lock:
+                        stats.sent += 1
+                    heapq.heappush(schedule, (self._get_next(due, now), idx))
+                time.sleep(max(0.0, min(schedule[0][0], end) - time.monotonic()))
+                now = time.monotonic()
+                with stats.lock:
+                    self._report(now)
+        with stats.lock:
+            self._report(time.monotonic(), force=True)
+
+
+class _MQTTLoop(object):
+    """Network loop for many MQTT clients in a single thread.
+
+    Uses the external event loop callbacks of paho, so that sockets are only polled for writing while they have
+    data to send.
+    """
+
+    def __init__(self, clients: list, keepalive_interval: float = 1.0):
+        self.clients = clients
+        self.keepalive_interval = keepalive_interval
+        self.selector = selectors.DefaultSelector()
+        self._next_misc = time.monotonic() + keepalive_interval
+        for client in clients:
+            client.on_socket_close = self._on_socket_close
+            client.on_socket_register_write = self._on_register_write
+            client.on_socket_unregister_write = self._on_unregister_write
+            sock = client.socket()
+            if sock is not None:
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.want_write() else 0)
+                self.selector.register(sock, events, client)
+
+    def _on_socket_close(self, client, userdata, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _on_register_write(self, client, userdata, sock):
+        self._modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self._modify(sock, selectors.EVENT_READ, client)
+
+    def _modify(self, sock, events, client):
+        try:
+            self.selector.modify(sock, events, client)
+        except (KeyError, ValueError):
+            pass
+
+    def poll(self, timeout: float):
+        """Reads and writes all sockets which are ready within timeout seconds and sends keepalives
+
+        Arguments:
+            timeout {float} -- Seconds to wait for a socket
+        """
+        if len(self.selector.get_map()) == 0:
+            time.sleep(timeout)
+        else:
+            for key, events in self.selector.select(timeout):
+                client = key.data
+                if events & selectors.EVENT_READ:
+                    client.loop_read()
+                    # TLS sockets may hold decrypted data which select does not report
+                    sock = client.socket()
+                    while sock is not None and hasattr(sock, 'pending') and sock.pending() > 0:
+                        client.loop_read()
+                        sock = client.socket()
+                if events & selectors.EVENT_WRITE and client.socket() is not None:
+                    client.loop_write()
+
+        now = time.monotonic()
+        if now >= self._next_misc:
+            for client in self.clients:
+                client.loop_misc()
+            self._next_misc = now + self.keepalive_interval
+
+    def close(self):
+        """Disconnects all clients"""
+        for client in self.clients:
+            client.on_socket_register_write = None
+            if client.socket() is not None:
+                client.disconnect()
+                client.loop_write()
+        self.selector.close()
+
+
+def make_measures(shape: str, properties: tuple, batch_size: int, device_index: int, sequence: int,
+                  rng=random) -> list:
+    """Returns the measures of a simulated message
+
+    Arguments:
+        shape {str} -- How values develop over time, one of 'random', 'sine', 'constant' and 'counter'
+        properties {tuple} -- Names of the properties
+        batch_size {int} -- Number of measures
+        device_index {int} -- Index of the device, used to shift the phase of the sine
+        sequence {int} -- Number of messages the device has sent before
+
+    Keyword Arguments:
+        rng {random.Random} -- Source of random values (default: {random})
+
+    Returns:
+        list -- List of batch_size dicts with a value per property
+    """
+    measures = []
+    for offset in range(batch_size):
+        step = sequence * batch_size + offset
+        if shape == 'random':
+            measures.append({name: rng.uniform(0, 100) for name in properties})
+        elif shape == 'sine':
+            value = 50.0 + 50.0 * math.sin(2 * math.pi * step / 60.0 + device_index)
+            measures.append({name: value for name in properties})
+        elif shape == 'counter':
+            measures.append({name: step for name in properties})
+        else:
+            measures.append({name: 1.0 for name in properties})
+    return measures
+
+
+def _work(index, config, devices, start, events):
+    try:
+        _Worker(index, config, devices, start, events).run()
+    except Exception as err:
+        events.put(('error', index, repr(err)))
+
+
+def _is_plain(instance: str) -> bool:
+    return instance.startswith('mqtt://') or get_base_url(instance).startswith('http://')
+
+
+def _percentile(values: list, q: float) -> float:
+    # Same linear interpolation as benchmarks.common.percentile
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def main(argv=None):
+    """Command line entry point of the fleet simulator"""
+    parser = argparse.ArgumentParser(description='Simulates a fleet of devices sending measures to SAP IoT Services')
+    parser.add_argument('--instance', required=True, help='IoT Services instance, e.g. my-tenant.eu10.cp.iot.sap')
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', help='Password of the user. If omitted, it is read from the ' +
+                        PASSWORD_VARIABLE + ' environment variable or prompted for.')
+    parser.add_argument('--tenant-id', required=True)
+    parser.add_argument('--gateway-instance', help='Instance of the gateway, if it differs from the instance')
+    parser.add_argument('--protocol', choices=PROTOCOLS, default='mqtt')
+    parser.add_argument('--devices', type=int, default=100, help='Number of simulated devices')
+    parser.add_argument('--prefix', default='simulated-device-', help='Prefix of the device names')
+    parser.add_argument('--gateway-id', help='Gateway new devices are created for')
+    parser.add_argument('--sensor-type-id', help='Sensor type of the sensors created for new devices')
+    parser.add_argument('--capability-alternate-id', default='capability')
+    parser.add_argument('--sensor-alternate-id', default='sensor')
+    parser.add_argument('--properties', default='value', help='Comma separated property names of a measure')
+    parser.add_argument('--rate', type=float, default=1.0, help='Messages per second and device')
+    parser.add_argument('--batch-size', type=int, default=1, help='Measures per message')
+    parser.add_argument('--shape', choices=SHAPES, default='random', help='How values develop over time')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Relative deviation of the send interval')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to send for')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--rest-workers', type=int, default=16, help='Concurrent posts per process over REST')
+    parser.add_argument('--command-rate', type=float, default=0.0, help='Commands per second through the API')
+    parser.add_argument('--command-capability-id', help='Capability of the commands')
+    parser.add_argument('--command-property', default='timestamp', help='Command property carrying the send time')
+    parser.add_argument('--certificate-directory', help='Directory to keep the device certificates in')
+    parser.add_argument('--report-interval', type=float, default=5.0, help='Seconds between progress reports')
+    parser.add_argument('--output', help='Path of the JSON report, stdout if omitted')
+    args = parser.parse_args(argv)
+    password = args.password
+    if password is None:
+        password = os.environ.get(PASSWORD_VARIABLE)
+    if password is None:
+        password = getpass.getpass('Password of ' + args.user + ': ')
+
+    def print_progress(progress):
+        sys.stderr.write('sent {sent} acked {acked} errors {errors} commands {commands}\n'.format(**progress))
+
+    try:
+        simulator = FleetSimulator(
+            args.instance, args.user, password, args.tenant_id, gateway_instance=args.gateway_instance,
+            protocol=args.protocol, devices=args.devices, prefix=args.prefix, gateway_id=args.gateway_id,
+            sensor_type_id=args.sensor_type_id, capability_alternate_id=args.capability_alternate_id,
+            sensor_alternate_id=args.sensor_alternate_id, properties=args.properties.split(','), rate=args.rate,
+            batch_size=args.batch_size, shape=args.shape, jitter=args.jitter, duration=args.duration,
+            processes=args.processes, rest_workers=args.rest_workers, command_rate=args.command_rate,
+            command_capability_id=args.command_capability_id, command_property=args.command_property,
+            certificate_directory=args.certificate_directory, report_interval=args.report_interval,
+            on_progress=print_progress)
+    except ValueError as err:
+        parser.error(str(err))
+
+    report = simulator.run()
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent identical calls into one.
+
+    While a call for a key is in flight, further calls for the same key wait for it and receive its result or
+    exception instead of starting their own call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Runs func unless a call for key is already in flight, and returns its result
+
+        Arguments:
+            key {hashable} -- Identifies identical calls
+            func {callable} -- The call
+
+        Returns:
+            object -- The result of the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def forget(self):
+        """Lets later calls start their own call instead of joining the calls in flight, e.g. after a write made
+        their results stale. The calls in flight still complete for the callers waiting for them.
+        """
+        with self._lock:
+            self._calls.clear()
+
+    def in_flight(self) -> int:
+        """Returns the number of calls currently in flight
+
+        Returns:
+            int -- Number of calls
+        """
+        with self._lock:
+            return len(self._calls)
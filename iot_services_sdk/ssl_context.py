@@ -0,0 +1,218 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import hashlib
+import os
+import ssl
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):
+    """Stores the TLS session of its connection in the context after the handshake and before closing"""
+
+    def do_handshake(self, *args, **kwargs):
+        super(_ResumingSSLSocket, self).do_handshake(*args, **kwargs)
+        self.context.store_session(self)
+
+    def close(self):
+        # TLS 1.3 session tickets are only received after the handshake, so store the session again
+        try:
+            self.context.store_session(self)
+        except (OSError, ValueError):
+            pass
+        super(_ResumingSSLSocket, self).close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSL context which resumes the TLS sessions of earlier connections to the same server.
+
+    Resumed handshakes skip the key exchange and certificate verification, which makes reconnects considerably
+    cheaper for both sides. Servers that do not accept the session simply fall back to a full handshake.
+    """
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        super(ResumingSSLContext, self).__init__()
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None and not server_side:
+            with self._sessions_lock:
+                session = self._sessions.get(_session_key(sock, server_hostname))
+        return super(ResumingSSLContext, self).wrap_socket(
+            sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname, session=session)
+
+    def store_session(self, ssl_socket: ssl.SSLSocket):
+        """Remembers the session of the socket for the next connection to the same server
+
+        Arguments:
+            ssl_socket {ssl.SSLSocket} -- The connected socket
+        """
+        if ssl_socket.server_side:
+            return
+        session = ssl_socket.session
+        if session is None or not (session.has_ticket or len(session.id) > 0):
+            return
+        with self._sessions_lock:
+            self._sessions[_session_key(ssl_socket, ssl_socket.server_hostname)] = session
+
+    def clear_sessions(self):
+        """Forgets all stored sessions"""
+        with self._sessions_lock:
+            self._sessions.clear()
+
+
+class SSLContextCache(object):
+    """Process-wide cache of client SSL contexts, keyed by the fingerprint of the PEM and the secret.
+
+    Loading an encrypted PEM decrypts the private key, which is expensive. Clients for the same certificate share one
+    context instead, and with it the TLS sessions for resumption.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """Instantiate SSLContextCache object
+
+        Keyword Arguments:
+            max_entries {int} -- Maximum number of cached contexts (default: {1024})
+        """
+        self.max_entries = max_entries
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pemfile: str, secret: str, tls_version=None, verify: bool = False, pem=None) -> ssl.SSLContext:
+        """Returns the SSL context for the PEM file or PEM content, creating it if it is not cached
+
+        Arguments:
+            pemfile {str} -- Path to the PEM file containing certificate and encrypted key. Ignored if pem is given.
+            secret {str} -- Secret to decrypt the key
+
+        Keyword Arguments:
+            tls_version {int} -- TLS protocol version. If None, the highest version available is used. (default: {None})
+            verify {bool} -- If set to true, the server certificate is verified against the default CA certificates (default: {False})
+            pem {str|bytes} -- Content of the PEM, e.g. as returned by get_device_pem (default: {None})
+
+        Returns:
+            ssl.SSLContext -- The SSL context
+        """
+        if pem is None:
+            with open(pemfile, 'rb') as pem_file:
+                fingerprint = hashlib.sha256(pem_file.read()).hexdigest()
+        else:
+            fingerprint = hashlib.sha256(_to_bytes(pem)).hexdigest()
+        key = (fingerprint, _secret_hash(secret), tls_version, verify)
+
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is not None:
+                self._contexts.move_to_end(key)
+                return context
+
+        context = create_ssl_context(pemfile, secret, tls_version=tls_version, verify=verify, pem=pem)
+        with self._lock:
+            self._contexts[key] = context
+            while len(self._contexts) > self.max_entries:
+                self._contexts.popitem(last=False)
+        return context
+
+    def clear(self):
+        """Removes all cached contexts"""
+        with self._lock:
+            self._contexts.clear()
+
+
+def create_ssl_context(pemfile: str, secret: str, tls_version=None, verify: bool = False,
+                       pem=None) -> ssl.SSLContext:
+    """Creates a client SSL context with TLS session resumption
+
+    Arguments:
+        pemfile {str} -- Path to the PEM file containing certificate and encrypted key. Ignored if pem is given.
+        secret {str} -- Secret to decrypt the key
+
+    Keyword Arguments:
+        tls_version {int} -- TLS protocol version. If None, the highest version available is used. (default: {None})
+        verify {bool} -- If set to true, the server certificate is verified against the default CA certificates (default: {False})
+        pem {str|bytes} -- Content of the PEM, e.g. as returned by get_device_pem (default: {None})
+
+    Raises:
+        ValueError -- Raised if the platform does not support TLS
+
+    Returns:
+        ssl.SSLContext -- The SSL context
+    """
+    if ssl is None:
+        raise ValueError('This platform has no SSL/TLS.')
+    if not hasattr(ssl, 'SSLContext'):
+        # Require Python version that has SSL context support in standard library
+        raise ValueError('Python 2.7.9 and 3.2 are the minimum supported versions for TLS.')
+
+    if tls_version is None:
+        tls_version = ssl.PROTOCOL_TLSv1
+        # If the python version supports it, use highest TLS version automatically
+        if hasattr(ssl, "PROTOCOL_TLS"):
+            tls_version = ssl.PROTOCOL_TLS
+    context = ResumingSSLContext(tls_version)
+
+    if pem is not None:
+        with _pem_path(pem) as path:
+            context.load_cert_chain(path, password=secret)
+    elif pemfile is not None:
+        context.load_cert_chain(pemfile, password=secret)
+
+    if verify:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.check_hostname = True
+        context.load_default_certs()
+
+    return context
+
+
+ssl_context_cache = SSLContextCache()
+
+
+@contextmanager
+def _pem_path(pem):
+    # ssl can only load certificates from paths, so hand it an anonymous in-memory file where the platform has one
+    pem = _to_bytes(pem)
+    if hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+        fd = os.memfd_create('pem', os.MFD_CLOEXEC)
+        try:
+            os.write(fd, pem)
+            yield '/proc/self/fd/' + str(fd)
+        finally:
+            os.close(fd)
+        return
+
+    # Otherwise fall back to a private temporary file which only exists while the PEM is loaded
+    fd, path = tempfile.mkstemp(suffix='.pem')
+    try:
+        with os.fdopen(fd, 'wb') as pem_file:
+            pem_file.write(pem)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _to_bytes(pem) -> bytes:
+    return pem.encode('utf-8') if isinstance(pem, str) else bytes(pem)
+
+
+def _secret_hash(secret) -> str:
+    if secret is None:
+        return None
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return hashlib.sha256(secret).hexdigest()
+
+
+def _session_key(sock, server_hostname):
+    try:
+        port = sock.getpeername()[1]
+    except (OSError, IndexError, TypeError):
+        port = None
+    return server_hostname, port
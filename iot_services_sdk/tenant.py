@@ -162,7 +162,7 @@ class TenantService(IoTService):
             Response -- Response object
         """
         service = self.service + '/' + tenant_id + '/trustedCACertificates'
-        return super().request_core(method='GET', service=service, accept_json=True)
+        return super().request_core(method='GET', service=service, accept_json=True, revalidate=True)
 
     def get_gateway_registration_client_cert(self, tenant_id: str) -> Response:
         """The endpoint is used to list the fingerprints and expiration dates for gateway registration certificates of the given tenant.
@@ -45,7 +45,7 @@ class TenantIoTService(IoTService):
         self._service_base_path = '/tenant/' + tenant_id
 
     def request_core(self, method=None, service=None, headers=None, payload=None, accept_json=False, query=None,
-                     files=None) -> Response:
+                     files=None, stream=False, revalidate=False) -> Response:
         """Fires a HTTP request to core services
 
         Keyword Arguments:
@@ -56,10 +56,12 @@ class TenantIoTService(IoTService):
             accept_json {bool} -- If set to true, the response is parsed a JSON (default: {False})
             query {str} -- Query for filtering (default: {None})
             files {str} -- Path to files (default: {None})
+            stream {bool} -- If set to true, the body is streamed from the connection (default: {False})
+            revalidate {bool} -- If set to true, GET responses are cached and revalidated with conditional requests (default: {False})
 
         Returns:
             Response -- Response object
         """
 
         service = self._service_base_path + service
-        return super().request_core(method=method, service=service, headers=headers, payload=payload, accept_json=accept_json, query=query, files=files)
\ No newline at end of file
+        return super().request_core(method=method, service=service, headers=headers, payload=payload, accept_json=accept_json, query=query, files=files, stream=stream, revalidate=revalidate)
\ No newline at end of file
@@ -0,0 +1,204 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import functools
+
+# The OpenTelemetry API is optional. It is imported on first use and all spans are no-ops without it.
+trace = None
+context = None
+propagate = None
+_imported = False
+
+_tracer = None
+# Global tracer provider of OpenTelemetry and the tracer taken from it, or None if the provider does not record
+_default = (None, None)
+
+SPAN_KIND_CLIENT = 'CLIENT'
+SPAN_KIND_PRODUCER = 'PRODUCER'
+SPAN_KIND_CONSUMER = 'CONSUMER'
+
+
+class _NoOpSpan(object):
+    """Stands in for spans while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+NO_OP_SPAN = _NoOpSpan()
+
+
+def set_tracer(tracer):
+    """Sets the tracer the SDK creates its spans with
+
+    By default, the tracer of the global OpenTelemetry tracer provider is used if the OpenTelemetry API is installed
+    and an SDK is configured. Tracing stays off while the global provider is the proxy or no-op provider of the API
+    or samples no spans at all.
+
+    Arguments:
+        tracer {opentelemetry.trace.Tracer} -- The tracer. If None, the default is used again.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    """Returns the tracer the SDK creates its spans with
+
+    Returns:
+        opentelemetry.trace.Tracer -- The tracer or None if tracing is off because OpenTelemetry is not installed or its spans are not recorded
+    """
+    global _default
+    if _tracer is not None:
+        return _tracer
+    if not _import_opentelemetry():
+        return None
+    provider = trace.get_tracer_provider()
+    default = _default
+    if default[0] is not provider:
+        # The tracer is only taken again when the application replaces the global provider, e.g. by configuring
+        # the SDK after the first span
+        default = _default = (provider, provider.get_tracer('iot_services_sdk') if _is_recording(provider) else None)
+    return default[1]
+
+
+def start_span(name: str, kind: str = None, attributes: dict = None):
+    """Starts a span which is the current span until the returned context manager exits
+
+    Arguments:
+        name {str} -- Name of the span
+
+    Keyword Arguments:
+        kind {str} -- One of the SPAN_KIND constants. If None, the span is internal. (default: {None})
+        attributes {dict} -- Attributes of the span (default: {None})
+
+    Returns:
+        object -- Context manager yielding the span, which is a no-op span if tracing is off
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NO_OP_SPAN
+    return tracer.start_as_current_span(name, **_get_span_arguments(kind, attributes))
+
+
+def start_detached_span(name: str, kind: str = None, attributes: dict = None):
+    """Starts a span which is a child of the current span but does not become current, e.g. to be ended by a callback
+
+    Arguments:
+        name {str} -- Name of the span
+
+    Keyword Arguments:
+        kind {str} -- One of the SPAN_KIND constants. If None, the span is internal. (default: {None})
+        attributes {dict} -- Attributes of the span (default: {None})
+
+    Returns:
+        opentelemetry.trace.Span -- The span, which has to be ended with end(). A no-op span if tracing is off.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NO_OP_SPAN
+    return tracer.start_span(name, **_get_span_arguments(kind, attributes))
+
+
+def set_error(span, description: str):
+    """Marks a span as failed
+
+    Arguments:
+        span {opentelemetry.trace.Span} -- The span
+        description {str} -- Description of the error
+    """
+    if span is NO_OP_SPAN:
+        return
+    if _import_opentelemetry():
+        span.set_status(trace.Status(trace.StatusCode.ERROR, description))
+    else:
+        span.set_attribute('error.message', description)
+
+
+def inject(headers: dict) -> dict:
+    """Returns the headers with the W3C trace context of the current span added, so that servers can join the trace
+
+    Arguments:
+        headers {dict} -- HTTP headers or None
+
+    Returns:
+        dict -- A copy of the headers with trace context, or the headers as given if tracing is off
+    """
+    if get_tracer() is None or not _import_opentelemetry():
+        return headers
+    carrier = dict(headers or {})
+    propagate.inject(carrier)
+    return carrier
+
+
+def wrap(func):
+    """Binds a function to the current trace context, so that spans it starts in another thread, e.g. in a
+    ThreadPoolExecutor, are children of the current span
+
+    Arguments:
+        func {callable} -- The function
+
+    Returns:
+        callable -- The bound function, or func itself if tracing is off
+    """
+    if get_tracer() is None or not _import_opentelemetry():
+        return func
+    captured = context.get_current()
+
+    @functools.wraps(func)
+    def run_in_context(*args, **kwargs):
+        token = context.attach(captured)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+
+    return run_in_context
+
+
+def _get_span_arguments(kind: str, attributes: dict) -> dict:
+    arguments = {}
+    if attributes is not None:
+        arguments['attributes'] = attributes
+    if kind is not None and _import_opentelemetry():
+        arguments['kind'] = getattr(trace.SpanKind, kind)
+    return arguments
+
+
+def _is_recording(provider) -> bool:
+    no_op_types = tuple(getattr(trace, name) for name in ('ProxyTracerProvider', 'NoOpTracerProvider')
+                        if hasattr(trace, name))
+    if isinstance(provider, no_op_types):
+        return False
+    # Only a sampler which drops every span turns tracing off. E.g. ParentBased(root=ALWAYS_OFF) still records the
+    # spans of sampled remote parents.
+    sampler = getattr(provider, 'sampler', None)
+    return sampler is None or sampler.get_description() != 'AlwaysOffSampler'
+
+
+def _import_opentelemetry() -> bool:
+    global trace, context, propagate, _imported
+    if not _imported:
+        try:
+            from opentelemetry import trace, context, propagate
+        except ImportError:
+            pass
+        _imported = True
+    return trace is not None
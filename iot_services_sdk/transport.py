@@ -0,0 +1,353 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .http2 import HTTP2Session
+from .instrumentation import instrumentation as default_instrumentation, RequestEvent, SOURCE_CORE, get_body_size, \
+    get_response_size
+from .rate_limit import Governor
+from .single_flight import SingleFlight
+from .validator_cache import ValidatorCache
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+AUTH_BASIC = 'basic'
+AUTH_SESSION = 'session'
+
+# Names of the cookies which carry the session after a login. Other cookies, e.g. load balancer affinity cookies
+# like __VCAP_ID__, do not authenticate requests.
+SESSION_COOKIE_NAMES = ('JSESSIONID', 'SESSION')
+
+
+class RetryBudget(object):
+    """Limits retries to a ratio of the requests sent, so that retries cannot multiply the load on an overloaded server.
+
+    Every request deposits ratio tokens, every retry withdraws one token. A minimum number of retries per second is
+    always allowed, so that clients with little traffic can still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._reserve = min_per_second
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._reserve = min(self.min_per_second, self._reserve + (now - self._last_refill) * self.min_per_second)
+            self._last_refill = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            if self._reserve >= 1.0:
+                self._reserve -= 1.0
+                return True
+            return False
+
+
+class RetryPolicy(object):
+    """Decides whether and when failed requests are retried.
+
+    Retries use exponential backoff with full jitter and honour the Retry-After header of the server. Idempotent
+    methods are retried on all retryable status codes and connection errors, other methods only on status codes
+    which guarantee that the request has not been processed, e.g. 429.
+    """
+
+    def __init__(self, total: int = 3, backoff_factor: float = 0.5, max_backoff: float = 30.0,
+                 status_codes=(429, 502, 503, 504), non_idempotent_status_codes=(429,),
+                 respect_retry_after: bool = True, budget: RetryBudget = None):
+        """Instantiate RetryPolicy object
+
+        Keyword Arguments:
+            total {int} -- Maximum number of retries per request (default: {3})
+            backoff_factor {float} -- Backoff in seconds before the first retry, doubled for each further retry (default: {0.5})
+            max_backoff {float} -- Upper bound for a single backoff in seconds, also for Retry-After (default: {30.0})
+            status_codes {tuple} -- Status codes which are retried for idempotent methods (default: {(429, 502, 503, 504)})
+            non_idempotent_status_codes {tuple} -- Status codes which are retried for all methods (default: {(429,)})
+            respect_retry_after {bool} -- If set to true, the Retry-After header overrides the computed backoff (default: {True})
+            budget {RetryBudget} -- Budget shared by all requests of the transport. If None, a default budget is used. (default: {None})
+        """
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_codes = frozenset(status_codes)
+        self.non_idempotent_status_codes = frozenset(non_idempotent_status_codes)
+        self.respect_retry_after = respect_retry_after
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def is_retryable(self, method: str, status_code: int = None) -> bool:
+        """Checks if a request may be retried
+
+        Arguments:
+            method {str} -- HTTP method
+
+        Keyword Arguments:
+            status_code {int} -- Status code of the response or None for connection errors (default: {None})
+
+        Returns:
+            bool -- True if the request may be retried
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        if status_code is None:
+            return idempotent
+        if status_code in self.non_idempotent_status_codes:
+            return True
+        return idempotent and status_code in self.status_codes
+
+    def get_backoff(self, retry: int, headers=None) -> float:
+        """Returns the number of seconds to wait before a retry
+
+        Arguments:
+            retry {int} -- Number of the retry, starting with 0
+
+        Keyword Arguments:
+            headers {dict} -- Headers of the failed response (default: {None})
+
+        Returns:
+            float -- Seconds to wait
+        """
+        if self.respect_retry_after and headers is not None:
+            retry_after = _parse_retry_after(headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        # Full jitter spreads the retries of concurrent clients over the whole backoff interval
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** retry)))
+
+
+class Transport(object):
+    """HTTP transport shared by all services of an instance and user.
+
+    Keeps a pooled session, so that connections are reused across calls, retries transient failures according
+    to its retry policy and adapts its request rate and concurrency per tenant to the throttling of the server.
+    """
+
+    def __init__(self, user: str, password: str, retry_policy: RetryPolicy = None, governor: Governor = None,
+                 pool_maxsize: int = 32, auth_mode: str = AUTH_BASIC, coalesce_gets: bool = False,
+                 http2: bool = False, instrumentation=None):
+        """Instantiate Transport object
+
+        Arguments:
+            user {str} -- IoT Service user
+            password {str} -- IoT Service password
+
+        Keyword Arguments:
+            retry_policy {RetryPolicy} -- Policy for retries. If None, a default policy is used. (default: {None})
+            governor {Governor} -- Rate and concurrency limits. If None, adaptive default limits are used. Set the governor attribute to None to disable limiting. (default: {None})
+            pool_maxsize {int} -- Maximum number of pooled connections per host (default: {32})
+            auth_mode {str} -- 'basic' sends the credentials with every request. 'session' only sends them to obtain a session cookie (JSESSIONID or SESSION) and authenticates with that cookie afterwards, until it expires. (default: {'basic'})
+            coalesce_gets {bool} -- If set to true, concurrent identical GET requests of request_core share one request. Each caller receives its own Response. A GET which starts after a write of the same transport completed never joins a GET started before it. (default: {False})
+            http2 {bool} -- If set to true, requests are multiplexed over HTTP/2 connections. Requires httpx and h2. (default: {False})
+            instrumentation {Instrumentation} -- Receives an event per request. If None, the shared instrumentation of the module iot_services_sdk.instrumentation is used. (default: {None})
+        """
+        self.user = user
+        self.password = password
+        self.auth_mode = auth_mode
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.governor = governor if governor is not None else Governor(initial_concurrency=pool_maxsize)
+        self.coalesce_gets = coalesce_gets
+        self.single_flight = SingleFlight()
+        self.validators = ValidatorCache()
+        self.instrumentation = instrumentation if instrumentation is not None else default_instrumentation
+        # Host mapped to the name, domain and path of the session cookie set by the last login
+        self._session_cookies = {}
+
+        self.pool_maxsize = pool_maxsize
+        if http2:
+            self.use_http2()
+        else:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def use_http2(self, max_connections: int = 4):
+        """Switches the transport to HTTP/2, so that concurrent requests are multiplexed over a few connections
+
+        Keyword Arguments:
+            max_connections {int} -- Maximum number of connections (default: {4})
+
+        Raises:
+            ImportError -- Raised if httpx or h2 is not installed
+        """
+        previous = getattr(self, 'session', None)
+        self.session = HTTP2Session(max_connections=max_connections)
+        if previous is not None:
+            previous.close()
+
+    def request(self, method: str, url: str, headers=None, data=None, files=None, stream=False) -> requests.Response:
+        """Sends a request and retries it on transient failures
+
+        Arguments:
+            method {str} -- HTTP method
+            url {str} -- URL of the request
+
+        Keyword Arguments:
+            headers {dict} -- HTTP headers (default: {None})
+            data {str} -- Message payload (default: {None})
+            files {str} -- Files to upload. Requests with files are never retried. (default: {None})
+            stream {bool} -- If set to true, the body is not read upfront (default: {False})
+
+        Raises:
+            requests.exceptions.ConnectionError -- Raised if the connection failed and no retry is left
+
+        Returns:
+            requests.Response -- The last response received
+        """
+        events = self.instrumentation
+        start = time.perf_counter() if events.enabled else None
+        policy = self.retry_policy
+        policy.budget.deposit()
+        retry = 0
+        response = None
+        error = None
+        try:
+            while True:
+                try:
+                    response = self._send_governed(method, url, headers=headers, data=data, files=files,
+                                                   stream=stream)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if files is not None or retry >= policy.total or not policy.is_retryable(method) \
+                            or not policy.budget.withdraw():
+                        raise
+                    time.sleep(policy.get_backoff(retry))
+                    retry += 1
+                    continue
+
+                if files is not None or retry >= policy.total \
+                        or not policy.is_retryable(method, response.status_code) or not policy.budget.withdraw():
+                    return response
+
+                backoff = policy.get_backoff(retry, response.headers)
+                response.close()
+                response = None
+                time.sleep(backoff)
+                retry += 1
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            if start is not None:
+                events.emit(RequestEvent(
+                    SOURCE_CORE, method, url, status_code=response.status_code if response is not None else None,
+                    latency=time.perf_counter() - start, request_bytes=get_body_size(data) if files is None else None,
+                    response_bytes=get_response_size(response, stream) if response is not None else None,
+                    retries=retry, error=error))
+
+    def _send_governed(self, method: str, url: str, **kwargs) -> requests.Response:
+        governor = self.governor
+        if governor is None:
+            return self._send(method, url, **kwargs)
+
+        governor.acquire(url)
+        start = time.monotonic()
+        status_code = None
+        try:
+            response = self._send(method, url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            governor.release(url, status_code=status_code, latency=time.monotonic() - start)
+
+    @property
+    def auth_mode(self):
+        """Authentication mode of the transport, either 'basic' or 'session'"""
+        return self._auth_mode
+
+    @auth_mode.setter
+    def auth_mode(self, auth_mode):
+        if auth_mode not in (AUTH_BASIC, AUTH_SESSION):
+            raise ValueError('The auth mode must be either "' + AUTH_BASIC + '" or "' + AUTH_SESSION + '".')
+        self._auth_mode = auth_mode
+
+    def _send(self, method: str, url: str, headers=None, data=None, files=None, stream=False) -> requests.Response:
+        if self._auth_mode != AUTH_SESSION:
+            return self.session.request(method, url, headers=headers, auth=(self.user, self.password), data=data,
+                                        files=files, stream=stream)
+
+        host = urlsplit(url).hostname
+        if files is None and self._has_session_cookie(host):
+            response = self.session.request(method, url, headers=headers, data=data, stream=stream)
+            if response.status_code != 401:
+                return response
+            # The session has expired. Drop its cookie, but keep the others, and log in again with the credentials.
+            response.close()
+            self._clear_session_cookie(host)
+        response = self.session.request(method, url, headers=headers, auth=(self.user, self.password), data=data,
+                                        files=files, stream=stream)
+        self._record_session_cookie(host, response)
+        return response
+
+    def _record_session_cookie(self, host: str, response):
+        for cookie in getattr(response, 'cookies', ()):
+            if cookie.name in SESSION_COOKIE_NAMES:
+                self._session_cookies[host] = (cookie.name, cookie.domain, cookie.path)
+                return
+
+    def _has_session_cookie(self, host: str) -> bool:
+        recorded = self._session_cookies.get(host)
+        if recorded is None:
+            return False
+        self.session.cookies.clear_expired_cookies()
+        return any((cookie.name, cookie.domain, cookie.path) == recorded for cookie in self.session.cookies)
+
+    def _clear_session_cookie(self, host: str):
+        recorded = self._session_cookies.pop(host, None)
+        if recorded is None:
+            return
+        name, domain, path = recorded
+        try:
+            self.session.cookies.clear(domain, path, name)
+        except KeyError:
+            pass
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(instance: str, user: str, password: str) -> Transport:
+    """Returns the transport shared by all services for the instance and user
+
+    Arguments:
+        instance {str} -- IoT Service instance
+        user {str} -- IoT Service user
+        password {str} -- IoT Service password
+
+    Returns:
+        Transport -- The shared transport
+    """
+    key = (instance, user, password)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = Transport(user, password)
+            _transports[key] = transport
+        return transport
+
+
+def _parse_retry_after(value) -> float:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
@@ -1,7 +1,10 @@
 """ Author: Philipp Steinrötter (steinroe) """
 
+import hashlib
+import json
 import time
 import logging
+from datetime import datetime, timezone
 from http.client import HTTPConnection
 
 
@@ -48,12 +51,87 @@ def build_query(filters=None, orderby=None, asc=True, skip=None, top=None) -> st
         return None
 
 
+def get_base_url(instance: str) -> str:
+    """Returns the base URL of an instance
+
+    Arguments:
+        instance {str} -- IoT Services instance. Instances given with scheme, e.g. http://localhost:8080 for a local mock server, are used as is.
+
+    Returns:
+        str -- The base URL
+    """
+    if instance.startswith('http://') or instance.startswith('https://'):
+        return instance.rstrip('/')
+    return 'https://' + instance
+
+
 def current_milli_time():
     return int(round(time.time() * 1000))
 
 
+def to_milli_time(value) -> int:
+    """Converts a timestamp to UNIX time in milliseconds
+
+    Arguments:
+        value {int|datetime|str} -- UNIX time in milliseconds, a datetime (naive datetimes are treated as UTC) or an ISO 8601 string
+
+    Returns:
+        int -- UNIX time in milliseconds
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(round(value.timestamp() * 1000))
+    if isinstance(value, str):
+        return to_milli_time(datetime.fromisoformat(value.replace('Z', '+00:00')))
+    return int(value)
+
+
+def format_timestamp(milli_time: int) -> str:
+    """Formats UNIX time in milliseconds as used by the timestamp filters of the API
+
+    Arguments:
+        milli_time {int} -- UNIX time in milliseconds
+
+    Returns:
+        str -- ISO 8601 timestamp in UTC with millisecond precision, e.g. 2019-05-01T10:00:00.000Z
+    """
+    value = datetime.fromtimestamp(milli_time / 1000.0, tz=timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (milli_time % 1000)
+
+
+def get_measure_key(measure: dict) -> str:
+    """Returns a key identifying a measure by its content, as the API does not return measure ids
+
+    Arguments:
+        measure {dict} -- The measure
+
+    Returns:
+        str -- SHA-1 of the measure serialized with sorted keys
+    """
+    return hashlib.sha1(json.dumps(measure, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_measure_values(measure: dict, properties: list) -> dict:
+    """Returns the values of a measure by property name
+
+    Arguments:
+        measure {dict} -- The measure as returned by DeviceService.get_measures. Its values are read from the 'measure' key, either as dict by property name or as list in property order.
+        properties {list} -- Names of the capability properties in order, used for values given as list
+
+    Returns:
+        dict -- Property name mapped to value. Missing properties are left out.
+    """
+    values = measure.get('measure')
+    if isinstance(values, list):
+        return dict(zip(properties, values))
+    return values if values is not None else {}
+
+
 def debug_requests_on():
     """Switches on logging of the requests module.
+
+    For structured per-request metrics, attach a sink to iot_services_sdk.instrumentation.instrumentation instead.
     """
     HTTPConnection.debuglevel = 1
 
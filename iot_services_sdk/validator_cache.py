@@ -0,0 +1,91 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+from collections import OrderedDict
+
+
+class ValidatorCache(object):
+    """Least recently used cache of responses together with their ETag and Last-Modified validators.
+
+    Used for conditional GET requests: the validators are sent as If-None-Match and If-Modified-Since headers, and
+    the cached response is served if the server answers with 304 Not Modified. Cache entries are handed out as they
+    are, so they should be immutable, e.g. the status, headers and raw body of a response rather than a Response
+    with a decoded result.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """Instantiate ValidatorCache object
+
+        Keyword Arguments:
+            max_entries {int} -- Maximum number of cached responses (default: {1024})
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_conditional_headers(self, key) -> dict:
+        """Returns the conditional request headers for a cached response
+
+        Arguments:
+            key {hashable} -- Identifies the request
+
+        Returns:
+            dict -- If-None-Match and If-Modified-Since headers, empty if nothing is cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {}
+            self._entries.move_to_end(key)
+            etag, last_modified, _ = entry
+
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def get(self, key):
+        """Returns the cached response
+
+        Arguments:
+            key {hashable} -- Identifies the request
+
+        Returns:
+            object -- The cached response or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[2] if entry is not None else None
+
+    def put(self, key, headers, response):
+        """Caches a response if it carries a validator
+
+        Arguments:
+            key {hashable} -- Identifies the request
+            headers {dict} -- Headers of the response
+            response {object} -- The response to cache
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            self.invalidate(key)
+            return
+        with self._lock:
+            self._entries[key] = (etag, last_modified, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Removes a cached response, or all cached responses if no key is given
+
+        Keyword Arguments:
+            key {hashable} -- Identifies the request (default: {None})
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
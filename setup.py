@@ -16,20 +16,24 @@ setup(
   description = 'SDK for SAP IoT Services on Cloud Foundry. Wraps all Device Management APIs as well as both Cloud Gateways.',  
   long_description = long_description,
   long_description_content_type = 'text/markdown',
-  python_requires='>=3',
+  python_requires='>=3.7',
   author = 'Philipp Steinrötter',                  
   author_email = 'philipp.steinroetter@sap.com',     
   url = 'https://github.com/SAP/iot-services-sdk',   
   keywords = 'SAP IoT Services CF SDK MQTT REST Device Management Internet of Things',
   download_url='https://github.com/SAP/iot-services-sdk/archive/1.0.tar.gz',
-  install_requires=['paho-mqtt', 'requests'],
+  install_requires=['paho-mqtt>=1.5,!=2.0.*,<3', 'requests'],
+  entry_points={
+    'console_scripts': ['iot-services-simulator=iot_services_sdk.simulator:main'],
+  },
   classifiers=[
     'Development Status :: 5 - Production/Stable',      
     'Intended Audience :: Developers',   
     'Programming Language :: Python :: 3', 
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
-    'Programming Language :: Python :: 3.7'
+    'Programming Language :: Python :: 3.7',
+    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11'
   ],
 )
\ No newline at end of file
@@ -0,0 +1,156 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import io
+import os
+import re
+import subprocess
+import threading
+from contextlib import contextmanager
+
+import requests
+
+from iot_services_sdk.response import Response
+from iot_services_sdk.utils import to_milli_time
+
+
+def make_response(status_code: int, content: bytes = b'{}', headers: dict = None) -> requests.Response:
+    """Returns a requests.Response as the transport receives it from the server"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = content
+    response.raw = io.BytesIO(content)
+    return response
+
+
+class FakeDeviceService(object):
+    """Answers get_measures from memory, evaluating the timestamp and capabilityId filters like the API.
+
+    Measures are either given as a list shared by all devices or as a dict of lists per device id.
+    """
+
+    def __init__(self, measures):
+        self.measures = measures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_measures(self, device_id, filters=None, orderby=None, asc=True, skip=None, top=None, stream=False):
+        with self._lock:
+            self.calls += 1
+        result = self.measures
+        if isinstance(result, dict):
+            result = result.get(device_id, [])
+        for query in filters or []:
+            match = re.match(r"timestamp (ge|gt|lt|le) '(.*)'", query)
+            if match is not None:
+                operator, value = match.group(1), to_milli_time(match.group(2))
+                compare = {'ge': lambda t: t >= value, 'gt': lambda t: t > value,
+                           'lt': lambda t: t < value, 'le': lambda t: t <= value}[operator]
+                result = [m for m in result if compare(to_milli_time(m['timestamp']))]
+            match = re.match(r"capabilityId eq '(.*)'", query)
+            if match is not None:
+                result = [m for m in result if m.get('capabilityId') == match.group(1)]
+        result = sorted(result, key=lambda m: to_milli_time(m['timestamp']))
+        result = result[int(skip or 0):]
+        if top is not None:
+            result = result[:int(top)]
+        return Response(200, result, {})
+
+
+def create_pem(directory: str, secret: str, name: str = 'device', days: int = 1) -> str:
+    """Creates a self-signed certificate with encrypted key for localhost with the openssl command"""
+    key = os.path.join(directory, name + '.key')
+    cert = os.path.join(directory, name + '.crt')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-keyout', key, '-out', cert, '-days', str(days),
+                    '-subj', '/CN=localhost', '-passout', 'pass:' + secret],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    pemfile = os.path.join(directory, name + '.pem')
+    with open(pemfile, 'wb') as pem:
+        for path in (cert, key):
+            with open(path, 'rb') as part:
+                pem.write(part.read())
+    return pemfile
+
+
+class FakeCertificateService(object):
+    """Answers get_device_pem and get_device_certs with self-signed certificates, one new certificate per download.
+
+    The lifetime of the certificates is rounded down to whole days, at least one.
+    """
+
+    def __init__(self, directory: str, lifetime: int):
+        self.directory = directory
+        self.lifetime = lifetime
+        self.downloads = 0
+        self.certs = {}
+        self.revoked = []
+        self._lock = threading.Lock()
+
+    def get_device_pem(self, device_id):
+        from iot_services_sdk.certificate_store import get_certificate_expiry, get_fingerprint
+        from iot_services_sdk.utils import format_timestamp
+
+        with self._lock:
+            self.downloads += 1
+            name = device_id + '-' + str(self.downloads)
+        days = max(1, self.lifetime // (24 * 3600 * 1000))
+        with open(create_pem(self.directory, 'secret', name=name, days=days), 'r') as pem_file:
+            pem = pem_file.read()
+        expiry = format_timestamp(get_certificate_expiry(pem))
+        with self._lock:
+            self.certs.setdefault(device_id, []).append({'fingerprint': get_fingerprint(pem).upper(),
+                                                         'expiry': expiry})
+        return Response(200, {'pem': pem, 'secret': 'secret'}, {})
+
+    def get_device_certs(self, device_id):
+        with self._lock:
+            return Response(200, list(self.certs.get(device_id, [])), {})
+
+    def revoke_device_cert(self, device_id, fingerprint):
+        with self._lock:
+            self.revoked.append((device_id, fingerprint))
+        return Response(200, None, {})
+
+
+class RecordingSpan(object):
+    def __init__(self, name: str, attributes: dict, parent):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.ended = False
+
+    def is_recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.ended = True
+
+
+class RecordingTracer(object):
+    """Records the spans created through the tracer interface of OpenTelemetry"""
+
+    def __init__(self):
+        self.spans = []
+        self._current = threading.local()
+
+    def start_span(self, name, attributes=None):
+        span = RecordingSpan(name, attributes, getattr(self._current, 'span', None))
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        span = self.start_span(name, attributes)
+        previous = getattr(self._current, 'span', None)
+        self._current.span = span
+        try:
+            yield span
+        finally:
+            self._current.span = previous
+            span.end()
+
+    def get_spans(self, name: str) -> list:
+        return [span for span in self.spans if span.name == name]
@@ -0,0 +1,66 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from benchmarks import ingestion, management
+from benchmarks.common import SendTimes, milliseconds, percentile
+from iot_services_sdk import simulator
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def test_percentile(self) -> None:
+        self.assertEqual(percentile([3, 1, 2, 4], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3], 100), 3)
+        self.assertIsNone(percentile([], 50))
+        # The installed simulator keeps its own copy, which must not drift
+        for q in (0, 50, 90, 99, 100):
+            self.assertEqual(simulator._percentile([5, 1, 3, 2], q), percentile([5, 1, 3, 2], q))
+
+    def test_send_times(self) -> None:
+        sent = {}
+        buffer = SendTimes(sent, threading.Lock())
+        buffer['id'] = 'payload'
+        self.assertEqual(buffer, {'id': 'payload'})
+        self.assertIn('id', sent)
+        self.assertEqual(milliseconds(0.5), 500.0)
+        self.assertIsNone(milliseconds(None))
+
+    def test_ingestion_smoke(self) -> None:
+        output = os.path.join(self.directory, 'ingestion.json')
+        ingestion.main(['--messages', '20', '--widths', '2', '--batch-sizes', '5', '--concurrency', '2',
+                        '--output', output])
+        with open(output) as result_file:
+            document = json.load(result_file)
+        self.assertEqual(document['suite'], 'ingestion')
+        self.assertEqual([result['benchmark'] for result in document['results']],
+                         ['post_measures', 'post_batched_measures', 'mqtt_publish'])
+        for result in document['results']:
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['messages_per_second'], 0)
+        self.assertEqual(document['results'][2]['acked'], 20)
+
+    def test_management_smoke(self) -> None:
+        output = os.path.join(self.directory, 'management.json')
+        management.main(['--iterations', '10', '--calls', '5', '--tenant-size', '30', '--page-size', '10',
+                         '--lookups', '5', '--provisioned', '5', '--concurrency', '2', '--pool-sizes', '2',
+                         '--repeat', '1', '--latency', '0', '--output', output])
+        with open(output) as result_file:
+            document = json.load(result_file)
+        self.assertEqual(document['suite'], 'management')
+        benchmarks = {result['benchmark'] for result in document['results']}
+        self.assertEqual(benchmarks, {'build_query', 'request_construction', 'round_trip', 'list_devices',
+                                      'resolve_alternate_ids', 'provisioning'})
+        for result in document['results']:
+            self.assertEqual(result.get('errors', 0), 0)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
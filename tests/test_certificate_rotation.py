@@ -0,0 +1,116 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from .fakes import FakeCertificateService
+
+from iot_services_sdk import CertificateStore, CertificateRotation, DeviceService, RestClient
+from iot_services_sdk.iot_service import DeviceManagementAPIException
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+
+DAY = 24 * 3600 * 1000
+
+
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl is not installed')
+class CertificateRotationTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.service = FakeCertificateService(self.directory, lifetime=3 * DAY)
+        self.store = CertificateStore(self.service, os.path.join(self.directory, 'store'), renew_before=DAY)
+        self.device_ids = ['device-' + str(i) for i in range(4)]
+
+    def test_rotate_switches_clients_and_revokes(self) -> None:
+        old = self.store.fetch_all(self.device_ids)
+        client = RestClient('localhost', 'device-0', secret=old['device-0']['secret'], pem=old['device-0']['pem'])
+        session = client.session
+
+        progress = []
+        rotation = CertificateRotation(self.store, rate=100.0, max_workers=2,
+                                       on_progress=lambda done, total, result: progress.append((done, total)))
+        rotation.register_client('device-0', client)
+
+        self.assertEqual(rotation.find_expiring(self.device_ids), [])
+        self.assertEqual(rotation.find_expiring(self.device_ids, within=4 * DAY), self.device_ids)
+
+        results = rotation.rotate(self.device_ids)
+        self.assertEqual(progress[-1], (4, 4))
+        for device_id, result in results.items():
+            self.assertIsNone(result['error'])
+            self.assertNotEqual(result['fingerprint'], old[device_id]['fingerprint'])
+            self.assertEqual(result['revoked'], [old[device_id]['fingerprint']])
+            self.assertEqual(self.store.get(device_id)['fingerprint'], result['fingerprint'])
+        self.assertEqual(results['device-0']['clients'], 1)
+        self.assertIsNot(client.session, session)
+        self.assertEqual(len(self.service.revoked), 4)
+
+    def test_failed_revocation_is_reported(self) -> None:
+        class NoRevocationService(FakeCertificateService):
+            def revoke_device_cert(self, device_id, fingerprint):
+                raise DeviceManagementAPIException('Forbidden')
+
+        self.store = CertificateStore(NoRevocationService(self.directory, lifetime=3 * DAY),
+                                      os.path.join(self.directory, 'store'), renew_before=DAY)
+        self.store.fetch_all(self.device_ids[:1])
+        result = CertificateRotation(self.store, rate=None).rotate_device(self.device_ids[0])
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['revoked'], [])
+        self.assertIsInstance(result['revoke_error'], DeviceManagementAPIException)
+
+    def test_device_service_revokes(self) -> None:
+        server = MockIoTServer().start()
+        try:
+            device = server.create('devices', {'name': 'device', 'gatewayId': '1'})
+            service = DeviceService(server.instance, 'user', 'password', '1')
+            store = CertificateStore(service, os.path.join(self.directory, 'server-store'))
+            old = store.get(device['id'])
+            result = CertificateRotation(store, rate=None).rotate_device(device['id'])
+            self.assertIsNone(result['error'])
+            self.assertIsNone(result['revoke_error'])
+            self.assertEqual(result['revoked'], [old['fingerprint']])
+            self.assertEqual([cert['fingerprint'] for cert in service.get_device_certs(device['id']).get_result()],
+                             [result['fingerprint']])
+        finally:
+            server.stop()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+
+class RestClientCertificateTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.gateway = MockGateway().start()
+        self.client = RestClient(self.gateway.rest_instance, 'device')
+
+    def test_idle_session_is_closed(self) -> None:
+        previous = self.client.session
+        with mock.patch.object(previous, 'close') as close:
+            self.client.set_certificate()
+        self.assertEqual(close.call_count, 1)
+        self.client.post_measures('capability', 'sensor', [{'temp': 20}])
+
+    def test_session_is_closed_after_requests_in_flight(self) -> None:
+        self.gateway.latency = 0.3
+        previous = self.client.session
+        with mock.patch.object(previous, 'close') as close:
+            post = threading.Thread(target=self.client.post_measures, args=('capability', 'sensor', [{'temp': 20}]))
+            post.start()
+            while len(self.client._in_flight) == 0:
+                threading.Event().wait(0.005)
+            self.client.set_certificate()
+            self.assertEqual(close.call_count, 0)
+            post.join()
+            self.assertEqual(close.call_count, 1)
+        self.assertIsNot(self.client.session, previous)
+        self.assertEqual(self.client._in_flight, {})
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.gateway.stop()
@@ -0,0 +1,93 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+
+from .fakes import FakeCertificateService, create_pem
+
+from iot_services_sdk import CertificateStore
+from iot_services_sdk.certificate_store import get_certificate_expiry
+from iot_services_sdk.response import Response
+from iot_services_sdk.utils import current_milli_time, to_milli_time
+
+DAY = 24 * 3600 * 1000
+
+
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl is not installed')
+class CertificateStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.store_directory = os.path.join(self.directory, 'store')
+        self.service = FakeCertificateService(self.directory, lifetime=30 * DAY)
+
+    def test_certificate_is_downloaded_once(self) -> None:
+        store = CertificateStore(self.service, self.store_directory)
+        entry = store.get('device-a')
+        self.assertEqual(entry['secret'], 'secret')
+        self.assertAlmostEqual(entry['expiry'], current_milli_time() + 30 * DAY, delta=60000)
+
+        pemfile, secret = store.get_pemfile('device-a')
+        self.assertTrue(pemfile.endswith(entry['fingerprint'] + '.pem'))
+        self.assertEqual(stat.S_IMODE(os.stat(pemfile).st_mode), 0o600)
+
+        # A new store instance finds the certificate on disk
+        store = CertificateStore(self.service, self.store_directory)
+        self.assertEqual(store.get('device-a')['fingerprint'], entry['fingerprint'])
+        self.assertEqual(self.service.downloads, 1)
+
+    def test_expiring_certificate_is_renewed(self) -> None:
+        store = CertificateStore(self.service, self.store_directory, renew_before=31 * DAY)
+        first = store.get('device-a')
+        self.assertEqual(store.get_expiring(), ['device-a'])
+
+        second = store.get('device-a')
+        self.assertNotEqual(first['fingerprint'], second['fingerprint'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.store_directory, 'device-a'))),
+                         [second['fingerprint'] + '.json', second['fingerprint'] + '.pem'])
+
+    def test_fetch_all(self) -> None:
+        store = CertificateStore(self.service, self.store_directory, max_workers=4)
+        store.get('device-0')
+        device_ids = ['device-' + str(i) for i in range(6)]
+        entries = store.fetch_all(device_ids)
+        self.assertEqual(sorted(entries), device_ids)
+        self.assertEqual(self.service.downloads, 6)
+
+    def test_certificate_expiry(self) -> None:
+        pemfile = create_pem(self.directory, 'secret', name='expiry', days=400)
+        end_date = subprocess.run(['openssl', 'x509', '-in', pemfile, '-noout', '-enddate', '-dateopt', 'iso_8601'],
+                                  check=True, stdout=subprocess.PIPE).stdout.decode('ascii')
+        with open(pemfile, 'r') as pem_file:
+            expiry = get_certificate_expiry(pem_file.read())
+        self.assertEqual(expiry, to_milli_time(end_date.strip().split('=')[1].replace(' ', 'T')))
+
+        self.assertRaises(ValueError, get_certificate_expiry, 'no certificate')
+        self.assertRaises(ValueError, get_certificate_expiry,
+                          '-----BEGIN CERTIFICATE-----\nMAMCAQE=\n-----END CERTIFICATE-----\n')
+
+    def test_listing_without_expiry(self) -> None:
+        self.service.get_device_certs = lambda device_id: Response(200, [{'fingerprint': 'AB:CD'}], {})
+        store = CertificateStore(self.service, self.store_directory)
+        self.assertRaises(ValueError, store.get_latest_expiry, 'device-a')
+
+    def test_revoke_current_certificate(self) -> None:
+        store = CertificateStore(self.service, self.store_directory)
+        revoked = store.get('device-a')
+        store.revoke('device-a', revoked['fingerprint'].upper())
+        self.assertEqual(self.service.revoked, [('device-a', revoked['fingerprint'])])
+        self.assertIsNone(store.get_stored('device-a'))
+        self.assertNotEqual(store.get('device-a')['fingerprint'], revoked['fingerprint'])
+        self.assertEqual(self.service.downloads, 2)
+
+    def test_invalid_device_id(self) -> None:
+        store = CertificateStore(self.service, self.store_directory)
+        with self.assertRaises(ValueError):
+            store.get('../device')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
@@ -0,0 +1,63 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import unittest
+from unittest import mock
+
+from iot_services_sdk import CapabilityService
+from iot_services_sdk.mock_server import MockIoTServer
+from iot_services_sdk.validator_cache import ValidatorCache
+
+from .fakes import make_response
+
+
+class ConditionalRequestTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.capability_service = CapabilityService('conditional.instance', 'user', 'password', 'tenant')
+        self.sent_headers = []
+
+    def _request(self, method, url, headers=None, data=None, files=None, stream=False):
+        self.sent_headers.append(headers or {})
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            return make_response(304, b'', {'ETag': '"v1"'})
+        return make_response(200, b'{"id": "cap"}', {'ETag': '"v1"'})
+
+    def test_not_modified_serves_cached_response(self) -> None:
+        with mock.patch.object(self.capability_service.transport, 'request', side_effect=self._request):
+            first = self.capability_service.get_capability('cap')
+            second = self.capability_service.get_capability('cap')
+
+        self.assertEqual(second.get_status_code(), 200)
+        self.assertEqual(second.get_result(), {'id': 'cap'})
+        self.assertEqual(first.get_result(), second.get_result())
+        self.assertIsNot(first, second)
+        self.assertNotIn('If-None-Match', self.sent_headers[0])
+        self.assertEqual(self.sent_headers[1]['If-None-Match'], '"v1"')
+
+    def test_cached_result_is_not_shared(self) -> None:
+        server = MockIoTServer(user='user', password='password').start()
+        try:
+            capability = server.create('capabilities', {'name': 'capability', 'properties': []}, tenant_id='tenant')
+            capability_service = CapabilityService(server.instance, 'user', 'password', 'tenant')
+            first = capability_service.get_capability(capability['id'])
+            first.get_result()['properties'].append({'name': 'local'})
+            second = capability_service.get_capability(capability['id'])
+            second.get_result()['properties'].append({'name': 'local'})
+            third = capability_service.get_capability(capability['id'])
+            self.assertEqual(third.get_result()['properties'], [])
+        finally:
+            server.stop()
+
+    def test_lru_eviction(self) -> None:
+        cache = ValidatorCache(max_entries=2)
+        cache.put('a', {'ETag': '1'}, 'response-a')
+        cache.put('b', {'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}, 'response-b')
+        cache.get_conditional_headers('a')
+        cache.put('c', {'ETag': '3'}, 'response-c')
+        self.assertEqual(cache.get('a'), 'response-a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get_conditional_headers('c'), {'If-None-Match': '3'})
+
+        # Responses without validators are not cached
+        cache.put('a', {}, 'response-a2')
+        self.assertIsNone(cache.get('a'))
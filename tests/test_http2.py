@@ -0,0 +1,76 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import importlib.util
+import unittest
+
+import requests
+
+from iot_services_sdk import RestClient, RESTGatewayException, Transport
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+
+HAS_HTTP2 = importlib.util.find_spec('httpx') is not None and importlib.util.find_spec('h2') is not None
+
+
+@unittest.skipUnless(HAS_HTTP2, 'httpx and h2 are not installed')
+class HTTP2Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        import httpx
+
+        def handler(request):
+            if request.url.path == '/missing':
+                return httpx.Response(404, json={'message': 'not found'})
+            return httpx.Response(200, json={'auth': request.headers.get('Authorization'),
+                                             'body': request.content.decode('utf-8')})
+
+        self.transport = Transport('user', 'password', http2=True)
+        self.transport.governor = None
+        # Replace the network layer, the HTTP/2 session logic stays the same
+        self.transport.session.client = httpx.Client(transport=httpx.MockTransport(handler))
+
+    def test_request(self) -> None:
+        response = self.transport.request('POST', 'https://instance/devices', data='{"name": "d"}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('application/json'))
+        result = response.content
+        self.assertIn(b'"body":"{\\"name\\": \\"d\\"}"', result)
+        self.assertIn(b'Basic ', result)
+
+    def test_stream_and_errors(self) -> None:
+        response = self.transport.request('GET', 'https://instance/devices', stream=True)
+        self.assertTrue(b''.join(response.iter_content(4)).startswith(b'{'))
+
+        response = self.transport.request('GET', 'https://instance/missing')
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            response.raise_for_status()
+        self.assertIn('not found', context.exception.response.text)
+
+
+@unittest.skipUnless(HAS_HTTP2, 'httpx and h2 are not installed')
+class RestClientHTTP2Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer().start()
+        self.device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.gateway = MockGateway(server=self.server).start()
+
+    def test_post_measures(self) -> None:
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'], http2=True)
+        response = client.post_measures('capability', 'sensor', [{'temp': 20}], use_timestamp=True)
+        self.assertEqual(response.get_status_code(), 202)
+        self.assertEqual(len(self.server.measures[self.device['id']]), 1)
+
+        self.gateway.error_rate = 1.0
+        messages = [{'capabilityAlternateId': 'capability', 'sensorAlternateId': 'sensor', 'measures': [{'temp': 1}]}]
+        self.assertRaises(RESTGatewayException, client.post_batched_measures, messages)
+
+    def test_same_inputs_as_http1(self) -> None:
+        for http2 in (False, True):
+            self.assertRaises(ValueError, RestClient, 'myinstance.eu10.cp.iot.sap', 'device', http2=http2)
+            self.assertRaises(ValueError, RestClient, self.gateway.rest_instance, 'device', pemfile='device.pem',
+                              http2=http2)
+
+    def tearDown(self) -> None:
+        self.gateway.stop()
+        self.server.stop()
@@ -0,0 +1,124 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import logging
+import unittest
+
+from iot_services_sdk import DeviceService, DeviceManagementAPIException, RestClient, RESTGatewayException, Transport, \
+    RetryPolicy, Instrumentation, LoggingSink, CounterSink
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+from iot_services_sdk.instrumentation import get_path_template
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer(user='user', password='password').start()
+        self.device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.events = []
+        self.instrumentation = Instrumentation()
+        self.instrumentation.add_sink(self.events.append)
+        self.service = DeviceService(self.server.instance, 'user', 'password', '1')
+        self.service.transport = Transport('user', 'password', instrumentation=self.instrumentation,
+                                           retry_policy=RetryPolicy(backoff_factor=0.0))
+
+    def test_core_event(self) -> None:
+        self.service.get_device(self.device['id']).get_result()
+        self.assertEqual(len(self.events), 1)
+        event = self.events[0]
+        self.assertEqual(event.source, 'core')
+        self.assertEqual(event.method, 'GET')
+        self.assertEqual(event.path_template, '/iot/core/api/v1/tenant/{id}/devices/{id}')
+        self.assertEqual(event.status_code, 200)
+        self.assertEqual(event.request_bytes, 0)
+        self.assertGreater(event.response_bytes, 0)
+        self.assertGreater(event.latency, 0)
+        self.assertEqual(event.retries, 0)
+        self.assertIsNone(event.error)
+
+    def test_retries_and_errors(self) -> None:
+        self.server.fail_next(2)
+        self.service.get_devices()
+        self.assertEqual(self.events[-1].retries, 2)
+        self.assertEqual(self.events[-1].status_code, 200)
+
+        with self.assertRaises(DeviceManagementAPIException):
+            self.service.get_device('unknown')
+        self.assertEqual(self.events[-1].status_code, 404)
+
+    def test_request_bytes(self) -> None:
+        self.service.create_device('1', 'other')
+        event = self.events[-1]
+        self.assertEqual(event.method, 'POST')
+        self.assertEqual(event.path_template, '/iot/core/api/v1/tenant/{id}/devices')
+        self.assertGreater(event.request_bytes, 0)
+
+    def test_no_events_without_sink(self) -> None:
+        self.instrumentation.remove_sink(self.events.append)
+        self.assertFalse(self.instrumentation.enabled)
+        self.service.get_devices()
+        self.assertEqual(self.events, [])
+
+    def test_failing_sink(self) -> None:
+        def fail(event):
+            raise RuntimeError('sink')
+
+        self.instrumentation.add_sink(fail)
+        with self.assertLogs('iot_services_sdk.instrumentation', level='ERROR'):
+            self.service.get_devices()
+        self.assertEqual(len(self.events), 1)
+
+    def test_gateway_event(self) -> None:
+        gateway = MockGateway().start()
+        try:
+            client = RestClient(gateway.rest_instance, 'device')
+            client.instrumentation = self.instrumentation
+            client.post_measures('capability', 'sensor', [{'temp': 20}])
+            event = self.events[-1]
+            self.assertEqual(event.source, 'gateway')
+            self.assertEqual(event.path_template, '/iot/gateway/rest/measures/{id}')
+            self.assertEqual(event.status_code, 202)
+
+            gateway.error_rate = 1.0
+            with self.assertRaises(RESTGatewayException):
+                client.post_measures('capability', 'sensor', [{'temp': 20}])
+            self.assertEqual(self.events[-1].status_code, 400)
+            self.assertIsInstance(self.events[-1].error, RESTGatewayException)
+        finally:
+            gateway.stop()
+
+    def test_counter_sink(self) -> None:
+        counters = CounterSink(buckets=(0.5, 5.0))
+        self.instrumentation.add_sink(counters)
+        for _ in range(3):
+            self.service.get_device(self.device['id'])
+        samples = counters.get_samples()
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0]['count'], 3)
+        self.assertEqual(samples[0]['status'], '200')
+
+        metrics = counters.render()
+        labels = '{source="core",method="GET",path="/iot/core/api/v1/tenant/{id}/devices/{id}",status="200"'
+        self.assertIn('iot_services_sdk_requests_total' + labels + '} 3', metrics)
+        self.assertIn('iot_services_sdk_request_duration_seconds_bucket' + labels + ',le="+Inf"} 3', metrics)
+        self.assertIn('iot_services_sdk_request_duration_seconds_count' + labels + '} 3', metrics)
+
+        counters.reset()
+        self.assertEqual(counters.get_samples(), [])
+
+    def test_logging_sink(self) -> None:
+        self.instrumentation.add_sink(LoggingSink(level=logging.INFO))
+        with self.assertLogs('iot_services_sdk.requests', level='INFO') as logs:
+            self.service.get_devices()
+        self.assertIn('GET /iot/core/api/v1/tenant/{id}/devices 200', logs.output[0])
+
+    def test_path_template(self) -> None:
+        self.assertEqual(get_path_template('/iot/core/api/v1/tenant/7/devices/42/authentications/clientCertificate/pem'),
+                         '/iot/core/api/v1/tenant/{id}/devices/{id}/authentications/clientCertificate/pem')
+        self.assertEqual(get_path_template('/iot/core/api/v1/tenant/7/gateways/3/bundles/9/start'),
+                         '/iot/core/api/v1/tenant/{id}/gateways/{id}/bundles/{id}/start')
+        self.assertEqual(get_path_template('/iot/core/api/v1/tenant/7/devices/count'),
+                         '/iot/core/api/v1/tenant/{id}/devices/count')
+
+    def tearDown(self) -> None:
+        self.server.stop()
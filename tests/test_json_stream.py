@@ -0,0 +1,58 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import unittest
+
+from iot_services_sdk.json_stream import iter_json_array
+
+
+def parse(document: str, chunk_size: int = 3) -> list:
+    raw = document.encode('utf-8')
+    return list(iter_json_array(raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)))
+
+
+class JSONStreamTest(unittest.TestCase):
+
+    def test_valid(self) -> None:
+        for document in ('[]', ' [ ] ', '[1, 2, 3]', '[{"a": [1, 2]}, "x", null, true, 1.5e3]\n', '[\n1\n]'):
+            for chunk_size in (1, 3, 100):
+                self.assertEqual(parse(document, chunk_size), json.loads(document))
+
+    def test_single_value(self) -> None:
+        self.assertEqual(parse('{"a": 1} '), [{'a': 1}])
+        self.assertEqual(parse(''), [])
+
+    def test_missing_separator(self) -> None:
+        with self.assertRaises(json.decoder.JSONDecodeError) as context:
+            parse('[1 2]')
+        self.assertEqual(context.exception.pos, 3)
+
+    def test_trailing_separator(self) -> None:
+        with self.assertRaises(json.decoder.JSONDecodeError) as context:
+            parse('[1,]')
+        self.assertEqual(context.exception.pos, 3)
+        self.assertRaises(json.decoder.JSONDecodeError, parse, '[,1]')
+
+    def test_double_separator(self) -> None:
+        with self.assertRaises(json.decoder.JSONDecodeError) as context:
+            parse('[10,,2]')
+        self.assertEqual(context.exception.pos, 4)
+        self.assertIn('char 4', str(context.exception))
+
+    def test_trailing_data(self) -> None:
+        with self.assertRaises(json.decoder.JSONDecodeError) as context:
+            parse('[1, 2] trailing')
+        self.assertEqual(context.exception.pos, 7)
+        self.assertRaises(json.decoder.JSONDecodeError, parse, '{"a": 1} x')
+
+    def test_position_in_stream(self) -> None:
+        document = '[\n' + ',\n'.join(str(i) for i in range(100)) + ',\n  x]'
+        with self.assertRaises(json.decoder.JSONDecodeError) as context:
+            parse(document, chunk_size=7)
+        self.assertEqual(context.exception.pos, document.index('x'))
+        self.assertEqual(context.exception.lineno, 102)
+        self.assertEqual(context.exception.colno, 3)
+
+    def test_unterminated(self) -> None:
+        self.assertRaises(json.decoder.JSONDecodeError, parse, '[1, 2')
+        self.assertRaises(json.decoder.JSONDecodeError, parse, '[1, {"a": ')
@@ -0,0 +1,72 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import importlib.util
+import unittest
+
+from iot_services_sdk import MeasureAggregator, aggregate_measures
+from iot_services_sdk.utils import format_timestamp
+
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+
+class MeasureAggregatorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.start = 1556704800000
+        # One measure per second for ten minutes, the humidity is missing every third second
+        self.measures = []
+        for i in range(600):
+            values = {'temp': float(i)}
+            if i % 3 != 0:
+                values['humidity'] = i % 7
+            self.measures.append({'timestamp': format_timestamp(self.start + i * 1000), 'measure': values})
+
+    def _check(self, windows) -> None:
+        self.assertEqual(len(windows), 10)
+        self.assertEqual([w['timestamp'] for w in windows], [self.start + i * 60000 for i in range(10)])
+        first = windows[0]
+        self.assertEqual(first['temp'], {'min': 0.0, 'max': 59.0, 'avg': 29.5, 'count': 60})
+        self.assertEqual(first['humidity']['count'], 40)
+        humidity = [i % 7 for i in range(60) if i % 3 != 0]
+        self.assertAlmostEqual(first['humidity']['avg'], sum(humidity) / len(humidity))
+        self.assertEqual(windows[9]['temp']['max'], 599.0)
+
+    def test_aggregate_python(self) -> None:
+        aggregator = MeasureAggregator(60000, ['temp', 'humidity'], use_numpy=False)
+        windows = []
+        for offset in range(0, len(self.measures), 45):
+            windows += aggregator.add(self.measures[offset:offset + 45])
+        windows += aggregator.flush()
+        self._check(windows)
+
+    @unittest.skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_aggregate_numpy(self) -> None:
+        self._check(list(aggregate_measures(iter(self.measures), 60000, ['temp', 'humidity'], page_size=45)))
+
+    def test_string_values(self) -> None:
+        measures = [{'timestamp': format_timestamp(self.start + i * 1000), 'measure': {'temp': str(i), 'humidity': None}}
+                    for i in range(120)]
+        expected = [{'timestamp': self.start, 'temp': {'min': 0.0, 'max': 59.0, 'avg': 29.5, 'count': 60},
+                     'humidity': {'min': None, 'max': None, 'avg': None, 'count': 0}},
+                    {'timestamp': self.start + 60000, 'temp': {'min': 60.0, 'max': 119.0, 'avg': 89.5, 'count': 60},
+                     'humidity': {'min': None, 'max': None, 'avg': None, 'count': 0}}]
+        for use_numpy in (False, True) if HAS_NUMPY else (False,):
+            aggregator = MeasureAggregator(60000, ['temp', 'humidity'], use_numpy=use_numpy)
+            self.assertEqual(aggregator.use_numpy, use_numpy)
+            windows = aggregator.add(measures[:70]) + aggregator.add(measures[70:]) + aggregator.flush()
+            self.assertEqual(windows, expected)
+
+    def test_list_values_and_invalid_values(self) -> None:
+        measures = [{'timestamp': format_timestamp(self.start), 'measure': ['on', 20.0, '3']},
+                    {'timestamp': format_timestamp(self.start + 1000), 'measure': ['off', 'n/a', 5]},
+                    {'timestamp': format_timestamp(self.start + 2000), 'measure': {'temp': 22.0, 'count': [1]}}]
+        for use_numpy in (False, True) if HAS_NUMPY else (False,):
+            aggregator = MeasureAggregator(60000, ['temp', 'count'], use_numpy=use_numpy,
+                                           property_order=['state', 'temp', 'count'])
+            windows = aggregator.add(measures) + aggregator.flush()
+            self.assertEqual(windows, [{'timestamp': self.start,
+                                        'temp': {'min': 20.0, 'max': 22.0, 'avg': 21.0, 'count': 2},
+                                        'count': {'min': 3.0, 'max': 5.0, 'avg': 4.0, 'count': 2}}])
+
+    def test_unsupported_function(self) -> None:
+        self.assertRaises(ValueError, MeasureAggregator, 60000, ['temp'], ('median',))
@@ -0,0 +1,69 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import unittest
+
+from .fakes import FakeDeviceService
+
+from iot_services_sdk import MeasureCache
+from iot_services_sdk.utils import format_timestamp
+
+
+class MeasureCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.start = 1556704800000
+        measures = [{'timestamp': format_timestamp(self.start + i * 1000),
+                     'capabilityId': 'cap-a' if i % 2 == 0 else 'cap-b', 'measure': {'temp': i}} for i in range(200)]
+        self.device_service = FakeDeviceService(measures)
+        self.cache = MeasureCache(self.device_service, page_size=50)
+
+    def test_covered_query_is_answered_locally(self) -> None:
+        measures = self.cache.get_measures('device', self.start, self.start + 100000)
+        self.assertEqual(len(measures), 100)
+        calls = self.device_service.calls
+
+        measures = self.cache.get_measures('device', self.start + 10000, self.start + 50000)
+        self.assertEqual([m['measure']['temp'] for m in measures], list(range(10, 50)))
+        self.assertEqual(self.device_service.calls, calls)
+
+        # Ranges cached for all capabilities also answer queries for a single capability
+        measures = self.cache.get_measures('device', self.start, self.start + 100000, capability_id='cap-a')
+        self.assertEqual(len(measures), 50)
+        self.assertEqual(self.device_service.calls, calls)
+
+    def test_only_gaps_are_fetched(self) -> None:
+        self.cache.get_measures('device', self.start, self.start + 50000)
+        self.cache.get_measures('device', self.start + 100000, self.start + 150000)
+        self.assertEqual(self.cache.get_gaps('device', self.start, self.start + 200000),
+                         [(self.start + 50000, self.start + 100000), (self.start + 150000, self.start + 200000)])
+
+        measures = self.cache.get_measures('device', self.start, self.start + 200000)
+        self.assertEqual([m['measure']['temp'] for m in measures], list(range(200)))
+        self.assertEqual(self.cache.get_gaps('device', self.start, self.start + 200000), [])
+
+    def test_capability_coverage(self) -> None:
+        measures = self.cache.get_measures('device', self.start, self.start + 100000, capability_id='cap-a')
+        self.assertEqual([m['measure']['temp'] for m in measures], list(range(0, 100, 2)))
+        calls = self.device_service.calls
+
+        # Coverage of one capability neither answers queries for another one nor for all capabilities
+        self.assertEqual(self.cache.get_gaps('device', self.start, self.start + 100000, capability_id='cap-b'),
+                         [(self.start, self.start + 100000)])
+        self.assertEqual(self.cache.get_gaps('device', self.start, self.start + 100000),
+                         [(self.start, self.start + 100000)])
+        measures = self.cache.get_measures('device', self.start, self.start + 100000, capability_id='cap-b')
+        self.assertEqual([m['measure']['temp'] for m in measures], list(range(1, 100, 2)))
+        self.assertGreater(self.device_service.calls, calls)
+
+        calls = self.device_service.calls
+        self.cache.get_measures('device', self.start, self.start + 100000, capability_id='cap-a')
+        self.assertEqual(self.device_service.calls, calls)
+
+    def test_invalidate(self) -> None:
+        self.cache.get_measures('device', self.start, self.start + 50000)
+        self.cache.invalidate('device')
+        self.assertEqual(self.cache.get_gaps('device', self.start, self.start + 50000),
+                         [(self.start, self.start + 50000)])
+
+    def tearDown(self) -> None:
+        self.cache.close()
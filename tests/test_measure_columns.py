@@ -0,0 +1,74 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from iot_services_sdk import MeasureColumns
+from iot_services_sdk.utils import format_timestamp
+
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+HAS_PYARROW = HAS_NUMPY and importlib.util.find_spec('pyarrow') is not None
+
+
+class MeasureColumnsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        properties = [
+            {'name': 'temp', 'dataType': 'double'},
+            {'name': 'count', 'dataType': 'integer'},
+            {'name': 'on', 'dataType': 'boolean'},
+            {'name': 'label', 'dataType': 'string'},
+        ]
+        self.start = 1556704800000
+        self.columns = MeasureColumns(properties)
+        self.columns.extend({'timestamp': format_timestamp(self.start + i), 'capabilityId': 'cap', 'sensorId': 's1',
+                             'measure': {'temp': i / 2, 'count': i, 'on': i % 2 == 0, 'label': str(i)}}
+                            for i in range(100))
+        self.columns.append({'timestamp': format_timestamp(self.start + 100), 'capabilityId': 'cap',
+                             'sensorId': 's2', 'measure': [50.0, None, None, 'last']})
+
+    def test_columns(self) -> None:
+        columns = self.columns.columns()
+        self.assertEqual(len(self.columns), 101)
+        self.assertEqual(columns['timestamp'][100], self.start + 100)
+        self.assertEqual(columns['temp'][100], 50.0)
+        self.assertEqual(columns['label'][100], 'last')
+        self.assertEqual(columns['sensorId'][-2:], ['s1', 's2'])
+
+    def test_string_values(self) -> None:
+        columns = MeasureColumns([{'name': 'temp', 'dataType': 'double'}, {'name': 'count', 'dataType': 'integer'},
+                                  {'name': 'on', 'dataType': 'boolean'}])
+        columns.append({'timestamp': self.start, 'measure': {'temp': '21.5', 'count': '3', 'on': 'true'}})
+        columns.append({'timestamp': self.start + 1, 'measure': {'temp': 'n/a', 'count': 2.5, 'on': 'maybe'}})
+        result = columns.columns()
+        self.assertEqual(list(result['temp']), [21.5, 0.0])
+        self.assertEqual(list(result['count']), [3, 0])
+        self.assertEqual(list(result['on']), [1, 0])
+        for column in columns._columns.values():
+            self.assertEqual(list(column.valid), [1, 0])
+
+    @unittest.skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_to_numpy(self) -> None:
+        import numpy
+        columns = self.columns.to_numpy()
+        self.assertEqual(columns['temp'].dtype, numpy.float64)
+        self.assertAlmostEqual(columns['temp'].sum(), sum(i / 2 for i in range(100)) + 50)
+        self.assertTrue(columns['count'].mask[100])
+        self.assertEqual(columns['count'][:100].sum(), sum(range(100)))
+        self.assertEqual(columns['on'][:100].sum(), 50)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_to_parquet(self) -> None:
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'measures.parquet')
+            self.columns.to_parquet(path)
+            import pyarrow.parquet
+            table = pyarrow.parquet.read_table(path)
+            self.assertEqual(table.num_rows, 101)
+            self.assertEqual(table.column('count').null_count, 1)
+        finally:
+            shutil.rmtree(directory)
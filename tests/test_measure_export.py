@@ -0,0 +1,42 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import random
+import unittest
+
+from .fakes import FakeDeviceService
+
+from iot_services_sdk import MeasureExporter
+from iot_services_sdk.utils import format_timestamp, to_milli_time
+
+
+class MeasureExporterTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = random.Random(7)
+        self.start = 1556704800000
+        self.end = self.start + 24 * 3600 * 1000
+        timestamps = [rng.randrange(self.start, self.end) for _ in range(3000)]
+        # A burst of measures in the same millisecond must be paged instead of split
+        timestamps += [self.start + 5000] * 25
+        self.measures = [{'timestamp': format_timestamp(t), 'measure': {'temp': i}} for i, t in enumerate(timestamps)]
+        self.device_service = FakeDeviceService(self.measures)
+
+    def test_export_returns_all_measures_in_order(self) -> None:
+        exporter = MeasureExporter(self.device_service, max_workers=4, page_size=10, initial_window=3600000)
+        exported = list(exporter.export('device', self.start, self.end))
+
+        timestamps = [to_milli_time(m['timestamp']) for m in exported]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(sorted(m['measure']['temp'] for m in exported), list(range(len(self.measures))))
+
+    def test_export_respects_range(self) -> None:
+        exporter = MeasureExporter(self.device_service, page_size=100)
+        middle = self.start + 12 * 3600 * 1000
+        exported = list(exporter.export('device', self.start, middle))
+        expected = [m for m in self.measures if to_milli_time(m['timestamp']) < middle]
+        self.assertEqual(len(exported), len(expected))
+
+    def test_empty_range(self) -> None:
+        exporter = MeasureExporter(self.device_service)
+        self.assertEqual(list(exporter.export('device', self.end, self.start)), [])
+        self.assertEqual(self.device_service.calls, 0)
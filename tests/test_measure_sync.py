@@ -0,0 +1,73 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from .fakes import FakeDeviceService
+
+from iot_services_sdk import MeasureSync, JsonLinesMeasureStore
+from iot_services_sdk.utils import format_timestamp
+
+
+class MeasureSyncTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.directory, 'state.json')
+        self.store = JsonLinesMeasureStore(os.path.join(self.directory, 'measures'))
+        self.start = 1556704800000
+        self.device_service = FakeDeviceService([])
+        self.devices = {'device-a': [], 'device-b': []}
+        self._add_measures(0, 25)
+
+    def _add_measures(self, first, last, timestamp=None):
+        for device_id in self.devices:
+            for i in range(first, last):
+                measure = {'deviceId': device_id, 'timestamp': format_timestamp(timestamp or self.start + i * 1000),
+                           'measure': {'temp': i}}
+                self.devices[device_id].append(measure)
+        self.device_service.measures = self.devices
+
+    def _stored(self, device_id):
+        with open(os.path.join(self.directory, 'measures', device_id + '.jsonl')) as measure_file:
+            return [json.loads(line) for line in measure_file]
+
+    def test_incremental_sync(self) -> None:
+        sync = MeasureSync(self.device_service, self.state_path, self.store, page_size=10)
+        self.assertEqual(sync.sync(list(self.devices)), {'device-a': 25, 'device-b': 25})
+        self.assertEqual(sync.sync(list(self.devices)), {'device-a': 0, 'device-b': 0})
+
+        # New measures, including one sharing the timestamp of the high-water mark
+        self._add_measures(25, 30)
+        self._add_measures(99, 100, timestamp=self.start + 24 * 1000)
+
+        # A new instance picks up the persisted state
+        sync = MeasureSync(self.device_service, self.state_path, self.store, page_size=10)
+        self.assertEqual(sync.sync(list(self.devices)), {'device-a': 6, 'device-b': 6})
+        self.assertEqual(len(self._stored('device-a')), 31)
+        self.assertEqual(sync.get_high_water_mark('device-a'), self.start + 29 * 1000)
+
+    def test_state_saved_once_per_sync(self) -> None:
+        sync = MeasureSync(self.device_service, self.state_path, self.store, page_size=10, save_interval=60.0)
+        with mock.patch('iot_services_sdk.measure_sync.os.replace', wraps=os.replace) as replace:
+            sync.sync(list(self.devices))
+            self.assertEqual(replace.call_count, 1)
+            # Nothing changed, so the state file is not written again
+            sync.sync(list(self.devices))
+            self.assertEqual(replace.call_count, 1)
+        with open(self.state_path) as state_file:
+            self.assertEqual(json.load(state_file)['device-b']['timestamp'], self.start + 24 * 1000)
+
+    def test_sync_device_saves_state(self) -> None:
+        sync = MeasureSync(self.device_service, self.state_path, self.store, page_size=10)
+        self.assertEqual(sync.sync_device('device-a'), 25)
+        sync = MeasureSync(self.device_service, self.state_path, self.store, page_size=10)
+        self.assertEqual(sync.get_high_water_mark('device-a'), self.start + 24 * 1000)
+        self.assertIsNone(sync.get_high_water_mark('device-b'))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
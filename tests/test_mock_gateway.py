@@ -0,0 +1,103 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import socket
+import threading
+import time
+import unittest
+from urllib.parse import urlsplit
+
+from iot_services_sdk import RestClient, MQTTClient, RESTGatewayException
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+
+
+class MockGatewayTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer().start()
+        self.device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.gateway = MockGateway(server=self.server).start()
+
+    def test_rest_measures(self) -> None:
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        response = client.post_measures('capability', 'sensor', [{'temp': 20}, {'temp': 21}], use_timestamp=True)
+        self.assertEqual(response.get_status_code(), 202)
+        self.assertEqual(self.gateway.received, 1)
+        self.assertEqual(len(self.server.measures[self.device['id']]), 2)
+
+    def test_rest_partial_failure(self) -> None:
+        self.gateway.error_rate = 0.5
+        self.gateway._random.seed(1)
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        messages = [{'capabilityAlternateId': 'capability', 'sensorAlternateId': 'sensor', 'measures': [{'temp': i}]}
+                    for i in range(20)]
+        with self.assertRaises(RESTGatewayException):
+            client.post_batched_measures(messages)
+        self.assertGreater(self.gateway.rejected, 0)
+        self.assertGreater(self.gateway.received, 0)
+
+    def test_mqtt_acks_and_commands(self) -> None:
+        self.gateway.ack_delay = 0.05
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        commands = []
+        command_received = threading.Event()
+        client.on_error = lambda client, userdata, report: None
+
+        def on_command(client, userdata, command):
+            commands.append(command)
+            command_received.set()
+        client.on_command = on_command
+
+        client.connect()
+        client.subscribe(self.device['alternateId'])
+        client.loop_start()
+        try:
+            info = client.publish('capability', 'sensor', [{'temp': 20}])
+            info.wait_for_publish(5)
+            # The ack handler removes the message from the buffer
+            for _ in range(50):
+                if len(client._message_buffer) == 0:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(client._message_buffer, {})
+            self.assertEqual(self.gateway.received, 1)
+
+            self.gateway.push_command(self.device['alternateId'], {'command': {'on': True}})
+            self.assertTrue(command_received.wait(5))
+            self.assertEqual(commands, [{'command': {'on': True}}])
+        finally:
+            client.disconnect()
+            client.loop_stop()
+
+    def test_stop_while_clients_connect(self) -> None:
+        gateway = MockGateway(server=self.server).start()
+        address = urlsplit(gateway.mqtt_instance)
+        sockets = []
+
+        def connect():
+            for _ in range(200):
+                try:
+                    sockets.append(socket.create_connection((address.hostname, address.port), timeout=5))
+                except OSError:
+                    return
+
+        threads = [threading.Thread(target=connect) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        gateway.stop()
+        for thread in threads:
+            thread.join()
+
+        # Every accepted connection has been closed by the gateway
+        for client in sockets:
+            try:
+                self.assertEqual(client.recv(1), b'')
+            except ConnectionResetError:
+                pass
+            finally:
+                client.close()
+
+    def tearDown(self) -> None:
+        self.gateway.stop()
+        self.server.stop()
@@ -0,0 +1,60 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import unittest
+
+from iot_services_sdk import DeviceService, GatewayService, AboutService, DeviceManagementAPIException
+from iot_services_sdk.mock_server import MockIoTServer
+
+
+class MockServerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer(user='user', password='password').start()
+        self.device_service = DeviceService(self.server.instance, 'user', 'password', self.server.tenant_id)
+        self.gateway_service = GatewayService(self.server.instance, 'user', 'password', self.server.tenant_id)
+
+    def test_device_lifecycle(self) -> None:
+        gateways = self.gateway_service.get_gateways(filters=["protocolId eq 'rest'"]).get_result()
+        self.assertEqual(len(gateways), 1)
+
+        device = self.device_service.create_device(gateways[0]['id'], 'device').get_result()
+        self.device_service.add_custom_property(device['id'], 'key', 'value')
+        self.device_service.update_device(device['id'], 'renamed')
+
+        stored = self.device_service.get_device(device['id']).get_result()
+        self.assertEqual(stored['name'], 'renamed')
+        self.assertEqual(stored['customProperties'], [{'key': 'key', 'value': 'value'}])
+        self.assertEqual(self.device_service.get_device_count().get_result(), {'count': 1})
+
+        self.device_service.delete_device(device['id'])
+        with self.assertRaises(DeviceManagementAPIException):
+            self.device_service.get_device(device['id'])
+
+    def test_pagination(self) -> None:
+        for i in range(25):
+            self.server.create('devices', {'name': 'device-%02d' % i, 'gatewayId': '1'})
+        names = []
+        for skip in range(0, 30, 10):
+            page = self.device_service.get_devices(orderby='name', asc=False, skip=str(skip), top='10').get_result()
+            names.extend(device['name'] for device in page)
+        self.assertEqual(names, ['device-%02d' % i for i in reversed(range(25))])
+
+    def test_measures_filter(self) -> None:
+        device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.server.add_measures(device['id'], [{'timestamp': 1000 * i, 'measure': {'t': i}} for i in range(10)])
+        measures = self.device_service.get_measures(device['id'], filters=["timestamp ge '1970-01-01T00:00:05.000Z'"],
+                                                    orderby='timestamp').get_result()
+        self.assertEqual([measure['measure']['t'] for measure in measures], [5, 6, 7, 8, 9])
+
+    def test_injected_errors_are_retried(self) -> None:
+        self.server.fail_next(1, status=503, retry_after=0)
+        about = AboutService(self.server.instance, 'user', 'password').get_information()
+        self.assertEqual(about.get_status_code(), 200)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_wrong_credentials(self) -> None:
+        with self.assertRaises(DeviceManagementAPIException):
+            AboutService(self.server.instance, 'user', 'wrong').get_information()
+
+    def tearDown(self) -> None:
+        self.server.stop()
@@ -0,0 +1,120 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+import unittest
+
+from iot_services_sdk import MQTTClient, RestClient, StageProfiler
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+from iot_services_sdk.profiling import profiler
+
+
+class StageProfilerTest(unittest.TestCase):
+
+    def test_report(self) -> None:
+        stages = StageProfiler()
+        stages.record('a', 3000)
+        stages.record('a', 1000)
+        stages.record('mqtt.callback', 12000)
+        report = stages.get_report()
+        self.assertEqual([row['stage'] for row in report], ['mqtt.callback', 'a'])
+        self.assertEqual(report[1]['samples'], 2)
+        self.assertEqual(report[1]['mean_microseconds'], 2.0)
+        self.assertEqual(report[1]['max_microseconds'], 3.0)
+        self.assertEqual(report[1]['share'], 0.25)
+        self.assertTrue(report[0]['application'])
+        self.assertIn('mqtt.callback *', stages.render())
+        stages.reset()
+        self.assertEqual(stages.get_report(), [])
+
+    def test_sampling(self) -> None:
+        stages = StageProfiler()
+        stages.enable(sample_every=4)
+        for _ in range(8):
+            stages.stop('a', stages.start('a'))
+        self.assertEqual(stages.get_report()[0]['samples'], 2)
+        self.assertRaises(ValueError, stages.enable, sample_every=0)
+
+
+class ClientProfilingTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer().start()
+        self.device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.gateway = MockGateway(server=self.server).start()
+        profiler.reset()
+        profiler.enable()
+
+    def test_rest_stages(self) -> None:
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        client.post_measures('capability', 'sensor', [{'temp': 20}])
+        client.post_batched_measures([{'capabilityAlternateId': 'capability', 'sensorAlternateId': 'sensor',
+                                       'measures': [{'temp': 21}]}])
+        samples = {row['stage']: row['samples'] for row in profiler.get_report()}
+        self.assertEqual(samples, {'rest.serialize': 2, 'rest.request': 2})
+
+    def test_mqtt_stages(self) -> None:
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        errors = threading.Event()
+        commands = threading.Event()
+        client.on_error = lambda client, userdata, report: errors.set()
+        client.on_command = lambda client, userdata, message: commands.set()
+        client.connect()
+        client.subscribe(self.device['alternateId'])
+        client.loop_start()
+        try:
+            self.gateway.error_rate = 1.0
+            client.publish('capability', 'sensor', [{'temp': 20}])
+            self.assertTrue(errors.wait(5))
+            self.gateway.push_command(self.device['alternateId'], {'command': {'on': True}})
+            self.assertTrue(commands.wait(5))
+        finally:
+            client.disconnect()
+            client.loop_stop()
+
+        samples = {row['stage']: row['samples'] for row in profiler.get_report()}
+        self.assertEqual(samples['mqtt.serialize'], 1)
+        self.assertGreater(samples['mqtt.write'], 0)
+        self.assertEqual(samples['mqtt.ack'], 1)
+        self.assertEqual(samples['mqtt.dispatch'], 1)
+        self.assertEqual(samples['mqtt.callback'], 2)
+
+    def test_sampling_covers_all_stages(self) -> None:
+        # The stages of a post always run in the same order, so a shared call counter would skip some of them
+        profiler.enable(sample_every=2)
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        for _ in range(20):
+            client.post_measures('capability', 'sensor', [{'temp': 20}])
+        samples = {row['stage']: row['samples'] for row in profiler.get_report()}
+        self.assertEqual(samples, {'rest.serialize': 10, 'rest.request': 10})
+
+        profiler.reset()
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        client.connect()
+        client.loop_start()
+        try:
+            for _ in range(20):
+                client.publish('capability', 'sensor', [{'temp': 20}])
+            for _ in range(500):
+                if len(client._message_buffer) == 0:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            client.disconnect()
+            client.loop_stop()
+        samples = {row['stage']: row['samples'] for row in profiler.get_report()}
+        self.assertEqual(samples['mqtt.serialize'], 10)
+        self.assertGreater(samples['mqtt.write'], 0)
+        self.assertGreater(samples['mqtt.ack'], 0)
+
+    def test_disabled(self) -> None:
+        profiler.disable()
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        client.post_measures('capability', 'sensor', [{'temp': 20}])
+        self.assertEqual(profiler.get_report(), [])
+
+    def tearDown(self) -> None:
+        profiler.disable()
+        profiler.reset()
+        self.gateway.stop()
+        self.server.stop()
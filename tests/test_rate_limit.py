@@ -0,0 +1,59 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+import time
+import unittest
+
+from iot_services_sdk import Governor, AdaptiveTokenBucket, AIMDConcurrencyLimiter
+from iot_services_sdk.rate_limit import get_scope
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def test_token_bucket_limits_rate(self) -> None:
+        bucket = AdaptiveTokenBucket(rate=100, burst=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_token_bucket_adapts(self) -> None:
+        bucket = AdaptiveTokenBucket()
+        bucket.acquire()
+        self.assertIsNone(bucket.rate)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 1.0)
+        bucket.rate = 10.0
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 10.1)
+
+    def test_concurrency_limiter(self) -> None:
+        limiter = AIMDConcurrencyLimiter(initial_limit=4, cooldown=60)
+        for _ in range(4):
+            limiter.acquire()
+        self.assertEqual(limiter.in_flight, 4)
+
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 2.0)
+        # Further throttling within the cooldown does not decrease the limit again
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 2.0)
+
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release()
+        limiter.release()
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_scopes(self) -> None:
+        self.assertEqual(get_scope('https://host/iot/core/api/v1/tenant/123/devices?top=1'), 'host/tenant/123')
+        self.assertEqual(get_scope('https://host/iot/core/api/v1/tenants'), 'host')
+
+        governor = Governor()
+        self.assertIsNot(governor.get_limits('https://host/iot/core/api/v1/tenant/1/devices'),
+                         governor.get_limits('https://host/iot/core/api/v1/tenant/2/devices'))
+        self.assertIs(governor.get_limits('https://host/iot/core/api/v1/tenant/1/devices'),
+                      governor.get_limits('https://host/iot/core/api/v1/tenant/1/sensors'))
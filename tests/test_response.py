@@ -0,0 +1,65 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import json
+import unittest
+
+from iot_services_sdk.response import Response
+
+
+class ResponseTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.measures = [{'capabilityId': 'cap', 'measure': {'temp': i}} for i in range(1000)]
+        self.raw = json.dumps(self.measures).encode('utf-8')
+
+    def test_decoded_result(self) -> None:
+        response = Response(200, {'id': '1'}, {})
+        self.assertEqual(response.get_result(), {'id': '1'})
+        self.assertEqual(response.get_status_code(), 200)
+
+    def test_lazy_json_result(self) -> None:
+        response = Response(200, headers={}, raw=self.raw, is_json=True)
+        self.assertEqual(response.get_status_code(), 200)
+        self.assertEqual(response.get_result(), self.measures)
+        self.assertIs(response.get_result(), response.get_result())
+
+    def test_lazy_invalid_json_only_fails_on_access(self) -> None:
+        response = Response(200, headers={}, raw=b'', is_json=True)
+        self.assertEqual(response.get_status_code(), 200)
+        self.assertRaises(json.decoder.JSONDecodeError, response.get_result)
+
+    def test_text_result(self) -> None:
+        response = Response(200, headers={}, raw='<xml>ä</xml>'.encode('utf-8'), encoding='utf-8')
+        self.assertEqual(response.get_result(), '<xml>ä</xml>')
+
+    def test_raw(self) -> None:
+        response = Response(200, headers={}, raw=self.raw, is_json=True)
+        self.assertEqual(response.raw().tobytes(), self.raw)
+
+    def test_copy(self) -> None:
+        response = Response(200, headers={'ETag': '"1"'}, raw=self.raw, is_json=True)
+        copy = response.copy()
+        copy.get_result().append({'local': True})
+        copy.get_headers()['ETag'] = '"2"'
+        self.assertEqual(response.get_result(), self.measures)
+        self.assertEqual(response.get_headers(), {'ETag': '"1"'})
+        self.assertEqual(Response(200, {'id': '1'}, {}).copy().get_result(), {'id': '1'})
+        self.assertRaises(ValueError, Response(200, headers={}, is_json=True, stream=iter([self.raw])).copy)
+
+    def test_iter_result(self) -> None:
+        response = Response(200, headers={}, raw=self.raw, is_json=True)
+        self.assertEqual(list(response.iter_result()), self.measures)
+
+    def test_iter_streamed_result(self) -> None:
+        closed = []
+        chunks = (self.raw[i:i + 7] for i in range(0, len(self.raw), 7))
+        response = Response(200, headers={}, is_json=True, stream=chunks, close=lambda: closed.append(True))
+        self.assertEqual(list(response.iter_result()), self.measures)
+        self.assertEqual(closed, [True])
+        self.assertRaises(ValueError, response.get_result)
+
+    def test_streamed_result(self) -> None:
+        chunks = (self.raw[i:i + 7] for i in range(0, len(self.raw), 7))
+        response = Response(200, headers={}, is_json=True, stream=chunks)
+        self.assertEqual(response.get_result(), self.measures)
+        self.assertEqual(list(response.iter_result()), self.measures)
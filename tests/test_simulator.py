@@ -0,0 +1,117 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+from iot_services_sdk import simulator as simulator_module
+from iot_services_sdk.simulator import FleetSimulator
+from iot_services_sdk.simulator import make_measures
+
+
+class FleetSimulatorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer().start()
+        self.capability = self.server.create('capabilities', {'alternateId': 'capability', 'name': 'capability'})
+        self.gateway = MockGateway(server=self.server).start()
+
+    def create_simulator(self, protocol: str, **kwargs) -> FleetSimulator:
+        gateway_instance = self.gateway.mqtt_instance if protocol == 'mqtt' else self.gateway.rest_instance
+        return FleetSimulator(self.server.instance, 'user', 'password', '1', gateway_instance=gateway_instance,
+                              protocol=protocol, devices=4, rate=20.0, duration=1.0, processes=2,
+                              sensor_type_id='0', drain=2.0, **kwargs)
+
+    def test_provision_reuses_devices(self) -> None:
+        simulator = self.create_simulator('mqtt')
+        devices = simulator.provision()
+        self.assertEqual([device['name'] for device in devices], ['simulated-device-' + str(idx) for idx in range(4)])
+        self.assertTrue(all(device['sensorId'] is not None for device in devices))
+        self.assertIsNone(devices[0]['pem'])
+
+        self.assertEqual(simulator.provision(), devices)
+        self.assertEqual(len(self.server.get_collection('devices')), 4)
+        self.assertEqual(len(self.server.get_collection('sensors')), 4)
+
+    def test_provision_shares_certificate_store(self) -> None:
+        simulator = FleetSimulator(self.server.instance, 'user', 'password', '1', gateway_instance='gateway.example',
+                                   devices=4, certificate_directory=tempfile.mkdtemp())
+        with mock.patch.object(simulator_module, 'CertificateStore') as store:
+            store.return_value.get.return_value = {'pem': 'pem', 'secret': 'secret'}
+            devices = simulator.provision()
+        self.assertEqual(store.call_count, 1)
+        self.assertEqual(store.return_value.get.call_count, 4)
+        self.assertEqual(devices[0]['secret'], 'secret')
+
+    def test_mqtt(self) -> None:
+        progress = []
+        simulator = self.create_simulator('mqtt', command_rate=10.0, command_capability_id=self.capability['id'],
+                                          report_interval=0.2, on_progress=progress.append)
+        report = simulator.run()
+        self.assertEqual(report['processes'], 2)
+        self.assertGreater(report['sent'], 40)
+        self.assertEqual(report['acked'], report['sent'])
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(self.gateway.received, report['sent'])
+        self.assertIsNotNone(report['ack_p99_ms'])
+        self.assertGreater(report['commands_sent'], 0)
+        # Commands sent just before the end may arrive after the devices stopped listening
+        self.assertGreater(report['commands'], 0)
+        self.assertLessEqual(report['commands'], report['commands_sent'])
+        self.assertIsNotNone(report['command_p50_ms'])
+        self.assertGreater(len(progress), 0)
+
+    def test_rest(self) -> None:
+        report = self.create_simulator('rest', batch_size=3, properties=('temperature', 'humidity')).run()
+        self.assertGreater(report['sent'], 40)
+        self.assertEqual(report['acked'], report['sent'])
+        self.assertEqual(report['measures_per_second'], report['messages_per_second'] * 3)
+        message = self.gateway.messages[0][1]
+        self.assertEqual(len(message['measures']), 3)
+        self.assertEqual(set(message['measures'][0]), {'temperature', 'humidity'})
+
+    def test_rest_bounds_posts_in_flight(self) -> None:
+        # Without a bound, every due message would be queued in the executor although the gateway is too slow
+        self.gateway.latency = 0.25
+        report = self.create_simulator('rest', rest_workers=1).run()
+        self.assertGreater(report['sent'], 0)
+        self.assertLess(report['sent'], 30)
+        self.assertEqual(report['acked'], report['sent'])
+
+    def test_password(self) -> None:
+        output = os.path.join(tempfile.mkdtemp(), 'report.json')
+        argv = ['--instance', 'instance', '--user', 'user', '--tenant-id', '1', '--output', output]
+        with mock.patch.object(simulator_module, 'FleetSimulator') as simulator, \
+                mock.patch.object(simulator_module.getpass, 'getpass', return_value='prompted') as prompt:
+            simulator.return_value.run.return_value = {}
+            with mock.patch.dict(os.environ, {simulator_module.PASSWORD_VARIABLE: 'environment'}):
+                simulator_module.main(argv + ['--password', 'argument'])
+                self.assertEqual(simulator.call_args[0][2], 'argument')
+                simulator_module.main(argv)
+                self.assertEqual(simulator.call_args[0][2], 'environment')
+            with mock.patch.dict(os.environ):
+                os.environ.pop(simulator_module.PASSWORD_VARIABLE, None)
+                simulator_module.main(argv)
+                self.assertEqual(simulator.call_args[0][2], 'prompted')
+        self.assertEqual(prompt.call_count, 1)
+
+    def test_invalid_arguments(self) -> None:
+        with self.assertRaises(ValueError):
+            self.create_simulator('coap')
+        with self.assertRaises(ValueError):
+            self.create_simulator('rest', command_rate=1.0, command_capability_id='1')
+
+    def test_make_measures(self) -> None:
+        self.assertEqual(make_measures('counter', ('a',), 2, 0, 3), [{'a': 6}, {'a': 7}])
+        self.assertEqual(make_measures('constant', ('a', 'b'), 1, 0, 0), [{'a': 1.0, 'b': 1.0}])
+        for measure in make_measures('sine', ('a',), 10, 1, 0) + make_measures('random', ('a',), 10, 0, 0,
+                                                                               random.Random(1)):
+            self.assertTrue(0 <= measure['a'] <= 100)
+
+    def tearDown(self) -> None:
+        self.gateway.stop()
+        self.server.stop()
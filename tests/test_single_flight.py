@@ -0,0 +1,144 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from iot_services_sdk import DeviceService, Transport
+from iot_services_sdk.single_flight import SingleFlight
+
+from .fakes import make_response
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_calls_are_coalesced(self) -> None:
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', call))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while single_flight.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 8)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    def test_errors_are_shared_and_not_cached(self) -> None:
+        single_flight = SingleFlight()
+        self.assertRaises(KeyError, single_flight.do, 'key', lambda: {}['missing'])
+        self.assertEqual(single_flight.do('key', lambda: 1), 1)
+
+    def test_forget(self) -> None:
+        single_flight = SingleFlight()
+        release = threading.Event()
+        results = []
+
+        def call():
+            release.wait()
+            return 'old'
+
+        thread = threading.Thread(target=lambda: results.append(single_flight.do('key', call)))
+        thread.start()
+        while single_flight.in_flight() == 0:
+            time.sleep(0.001)
+        single_flight.forget()
+        self.assertEqual(single_flight.do('key', lambda: 'new'), 'new')
+        release.set()
+        thread.join()
+        self.assertEqual(results, ['old'])
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    def test_coalescing_is_opt_in(self) -> None:
+        self.assertFalse(Transport('user', 'password').coalesce_gets)
+
+    def test_gets_after_write_do_not_join_earlier_gets(self) -> None:
+        device_service = DeviceService('single-flight.instance', 'user', 'password', 'tenant')
+        device_service.transport = Transport('user', 'password', coalesce_gets=True)
+        release = threading.Event()
+        bodies = iter([b'{"name": "old"}', b'{"name": "new"}'])
+
+        def request(method, url, headers=None, data=None, files=None, stream=False):
+            if method != 'GET':
+                return make_response(200)
+            content = next(bodies)
+            if content == b'{"name": "old"}':
+                release.wait()
+            return make_response(200, content)
+
+        results = []
+        with mock.patch.object(device_service.transport, 'request', side_effect=request) as transport_request:
+            reader = threading.Thread(target=lambda: results.append(device_service.get_device('1')))
+            reader.start()
+            while device_service.transport.single_flight.in_flight() == 0:
+                time.sleep(0.001)
+            device_service.update_device('1', 'new')
+            after_write = device_service.get_device('1')
+            release.set()
+            reader.join()
+
+        self.assertEqual(transport_request.call_count, 3)
+        self.assertEqual(after_write.get_result(), {'name': 'new'})
+        self.assertEqual(results[0].get_result(), {'name': 'old'})
+
+    def test_request_core_coalesces_gets(self) -> None:
+        device_service = DeviceService('single-flight.instance', 'user', 'password', 'tenant')
+        device_service.transport = Transport('user', 'password', coalesce_gets=True)
+        release = threading.Event()
+
+        def request(method, url, headers=None, data=None, files=None, stream=False):
+            release.wait()
+            return make_response(200, b'{"id": "1"}')
+
+        results = []
+        with mock.patch.object(device_service.transport, 'request', side_effect=request) as transport_request:
+            threads = [threading.Thread(target=lambda: results.append(device_service.get_device('1')))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(transport_request.call_count, 1)
+        self.assertEqual([r.get_result()['id'] for r in results], ['1'] * 4)
+
+    def test_coalesced_results_are_independent(self) -> None:
+        device_service = DeviceService('single-flight.instance', 'user', 'password', 'tenant')
+        device_service.transport = Transport('user', 'password', coalesce_gets=True)
+        release = threading.Event()
+
+        def request(method, url, headers=None, data=None, files=None, stream=False):
+            release.wait()
+            return make_response(200, b'{"id": "1", "sensors": []}')
+
+        results = []
+        with mock.patch.object(device_service.transport, 'request', side_effect=request) as transport_request:
+            threads = [threading.Thread(target=lambda: results.append(device_service.get_device('1')))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(transport_request.call_count, 1)
+        self.assertIsNot(results[0], results[1])
+        results[0].get_result()['sensors'].append({'id': 'local'})
+        self.assertEqual(results[1].get_result(), {'id': '1', 'sensors': []})
@@ -0,0 +1,110 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import threading
+import unittest
+
+from .fakes import create_pem
+
+from iot_services_sdk import RestClient, MQTTClient
+from iot_services_sdk.ssl_context import SSLContextCache, ResumingSSLContext, create_ssl_context
+
+
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl is not installed')
+class TestSSLContext(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.secret = 'secret'
+        cls.pemfile = create_pem(cls.directory, cls.secret)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_cache_returns_same_context_for_same_pem(self):
+        cache = SSLContextCache()
+        context = cache.get(self.pemfile, self.secret)
+        self.assertIsInstance(context, ResumingSSLContext)
+
+        copy = os.path.join(self.directory, 'copy.pem')
+        shutil.copyfile(self.pemfile, copy)
+        self.assertIs(cache.get(copy, self.secret), context)
+        self.assertIsNot(cache.get(self.pemfile, self.secret, verify=True), context)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = SSLContextCache(max_entries=1)
+        context = cache.get(self.pemfile, self.secret)
+        cache.get(self.pemfile, self.secret, verify=True)
+        self.assertIsNot(cache.get(self.pemfile, self.secret), context)
+
+    def test_wrong_secret_raises(self):
+        with self.assertRaises(ssl.SSLError):
+            SSLContextCache().get(self.pemfile, 'wrong')
+
+    def test_reconnect_resumes_session(self):
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(self.pemfile, password=self.secret)
+        listener = socket.create_server(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+
+        def serve():
+            for _ in range(2):
+                conn, _ = listener.accept()
+                with server_context.wrap_socket(conn, server_side=True) as tls:
+                    tls.sendall(b'x')
+                    tls.recv(1)
+
+        server = threading.Thread(target=serve, daemon=True)
+        server.start()
+
+        context = create_ssl_context(self.pemfile, self.secret)
+        reused = []
+        for _ in range(2):
+            with context.wrap_socket(socket.create_connection(('127.0.0.1', port)),
+                                     server_hostname='localhost') as tls:
+                tls.recv(1)
+                reused.append(tls.session_reused)
+                tls.sendall(b'y')
+        server.join(5)
+        listener.close()
+
+        self.assertEqual(reused, [False, True])
+
+    def test_pem_is_loaded_from_memory(self):
+        with open(self.pemfile, 'rb') as pem_file:
+            pem = pem_file.read()
+        cache = SSLContextCache()
+        context = cache.get(None, self.secret, pem=pem)
+        self.assertIs(cache.get(self.pemfile, self.secret), context)
+        self.assertIs(cache.get(None, self.secret, pem=pem.decode('utf-8')), context)
+
+    def test_clients_accept_pem(self):
+        with open(self.pemfile, 'r') as pem_file:
+            pem = pem_file.read()
+        rest_client = RestClient('localhost', 'device', secret=self.secret, pem=pem)
+        self.assertIsInstance(rest_client.session.get_adapter('https://localhost').ssl_context, ResumingSSLContext)
+        mqtt_client = MQTTClient('localhost', 'device', secret=self.secret, pem=pem)
+        self.assertEqual(mqtt_client.port, 8883)
+        with self.assertRaises(ValueError):
+            RestClient('localhost', 'device', secret=self.secret)
+
+    def test_mqtt_set_certificate(self):
+        import paho.mqtt.client as mqtt
+
+        # MQTTClient relies on these private parts of paho-mqtt, see the version range in setup.py
+        self.assertTrue(hasattr(mqtt.Client, '_sock_send'))
+        mqtt_client = MQTTClient('localhost', 'device', pemfile=self.pemfile, secret=self.secret)
+        previous = mqtt_client._ssl_context
+        mqtt_client.set_certificate(pemfile=self.pemfile, secret=self.secret, tls_version=ssl.PROTOCOL_TLS_CLIENT)
+        self.assertIsNot(mqtt_client._ssl_context, previous)
+        self.assertTrue(mqtt_client._ssl)
+
+        del mqtt_client._ssl_context
+        with self.assertRaises(RuntimeError):
+            mqtt_client.set_certificate(pemfile=self.pemfile, secret=self.secret)
@@ -0,0 +1,176 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import threading
+import types
+import unittest
+from unittest import mock
+
+from iot_services_sdk import DeviceService, RestClient, MQTTClient, Transport, tracing
+from iot_services_sdk.mock_gateway import MockGateway
+from iot_services_sdk.mock_server import MockIoTServer
+
+from .fakes import RecordingTracer
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockIoTServer().start()
+        self.device = self.server.create('devices', {'name': 'device', 'gatewayId': '1'})
+        self.gateway = MockGateway(server=self.server).start()
+        self.tracer = RecordingTracer()
+        tracing.set_tracer(self.tracer)
+
+    def test_request_core_span(self) -> None:
+        service = DeviceService(self.server.instance, 'user', 'password', '1')
+        service.transport = Transport('user', 'password')
+        service.get_device(self.device['id'])
+        span = self.tracer.get_spans('GET /iot/core/api/v1/tenant/{id}/devices/{id}')[0]
+        self.assertTrue(span.ended)
+        self.assertEqual(span.attributes['http.request.method'], 'GET')
+        self.assertEqual(span.attributes['http.response.status_code'], 200)
+
+    def test_gateway_post_span(self) -> None:
+        client = RestClient(self.gateway.rest_instance, self.device['alternateId'])
+        client.post_measures('capability', 'sensor', [{'temp': 20}])
+        span = self.tracer.get_spans('POST /iot/gateway/rest/measures/{id}')[0]
+        self.assertEqual(span.attributes['http.response.status_code'], 202)
+
+    def test_mqtt_spans(self) -> None:
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        client.on_error = lambda client, userdata, report: None
+        received = threading.Event()
+        client.on_command = lambda client, userdata, message: received.set()
+        client.connect()
+        client.subscribe(self.device['alternateId'])
+        client.loop_start()
+        try:
+            with self.tracer.start_as_current_span('parent'):
+                client.publish('capability', 'sensor', [{'temp': 20}])
+            self._wait_for_acks()
+            self.gateway.error_rate = 1.0
+            client.publish('capability', 'sensor', [{'temp': 21}])
+            self._wait_for_acks()
+            self.gateway.push_command(self.device['alternateId'], {'command': {'on': True}})
+            self.assertTrue(received.wait(5))
+        finally:
+            client.disconnect()
+            client.loop_stop()
+
+        publish = self.tracer.get_spans('measures publish')
+        acks = self.tracer.get_spans('measures ack')
+        self.assertEqual(len(publish), 2)
+        self.assertEqual(publish[0].parent.name, 'parent')
+        self.assertIs(acks[0].parent, publish[0])
+        self.assertTrue(all(span.ended for span in acks))
+        self.assertEqual(acks[0].attributes['iot.ack.code'], 202)
+        self.assertEqual(acks[1].attributes['iot.ack.code'], 400)
+        self.assertIn('error.message', acks[1].attributes)
+        self.assertEqual(acks[0].attributes['messaging.message.id'], publish[0].attributes['messaging.message.id'])
+        self.assertEqual(len(client._ack_spans), 0)
+        self.assertEqual(len(self.tracer.get_spans('commands receive')), 1)
+
+    def _wait_for_acks(self) -> None:
+        for _ in range(500):
+            if all(span.ended for span in self.tracer.get_spans('measures ack')):
+                return
+            threading.Event().wait(0.01)
+
+    def test_ack_spans_expire(self) -> None:
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        client.ack_span_timeout = 0.0
+        client.connect()
+        # Without a network loop no ack is read, so the spans can only end by expiring or on disconnect
+        client.publish('capability', 'sensor', [{'temp': 20}])
+        client.publish('capability', 'sensor', [{'temp': 21}])
+        acks = self.tracer.get_spans('measures ack')
+        self.assertTrue(acks[0].ended)
+        self.assertFalse(acks[1].ended)
+        self.assertEqual(len(client._ack_spans), 1)
+        client.disconnect()
+        self.assertTrue(acks[1].ended)
+        self.assertTrue(all('error.message' in span.attributes for span in acks))
+        self.assertEqual(len(client._ack_spans), 0)
+
+    def test_ack_spans_expire_in_network_loop(self) -> None:
+        self.gateway.ack_delay = 10.0
+        client = MQTTClient(self.gateway.mqtt_instance, self.device['alternateId'])
+        client.ack_span_timeout = 0.1
+        client.connect()
+        client.loop_start()
+        try:
+            client.publish('capability', 'sensor', [{'temp': 20}])
+            # No further publish, so only the network loop can end the span
+            ack = self.tracer.get_spans('measures ack')[0]
+            for _ in range(300):
+                if ack.ended:
+                    break
+                threading.Event().wait(0.01)
+            self.assertTrue(ack.ended)
+            self.assertIn('error.message', ack.attributes)
+        finally:
+            client.disconnect()
+            client.loop_stop()
+
+    def test_default_tracer(self) -> None:
+        tracing.set_tracer(None)
+
+        class ProxyTracerProvider(object):
+            pass
+
+        class NoOpTracerProvider(object):
+            pass
+
+        class Sampler(object):
+            def __init__(self, description):
+                self.description = description
+
+            def get_description(self):
+                return self.description
+
+        class TracerProvider(object):
+            def __init__(self, sampler):
+                self.sampler = Sampler(sampler)
+                self.get_tracer = mock.Mock(return_value=self.tracer)
+
+            tracer = object()
+
+        providers = [ProxyTracerProvider()]
+        fake_trace = types.SimpleNamespace(ProxyTracerProvider=ProxyTracerProvider,
+                                           NoOpTracerProvider=NoOpTracerProvider,
+                                           get_tracer_provider=lambda: providers[0])
+        with mock.patch.object(tracing, 'trace', fake_trace), mock.patch.object(tracing, '_imported', True), \
+                mock.patch.object(tracing, '_default', (None, None)):
+            self.assertIsNone(tracing.get_tracer())
+            providers[0] = NoOpTracerProvider()
+            self.assertIsNone(tracing.get_tracer())
+            providers[0] = TracerProvider('AlwaysOffSampler')
+            self.assertIsNone(tracing.get_tracer())
+
+            providers[0] = TracerProvider('ParentBased{root:AlwaysOffSampler,remoteParentSampled:AlwaysOnSampler}')
+            self.assertIs(tracing.get_tracer(), TracerProvider.tracer)
+
+            provider = providers[0] = TracerProvider('ParentBased{root:AlwaysOnSampler}')
+            self.assertIs(tracing.get_tracer(), TracerProvider.tracer)
+            self.assertIs(tracing.get_tracer(), TracerProvider.tracer)
+            self.assertEqual(provider.get_tracer.call_count, 1)
+
+    def test_off(self) -> None:
+        tracing.set_tracer(None)
+        if tracing.get_tracer() is not None:
+            self.skipTest('OpenTelemetry is installed')
+
+        def func():
+            pass
+
+        self.assertIs(tracing.wrap(func), func)
+        headers = {'Content-Type': 'application/json'}
+        self.assertIs(tracing.inject(headers), headers)
+        with tracing.start_span('span') as span:
+            span.set_attribute('key', 'value')
+        self.assertIs(span, tracing.NO_OP_SPAN)
+
+    def tearDown(self) -> None:
+        tracing.set_tracer(None)
+        self.gateway.stop()
+        self.server.stop()
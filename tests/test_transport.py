@@ -0,0 +1,100 @@
+""" Author: Philipp Steinrötter (steinroe) """
+
+import unittest
+from unittest import mock
+
+import requests
+
+from iot_services_sdk import Transport, RetryPolicy, RetryBudget
+
+from .fakes import make_response
+
+
+class TransportTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.policy = RetryPolicy(total=3, backoff_factor=0)
+        self.transport = Transport('user', 'password', retry_policy=self.policy)
+        self.transport.governor = None
+
+    def test_retries_transient_errors(self) -> None:
+        responses = [make_response(503), make_response(502), make_response(200)]
+        with mock.patch.object(self.transport.session, 'request', side_effect=responses) as request:
+            response = self.transport.request('GET', 'https://instance/devices')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+
+    def test_gives_up_after_total_retries(self) -> None:
+        responses = [make_response(503) for _ in range(5)]
+        with mock.patch.object(self.transport.session, 'request', side_effect=responses) as request:
+            response = self.transport.request('GET', 'https://instance/devices')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(request.call_count, 4)
+
+    def test_post_only_retried_on_429(self) -> None:
+        with mock.patch.object(self.transport.session, 'request', side_effect=[make_response(503)]) as request:
+            self.assertEqual(self.transport.request('POST', 'https://instance/devices').status_code, 503)
+        self.assertEqual(request.call_count, 1)
+
+        responses = [make_response(429), make_response(201)]
+        with mock.patch.object(self.transport.session, 'request', side_effect=responses) as request:
+            self.assertEqual(self.transport.request('POST', 'https://instance/devices').status_code, 201)
+        self.assertEqual(request.call_count, 2)
+
+    def test_retries_connection_errors(self) -> None:
+        side_effect = [requests.exceptions.ConnectionError(), make_response(200)]
+        with mock.patch.object(self.transport.session, 'request', side_effect=side_effect) as request:
+            self.assertEqual(self.transport.request('GET', 'https://instance/devices').status_code, 200)
+        self.assertEqual(request.call_count, 2)
+
+    def test_retry_after(self) -> None:
+        policy = RetryPolicy(max_backoff=10)
+        self.assertEqual(policy.get_backoff(0, {'Retry-After': '4'}), 4)
+        self.assertEqual(policy.get_backoff(0, {'Retry-After': '120'}), 10)
+        self.assertLessEqual(policy.get_backoff(2, {}), 2.0)
+
+    def test_retry_budget(self) -> None:
+        budget = RetryBudget(ratio=0.5, min_per_second=0)
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+    def test_session_auth(self) -> None:
+        self.transport.auth_mode = 'session'
+        calls = []
+
+        def request(method, url, headers=None, auth=None, data=None, files=None, stream=False):
+            calls.append(auth)
+            if auth is None and len(calls) > 2:
+                # The session expired
+                return make_response(401)
+            response = make_response(200)
+            if auth is not None:
+                set_cookie(response, 'JSESSIONID', str(len(calls)))
+            return response
+
+        def set_cookie(response, name, value):
+            response.cookies.set(name, value, domain='instance')
+            self.transport.session.cookies.set(name, value, domain='instance')
+
+        # A load balancer affinity cookie is no session
+        set_cookie(make_response(200), '__VCAP_ID__', 'affinity')
+        with mock.patch.object(self.transport.session, 'request', side_effect=request):
+            for _ in range(3):
+                self.assertEqual(self.transport.request('GET', 'https://instance/devices').status_code, 200)
+        self.assertEqual(calls, [('user', 'password'), None, None, ('user', 'password')])
+        self.assertEqual(self.transport.session.cookies.get('__VCAP_ID__'), 'affinity')
+        self.assertEqual(self.transport.session.cookies.get('JSESSIONID'), '4')
+        self.assertRaises(ValueError, setattr, self.transport, 'auth_mode', 'token')
+
+    def test_session_auth_without_session_cookie(self) -> None:
+        self.transport.auth_mode = 'session'
+        response = make_response(200)
+        response.cookies.set('__VCAP_ID__', 'affinity', domain='instance')
+        with mock.patch.object(self.transport.session, 'request', return_value=response) as request:
+            self.transport.session.cookies.set('__VCAP_ID__', 'affinity', domain='instance')
+            self.transport.request('GET', 'https://instance/devices')
+            self.transport.request('GET', 'https://instance/devices')
+        self.assertEqual([call[1]['auth'] for call in request.call_args_list], [('user', 'password')] * 2)